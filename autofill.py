@@ -0,0 +1,81 @@
+"""
+Time-proximity auto-fill of positions for PhotoGeoTagger.
+
+Photos shot a few seconds apart are almost always at the same spot: the
+pictures of the catalog are sorted by DateTimeOriginal once and, in one
+forward and one backward pass, each untagged picture gets the previous and
+next tagged pictures. The position is interpolated between them if both
+are within the time window, else copied from the one within the window.
+
+autofill only returns the preview of the changes (nothing is modified):
+the caller applies it with its own undo (GUI) or writes it (command line).
+
+This module does not depend on Qt.
+"""
+
+# maximum time (seconds) between an untagged picture and the tagged picture its position comes from
+DEFAULT_WINDOW = 120
+
+
+def _interpolate(a, b, f):
+    """
+    return the position at fraction f between the positions a and b (shortest way across the antimeridian)
+    """
+    dlon = (b[1] - a[1] + 180) % 360 - 180
+    lon = (a[1] + f * dlon + 180) % 360 - 180
+    return a[0] + f * (b[0] - a[0]), lon, a[2] + f * (b[2] - a[2])
+
+
+def autofill(catalog, window=DEFAULT_WINDOW, interpolate=True, indices=None):
+    """
+    return the preview of the positions of the untagged pictures, a list of (index, (lat, lon, alt), sources)
+    sorted by time; sources are the indices of the tagged pictures the position comes from
+    (one if copied, two if interpolated)
+    window: maximum time (seconds) to a tagged picture
+    indices: pictures to fill (default all the untagged pictures)
+    """
+    photos = sorted((catalog.times[i], i) for i in catalog.indices() if catalog.has_time(i))
+    tagged = [catalog.is_tagged(i) for _, i in photos]
+    wanted = set(indices) if indices is not None else None
+
+    # previous and next tagged pictures (position in photos) of each picture
+    previous, last = [None] * len(photos), None
+    for k in range(len(photos)):
+        if tagged[k]:
+            last = k
+        previous[k] = last
+    following, last = [None] * len(photos), None
+    for k in range(len(photos) - 1, -1, -1):
+        if tagged[k]:
+            last = k
+        following[k] = last
+
+    preview = []
+    for k, (t, i) in enumerate(photos):
+        if tagged[k] or (wanted is not None and i not in wanted):
+            continue
+        before, after = previous[k], following[k]
+        if before is not None and t - photos[before][0] > window:
+            before = None
+        if after is not None and photos[after][0] - t > window:
+            after = None
+
+        if before is not None and after is not None:
+            t0, j0 = photos[before]
+            t1, j1 = photos[after]
+            if interpolate:
+                f = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+                preview.append((i, _interpolate(catalog.position(j0), catalog.position(j1), f), (j0, j1)))
+                continue
+            # copy from the nearest in time
+            after = None if t - t0 <= t1 - t else after
+            before = None if after is not None else before
+
+        if before is not None:
+            j = photos[before][1]
+            preview.append((i, catalog.position(j), (j,)))
+        elif after is not None:
+            j = photos[after][1]
+            preview.append((i, catalog.position(j), (j,)))
+
+    return preview
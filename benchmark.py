@@ -0,0 +1,425 @@
+#!/usr/bin/env python3.6
+
+"""
+Benchmark suite of PhotoGeoTagger.
+
+A synthetic corpus of JPEG pictures is generated (count, resolution, part of
+the pictures with GPS tags, with or without embedded EXIF preview) and the
+stages are timed headless (QT_QPA_PLATFORM=offscreen):
+
+* scan: EXIF metadata of each picture (exifgps.scan_file)
+* thumbnail: thumbnail of each picture (ThumbnailPipeline)
+* load: whole scan engine as used by the loading thread (cold, then with a warm cache)
+* convert: decimal <-> degrees, minutes, seconds conversions (coordinates), per batch of 1000
+* spatial: 5 nearest photos of a point in a GridIndex of positions around a city (spatialindex),
+  with the time to build the index and to query bounding boxes of about 4 x 5 km
+* write: position written in a copy of each picture (writer.write_position), then moved by the
+  BatchWriter (patched in place, with the bytes read and written); the corpus is not modified
+* startup: cold start of the program (empty caches) until the first thumbnail is shown
+  and the map is ready, compared to STARTUP_TARGET (not in the default stages)
+
+The report (JSON) gives for each stage the number of items per second, the
+latency percentiles of one item (or batch) and the peak RSS of the process
+after the stage. --compare OLD.json prints the change of throughput from a
+previous report.
+
+python3 benchmark.py --count 200 --size 4000x3000 -o report.json
+"""
+
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import concurrent.futures
+
+from PyQt5.QtCore import Qt, QT_VERSION_STR
+from PyQt5.QtGui import QGuiApplication, QImage, QPainter, QColor, QLinearGradient
+
+try:
+    import pyexiv2
+except:
+    print("pyexiv2 is not installed. ")
+    sys.exit(1)
+
+from exifgps import scan_file, set_gps
+from scanner import ScanEngine, DEFAULT_WORKERS, find_pictures
+from thumbnails import ThumbnailPipeline
+from thumbcache import MetadataCache
+from writer import BatchWriter, write_position, REWRITTEN
+from exifpatch import PATCHED, UNCHANGED
+import coordinates
+from spatialindex import GridIndex
+
+PREVIEW_SIZE = (160, 120)
+
+# number of different pictures encoded, the corpus is made of copies of them with different metadata
+BASE_PICTURES = 8
+
+CONVERT_BATCH = 1000
+
+# number of nearest photos and bounding box queries of the spatial stage
+SPATIAL_QUERIES = 1000
+
+# maximum time (seconds) from the start of the program to the first thumbnail
+STARTUP_TARGET = 2.0
+STARTUP_TIMEOUT = 120
+
+
+def peak_rss_mb():
+    """
+    return the peak resident set size of the process in MB
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(values):
+    """
+    return the p50, p90, p99 and max of values (nearest rank), in ms
+    """
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))] * 1000
+
+    return {"p50": rank(50), "p90": rank(90), "p99": rank(99), "max": values[-1] * 1000}
+
+
+def stage_result(count, seconds, latencies):
+    return {"items": count,
+            "seconds": seconds,
+            "items_per_s": count / seconds if seconds else None,
+            "latency_ms": percentiles(latencies),
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def base_picture(width, height, rng):
+    """
+    return a QImage with gradients and shapes (compresses like a photo more than a flat image)
+    """
+    image = QImage(width, height, QImage.Format_RGB32)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    gradient.setColorAt(1, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter.fillRect(0, 0, width, height, gradient)
+    painter.setPen(Qt.NoPen)
+    for _ in range(200):
+        painter.setBrush(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.randrange(64, 256)))
+        w, h = rng.randrange(width // 50 + 1, width // 4 + 2), rng.randrange(height // 50 + 1, height // 4 + 2)
+        painter.drawEllipse(rng.randrange(width), rng.randrange(height), w, h)
+    painter.end()
+    return image
+
+
+def generate_corpus(directory, count, width, height, gps=0.5, previews=True, seed=0):
+    """
+    write count JPEG pictures in directory
+    gps: part of the pictures with a GPS position
+    previews: embed an EXIF preview
+    return the list of paths
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    bases = []
+    for n in range(min(BASE_PICTURES, count)):
+        image = base_picture(width, height, rng)
+        path = os.path.join(directory, "base{}.tmp".format(n))
+        image.save(path, "JPG", 90)
+        preview = image.scaled(PREVIEW_SIZE[0], PREVIEW_SIZE[1], Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        previewPath = path + ".preview"
+        preview.save(previewPath, "JPG", 80)
+        with open(previewPath, "rb") as f:
+            bases.append((path, f.read()))
+        os.remove(previewPath)
+
+    paths = []
+    t0 = 1537862400
+    for n in range(count):
+        base, preview = bases[n % len(bases)]
+        path = os.path.join(directory, "IMG_{:06d}.jpg".format(n))
+        shutil.copyfile(base, path)
+        metadata = pyexiv2.ImageMetadata(path)
+        metadata.read()
+        metadata["Exif.Photo.DateTimeOriginal"] = time.strftime("%Y:%m:%d %H:%M:%S", time.gmtime(t0 + n * 7))
+        if rng.random() < gps:
+            set_gps(metadata, (rng.uniform(44.9, 45.2), rng.uniform(7.5, 7.8), rng.uniform(0, 500)))
+        if previews:
+            metadata.exif_thumbnail.data = preview
+        metadata.write()
+        paths.append(path)
+
+    for base, _ in bases:
+        os.remove(base)
+    return paths
+
+
+def timed_pool(function, items, workers):
+    """
+    call function on each item on a pool of threads
+    return (wall time, list of the durations of each call)
+    """
+    def call(item):
+        t0 = time.perf_counter()
+        function(item)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(call, items))
+    return time.perf_counter() - t0, latencies
+
+
+def bench_scan(paths, workers):
+    seconds, latencies = timed_pool(scan_file, paths, workers)
+    return stage_result(len(paths), seconds, latencies)
+
+
+def bench_thumbnail(paths, workers):
+    pipeline = ThumbnailPipeline(128)
+    seconds, latencies = timed_pool(pipeline, paths, workers)
+    result = stage_result(len(paths), seconds, latencies)
+    result["strategies"] = dict(pipeline.stats.count)
+    return result
+
+
+def bench_load(directory, workers, cache=None):
+    """
+    time the scan engine; the latency is the time between two pictures received
+    """
+    engine = ScanEngine(workers, cache=cache)
+    latencies = []
+    t0 = last = time.perf_counter()
+    count = 0
+    for _ in engine.scan(find_pictures([directory])):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        count += 1
+    return stage_result(count, time.perf_counter() - t0, latencies)
+
+
+def bench_convert(n, seed=0):
+    rng = random.Random(seed)
+    decimals = [rng.uniform(-180, 180) for _ in range(n)]
+    refs = ["W" if d < 0 else "E" for d in decimals]
+    latencies = []
+    t0 = time.perf_counter()
+    for start in range(0, n, CONVERT_BATCH):
+        t1 = time.perf_counter()
+        batch = coordinates.batch_decimal_to_dms(decimals[start:start + CONVERT_BATCH])
+        raws = [" ".join("{}/{}".format(f.numerator, f.denominator) for f in coordinates.dms_fractions(dms))
+                for dms in batch]
+        coordinates.batch_dms_to_decimal(refs[start:start + CONVERT_BATCH], raws)
+        latencies.append(time.perf_counter() - t1)
+    result = stage_result(n, time.perf_counter() - t0, latencies)
+    result["numpy"] = coordinates.numpy is not None
+    return result
+
+
+def bench_spatial(n, seed=0):
+    rng = random.Random(seed)
+    positions = [(rng.gauss(45.07, 0.05), rng.gauss(7.68, 0.05)) for _ in range(n)]
+    index = GridIndex()
+    t0 = time.perf_counter()
+    for i, (lat, lon) in enumerate(positions):
+        index.insert(i, lat, lon)
+    build = time.perf_counter() - t0
+
+    queries = [(rng.gauss(45.07, 0.1), rng.gauss(7.68, 0.1)) for _ in range(SPATIAL_QUERIES)]
+    latencies = []
+    t0 = time.perf_counter()
+    for lat, lon in queries:
+        t1 = time.perf_counter()
+        index.nearest(lat, lon, k=5)
+        latencies.append(time.perf_counter() - t1)
+    result = stage_result(len(queries), time.perf_counter() - t0, latencies)
+    result["positions"] = n
+    result["build_s"] = build
+
+    latencies = []
+    for lat, lon in queries[:100]:
+        t1 = time.perf_counter()
+        index.in_bbox(lat - 0.02, lon - 0.03, lat + 0.02, lon + 0.03)
+        latencies.append(time.perf_counter() - t1)
+    result["bbox_latency_ms"] = percentiles(latencies)
+    return result
+
+
+def bench_write(paths, workers, seed=0):
+    """
+    the positions are written in copies of the pictures (not timed) so that the corpus is not modified
+    """
+    tmp = tempfile.mkdtemp(prefix="photogeotagger-bench-write-")
+    try:
+        copies = [shutil.copy2(path, os.path.join(tmp, "{}-{}".format(k, os.path.basename(path))))
+                  for k, path in enumerate(paths)]
+        return _bench_write(copies, workers, seed)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _bench_write(paths, workers, seed):
+    rng = random.Random(seed)
+    jobs = [(path, (rng.uniform(44.9, 45.2), rng.uniform(7.5, 7.8), rng.uniform(0, 500))) for path in paths]
+    seconds, latencies = timed_pool(lambda job: write_position(*job), jobs, workers)
+    result = stage_result(len(jobs), seconds, latencies)
+
+    # the pictures now have GPS tags: the positions are patched in place
+    writer = BatchWriter(workers)
+    t0 = time.perf_counter()
+    report = writer.write([(path, (gps[0] + 0.001, gps[1], gps[2])) for path, gps in jobs])
+    seconds = time.perf_counter() - t0
+    result["batch_items_per_s"] = len(report) / seconds if seconds else None
+    result["errors"] = sum(1 for _, error in report if error)
+    for mode in (PATCHED, UNCHANGED, REWRITTEN):
+        result["batch_" + mode] = sum(1 for r in writer.io.values() if r[0] == mode)
+    result["batch_bytes_read"] = sum(r[1] for r in writer.io.values())
+    result["batch_bytes_written"] = sum(r[2] for r in writer.io.values())
+    return result
+
+
+def bench_startup(directory):
+    """
+    start photogeotagger.py on directory with empty caches and return the times of the startup steps
+    """
+    tmp = tempfile.mkdtemp(prefix="photogeotagger-bench-startup-")
+    try:
+        metricsPath = os.path.join(tmp, "metrics.json")
+        env = dict(os.environ, PHOTOGEOTAGGER_METRICS=metricsPath,
+                   XDG_CACHE_HOME=os.path.join(tmp, "cache"), XDG_STATE_HOME=os.path.join(tmp, "state"))
+        program = os.path.join(os.path.dirname(os.path.abspath(__file__)), "photogeotagger.py")
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, program, "--exit-after-startup", directory], env=env,
+                       stdout=subprocess.DEVNULL, timeout=STARTUP_TIMEOUT, check=True)
+        seconds = time.perf_counter() - t0
+        with open(metricsPath) as f:
+            timers = json.load(f)["timers"]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {name[len("startup."):] + "_s": timer["total_ms"] / 1000
+              for name, timer in timers.items() if name.startswith("startup.")}
+    result["process_s"] = seconds
+    result["target_s"] = STARTUP_TARGET
+    result["ok"] = result.get("first_thumbnail_s", seconds) <= STARTUP_TARGET
+    return result
+
+
+def compare(report, old):
+    """
+    print the change of throughput of each stage from an old report
+    """
+    for name, stage in report["stages"].items():
+        if name == "startup":
+            before = old.get("stages", {}).get(name, {}).get("first_thumbnail_s")
+            if before and stage.get("first_thumbnail_s"):
+                print("{:12s} {:10.2f} -> {:10.2f} s to first thumbnail".format(name, before, stage["first_thumbnail_s"]),
+                      file=sys.stderr)
+            continue
+        before = old.get("stages", {}).get(name, {}).get("items_per_s")
+        after = stage.get("items_per_s")
+        if before and after:
+            print("{:12s} {:10.1f} -> {:10.1f} items/s  {:+6.1f}%".format(name, before, after, (after / before - 1) * 100),
+                  file=sys.stderr)
+
+
+def parser():
+    p = argparse.ArgumentParser(description="PhotoGeoTagger benchmark")
+    p.add_argument("--count", type=int, default=200, help="number of pictures of the corpus")
+    p.add_argument("--size", default="4000x3000", help="resolution of the pictures (WIDTHxHEIGHT)")
+    p.add_argument("--gps", type=float, default=0.5, help="part of the pictures with a GPS position")
+    p.add_argument("--no-previews", action="store_true", help="pictures without embedded EXIF preview")
+    p.add_argument("--corpus", help="directory of the corpus (kept), default a temporary directory")
+    p.add_argument("--stages", default="scan,thumbnail,load,convert,spatial,write",
+                   help="stages to run (scan, thumbnail, load, convert, spatial, write, startup)")
+    p.add_argument("--convert-count", type=int, default=100000, help="number of coordinates converted")
+    p.add_argument("--spatial-count", type=int, default=100000, help="number of positions of the spatial index")
+    p.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS)
+    p.add_argument("-o", "--output", default="-", help="JSON report (- for stdout)")
+    p.add_argument("--compare", help="previous JSON report")
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    width, _, height = args.size.lower().partition("x")
+    width, height = int(width), int(height)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+
+    # QPainter and the image plugins need an application (offscreen platform)
+    app = QGuiApplication(sys.argv[:1])
+
+    directory = args.corpus or tempfile.mkdtemp(prefix="photogeotagger-bench-")
+    try:
+        t0 = time.perf_counter()
+        paths = generate_corpus(directory, args.count, width, height, args.gps, not args.no_previews)
+        print("corpus of {} pictures generated in {:.1f} s".format(len(paths), time.perf_counter() - t0), file=sys.stderr)
+
+        report = {"python": platform.python_version(), "qt": QT_VERSION_STR, "platform": platform.platform(),
+                  "workers": args.workers,
+                  "corpus": {"count": len(paths), "width": width, "height": height, "gps": args.gps,
+                             "previews": not args.no_previews,
+                             "bytes": sum(os.path.getsize(path) for path in paths)},
+                  "stages": {}}
+
+        for stage in stages:
+            print("stage {}".format(stage), file=sys.stderr)
+            if stage == "scan":
+                report["stages"]["scan"] = bench_scan(paths, args.workers)
+            elif stage == "thumbnail":
+                report["stages"]["thumbnail"] = bench_thumbnail(paths, args.workers)
+            elif stage == "load":
+                cacheDir = tempfile.mkdtemp(prefix="photogeotagger-bench-cache-")
+                cache = MetadataCache(os.path.join(cacheDir, "cache.sqlite"))
+                try:
+                    report["stages"]["load"] = bench_load(directory, args.workers)
+                    bench_load(directory, args.workers, cache)
+                    report["stages"]["load_cached"] = bench_load(directory, args.workers, cache)
+                finally:
+                    cache.close()
+                    shutil.rmtree(cacheDir, ignore_errors=True)
+            elif stage == "convert":
+                report["stages"]["convert"] = bench_convert(args.convert_count)
+            elif stage == "spatial":
+                report["stages"]["spatial"] = bench_spatial(args.spatial_count)
+            elif stage == "write":
+                report["stages"]["write"] = bench_write(paths, args.workers)
+            elif stage == "startup":
+                report["stages"]["startup"] = bench_startup(directory)
+            else:
+                print("unknown stage {}".format(stage), file=sys.stderr)
+                return 2
+    finally:
+        if not args.corpus:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Photo catalog of PhotoGeoTagger.
+
+The pictures are stored in columns (array-backed latitude, longitude,
+altitude and time) indexed by an integer; the index of a picture is found
+from its path with a dictionary. The pictures with a position not yet
+saved are tracked in a set (O(1) to mark, unmark and test).
+
+The positions are also kept in a GridIndex (spatialindex) updated with
+every change of position, for the bounding box and nearest photo queries.
+
+A removed picture keeps its index (the indices are used by the list model
+and the map markers) but has no position and is not found by path anymore.
+
+This module does not depend on Qt.
+"""
+
+import os
+import array
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tracklog import parse_exif_time
+from spatialindex import GridIndex
+
+NO_POSITION = (0, 0, 0)
+
+
+class Catalog:
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.paths = []
+        self.datetimes = []
+        self.lats = array.array("d")
+        self.lons = array.array("d")
+        self.alts = array.array("d")
+        # timestamps of DateTimeOriginal read as UTC, NaN if unknown
+        self.times = array.array("d")
+        # gazetteer.Place of the position written in the picture, None if not known
+        self.places = []
+        self._index = {}
+        self._dirty = set()
+        self._removed = set()
+        self.spatial = GridIndex()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def index(self, path):
+        """
+        return the index of path (KeyError if path is not in catalog)
+        """
+        return self._index[path]
+
+    def get(self, path):
+        """
+        return the index of path or None
+        """
+        return self._index.get(path)
+
+    def add(self, path, gps=NO_POSITION, datetime=None):
+        """
+        add a picture, a picture already in catalog is updated if its position is not modified
+        return (index, True if the picture is new)
+        """
+        i = self._index.get(path)
+        if i is not None:
+            if i not in self._dirty and tuple(gps) != self.position(i):
+                self.lats[i], self.lons[i], self.alts[i] = gps
+                self._index_position(i)
+                # the place was found for the old position
+                self.places[i] = None
+            self.datetimes[i] = datetime
+            self.times[i] = self._time(datetime)
+            return i, False
+
+        i = len(self.paths)
+        self._index[path] = i
+        self.paths.append(path)
+        self.datetimes.append(datetime)
+        self.lats.append(gps[0])
+        self.lons.append(gps[1])
+        self.alts.append(gps[2])
+        self.times.append(self._time(datetime))
+        self.places.append(None)
+        self._index_position(i)
+        return i, True
+
+    def remove(self, path):
+        """
+        remove a picture from catalog
+        return its index or None if path is not in catalog
+        """
+        i = self._index.pop(path, None)
+        if i is None:
+            return None
+        self.lats[i] = self.lons[i] = self.alts[i] = 0.0
+        self.datetimes[i] = None
+        self.times[i] = float("nan")
+        self.places[i] = None
+        self._dirty.discard(i)
+        self._removed.add(i)
+        self.spatial.remove(i)
+        return i
+
+    def indices(self):
+        """
+        return the indices of the pictures in catalog
+        """
+        if not self._removed:
+            return list(range(len(self.paths)))
+        return sorted(self._index.values())
+
+    def _index_position(self, i):
+        if self.lats[i] or self.lons[i]:
+            self.spatial.insert(i, self.lats[i], self.lons[i])
+        else:
+            self.spatial.remove(i)
+
+    @staticmethod
+    def _time(datetime):
+        t = parse_exif_time(datetime)
+        return float("nan") if t is None else float(t)
+
+    def label(self, i):
+        """
+        return the file name of picture without extension
+        """
+        return os.path.splitext(os.path.basename(self.paths[i]))[0]
+
+    def position(self, i):
+        return self.lats[i], self.lons[i], self.alts[i]
+
+    def is_tagged(self, i):
+        return bool(self.lats[i] or self.lons[i])
+
+    def has_time(self, i):
+        return not math.isnan(self.times[i])
+
+    def coord(self, i):
+        """
+        return the coord dictionary of picture (as emitted by the scanner)
+        """
+        return {'gps': self.position(i), 'filename': self.paths[i], 'datetime': self.datetimes[i]}
+
+    def set_position(self, i, gps, dirty=True):
+        """
+        set the position of picture i, marked as not saved if dirty
+        """
+        self.lats[i], self.lons[i], self.alts[i] = gps
+        self._index_position(i)
+        if dirty:
+            self._dirty.add(i)
+            self.places[i] = None
+
+    def set_place(self, i, place):
+        self.places[i] = place
+
+    def mark_clean(self, i):
+        self._dirty.discard(i)
+
+    def is_dirty(self, i):
+        return i in self._dirty
+
+    def has_changes(self):
+        return bool(self._dirty)
+
+    def dirty_indices(self):
+        return sorted(self._dirty)
+
+    def tagged(self):
+        """
+        return the indices of the pictures with position
+        """
+        if numpy is not None and self.paths:
+            lats, lons = numpy.frombuffer(self.lats), numpy.frombuffer(self.lons)
+            return numpy.flatnonzero((lats != 0) | (lons != 0)).tolist()
+        return [i for i in range(len(self.paths)) if self.lats[i] or self.lons[i]]
+
+    def untagged(self):
+        """
+        return the indices of the pictures without position
+        """
+        if numpy is not None and self.paths:
+            lats, lons = numpy.frombuffer(self.lats), numpy.frombuffer(self.lons)
+            untagged = numpy.flatnonzero((lats == 0) & (lons == 0)).tolist()
+        else:
+            untagged = [i for i in range(len(self.paths)) if not (self.lats[i] or self.lons[i])]
+        if self._removed:
+            untagged = [i for i in untagged if i not in self._removed]
+        return untagged
+
+    def in_bbox(self, south, west, north, east):
+        """
+        return the indices of the pictures with position in the bounding box
+        the box can cross the antimeridian (west > east)
+        """
+        return sorted(self.spatial.in_bbox(south, west, north, east))
+
+    def nearest(self, lat, lon, k=1, max_distance=None):
+        """
+        return the k pictures nearest to (lat, lon) as a list of (distance in meters, index)
+        pictures farther than max_distance (meters) are not returned
+        """
+        return self.spatial.nearest(lat, lon, k, max_distance)
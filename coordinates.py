@@ -0,0 +1,132 @@
+"""
+Coordinate conversions for PhotoGeoTagger.
+
+EXIF rationals ("4500/100 3/1 1234/100") are parsed without eval and the
+decimal <-> degrees, minutes, seconds conversions work on whole batches,
+with NumPy arrays when NumPy is installed.
+
+Seconds are written with a fixed denominator (SECONDS_DENOMINATOR) so that
+no fraction needs to be reduced with limit_denominator: the precision is
+1/10000 of second of arc (about 3 mm).
+
+This module does not depend on Qt.
+"""
+
+import fractions
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SECONDS_DENOMINATOR = 10000
+ALTITUDE_DENOMINATOR = 100
+
+
+def parse_rational(text):
+    """
+    return the float value of an EXIF rational ("123/10") or number ("12.3")
+    a zero denominator gives 0
+    """
+    num, sep, den = text.partition("/")
+    if not sep:
+        return float(num)
+    den = int(den)
+    return int(num) / den if den else 0.0
+
+
+def parse_rationals(raw):
+    """
+    return the list of float values of a raw EXIF rational list ("45/1 3/1 1234/100")
+    """
+    return [parse_rational(value) for value in raw.split()]
+
+
+def dms_to_decimal(ref, raw):
+    """
+    return the decimal degrees of a raw EXIF degrees, minutes, seconds value and its reference (N, S, E, W)
+    """
+    values = parse_rationals(raw)
+    if len(values) != 3:
+        raise ValueError("invalid coordinate: {}".format(raw))
+    decimal = values[0] + values[1] / 60 + values[2] / 3600
+    return -decimal if ref in ("S", "W") else decimal
+
+
+def _split(decimal):
+    """
+    return the integer degrees, minutes and numerator of seconds (over SECONDS_DENOMINATOR) of abs(decimal)
+    """
+    total = int(round(abs(decimal) * 3600 * SECONDS_DENOMINATOR))
+    degrees, rest = divmod(total, 3600 * SECONDS_DENOMINATOR)
+    minutes, seconds = divmod(rest, 60 * SECONDS_DENOMINATOR)
+    return degrees, minutes, seconds
+
+
+def decimal_to_dms(decimal):
+    """
+    Convert decimal degrees into degrees, minutes, seconds (list of Fraction).
+    """
+    degrees, minutes, seconds = _split(decimal)
+    return [fractions.Fraction(degrees), fractions.Fraction(minutes), fractions.Fraction(seconds, SECONDS_DENOMINATOR)]
+
+
+def batch_decimal_to_dms(decimals):
+    """
+    return the (degrees, minutes, seconds numerator) integer triples of a sequence of decimal degrees
+    the seconds denominator is SECONDS_DENOMINATOR
+    """
+    if numpy is None:
+        return [_split(decimal) for decimal in decimals]
+
+    total = numpy.rint(numpy.abs(numpy.asarray(decimals, dtype=numpy.float64)) * (3600 * SECONDS_DENOMINATOR)).astype(numpy.int64)
+    degrees, rest = numpy.divmod(total, 3600 * SECONDS_DENOMINATOR)
+    minutes, seconds = numpy.divmod(rest, 60 * SECONDS_DENOMINATOR)
+    return numpy.stack((degrees, minutes, seconds), axis=1).tolist()
+
+
+def dms_fractions(dms):
+    """
+    return the list of Fraction of a (degrees, minutes, seconds numerator) triple
+    """
+    degrees, minutes, seconds = dms
+    return [fractions.Fraction(degrees), fractions.Fraction(minutes), fractions.Fraction(seconds, SECONDS_DENOMINATOR)]
+
+
+def batch_dms_to_decimal(refs, raws):
+    """
+    return the decimal degrees of sequences of references and raw EXIF degrees, minutes, seconds
+    """
+    if numpy is None:
+        return [dms_to_decimal(ref, raw) for ref, raw in zip(refs, raws)]
+
+    rows = []
+    for raw in raws:
+        values = []
+        for value in raw.split():
+            num, sep, den = value.partition("/")
+            values.append((float(num), float(den) if sep else 1.0))
+        if len(values) != 3:
+            raise ValueError("invalid coordinate: {}".format(raw))
+        rows.append(values)
+    signs = [-1.0 if ref in ("S", "W") else 1.0 for ref in refs]
+
+    a = numpy.asarray(rows, dtype=numpy.float64).reshape(len(rows), 3, 2)
+    dens = a[:, :, 1]
+    values = numpy.divide(a[:, :, 0], dens, out=numpy.zeros_like(dens), where=dens != 0)
+    return (numpy.asarray(signs) * (values @ numpy.array([1.0, 1 / 60, 1 / 3600]))).tolist()
+
+
+def altitude(ref, raw):
+    """
+    return the altitude in meters of raw EXIF GPSAltitude and GPSAltitudeRef values (1: below sea level)
+    """
+    value = parse_rational(raw.split()[0])
+    return -value if ref and ref.strip() == "1" else value
+
+
+def altitude_rational(meters):
+    """
+    return the (Fraction, ref) of an altitude for GPSAltitude and GPSAltitudeRef
+    """
+    return fractions.Fraction(int(round(abs(meters) * ALTITUDE_DENOMINATOR)), ALTITUDE_DENOMINATOR), "1" if meters < 0 else "0"
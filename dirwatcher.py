@@ -0,0 +1,114 @@
+"""
+Incremental directory watching for PhotoGeoTagger.
+
+The directories read by the scanner are recorded with the modification time
+and size of their pictures and watched with a QFileSystemWatcher. When a
+directory changes, only this directory is read again (os.scandir) and the
+added, removed and modified pictures are emitted in one signal. The changes
+are collected for DELAY ms so that a copy of many files gives one update.
+"""
+
+import os
+
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, pyqtSignal
+
+from scanner import EXTENSIONS, scan_directory, walk_pictures
+
+# delay (ms) before reading the changed directories
+DELAY = 300
+
+
+class DirectoryWatcher(QObject):
+
+    # added, removed, modified pictures
+    changed = pyqtSignal(list, list, list)
+
+    def __init__(self, parent=None):
+        super(DirectoryWatcher, self).__init__(parent)
+        self.recursive = False
+        self.extensions = EXTENSIONS
+        # directory -> {path: (mtime_ns, size)}
+        self._files = {}
+        self._pending = set()
+        self._warned = False
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._directoryChanged)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DELAY)
+        self.timer.timeout.connect(self._update)
+
+    def set_directory(self, directory, files):
+        """
+        record the pictures [(path, mtime_ns, size), ...] of directory and watch it
+        """
+        if directory not in self._files and not self.watcher.addPath(directory) and not self._warned:
+            # usually the limit of inotify watches
+            print("can not watch {}".format(directory))
+            self._warned = True
+        self._files[directory] = {path: (mtime, size) for path, mtime, size in files}
+
+    def snapshot(self):
+        """
+        return {path: (mtime_ns, size)} of all the pictures known
+        """
+        return {path: st for files in self._files.values() for path, st in files.items()}
+
+    def clear(self):
+        self.timer.stop()
+        self._pending.clear()
+        if self._files:
+            self.watcher.removePaths(list(self._files))
+        self._files = {}
+
+    def _directoryChanged(self, directory):
+        self._pending.add(directory)
+        self.timer.start()
+
+    def _forget(self, directory):
+        """
+        stop watching directory and its sub-directories
+        return the pictures they contained
+        """
+        prefix = os.path.join(directory, "")
+        removed = []
+        for d in [d for d in self._files if d == directory or d.startswith(prefix)]:
+            removed.extend(self._files.pop(d))
+            self.watcher.removePath(d)
+        return removed
+
+    def _update(self):
+        added, removed, modified = [], [], []
+        pending, self._pending = self._pending, set()
+
+        for directory in sorted(pending):
+            if directory not in self._files:
+                continue
+            try:
+                files, dirs = scan_directory(directory, self.extensions)
+            except OSError:
+                # directory removed
+                removed.extend(self._forget(directory))
+                continue
+
+            old = self._files[directory]
+            new = {path: (mtime, size) for path, mtime, size in files}
+            added.extend(path for path in new if path not in old)
+            removed.extend(path for path in old if path not in new)
+            modified.extend(path for path in new if path in old and new[path] != old[path])
+            self._files[directory] = new
+
+            # sub-directories removed or renamed
+            for d in [d for d in self._files if os.path.dirname(d) == directory and d not in dirs]:
+                removed.extend(self._forget(d))
+
+            if self.recursive:
+                for d in dirs:
+                    if d not in self._files:
+                        for sub, subFiles in walk_pictures([d], True, self.extensions):
+                            self.set_directory(sub, subFiles)
+                            added.extend(path for path, _, _ in subFiles)
+
+        if added or removed or modified:
+            self.changed.emit(sorted(added), sorted(removed), sorted(modified))
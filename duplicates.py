@@ -0,0 +1,142 @@
+"""
+Near-duplicate photos for PhotoGeoTagger.
+
+Each picture gets a 64 bits difference hash (dHash): the thumbnail is
+reduced to 9 x 8 gray pixels and each bit tells if a pixel is brighter than
+its left neighbour. Bursts, copies and re-encoded exports of a same shot
+have hashes a few bits apart.
+
+The hashes are computed by batch (vectorized with numpy if available) and
+indexed by multi-index hashing so that the hashes within a Hamming distance
+of a hash are found without comparing all the pairs. group_duplicates joins
+the pictures within the distance into groups (transitively).
+
+This module does not depend on Qt: the 9 x 8 gray pixels are extracted from
+the thumbnails by thumbnails.dhash_pixels.
+"""
+
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# maximum number of different bits of two near-duplicates
+DEFAULT_DISTANCE = 6
+
+# number of chunks of the hashes indexed by MultiIndex
+CHUNKS = 4
+
+
+def hamming(a, b):
+    """
+    return the number of different bits of two hashes
+    """
+    return bin(a ^ b).count("1")
+
+
+def dhash(pixels):
+    """
+    return the hash of 9 x 8 gray pixels (72 bytes, row by row)
+    """
+    h = 0
+    for y in range(HASH_HEIGHT):
+        row = pixels[y * HASH_WIDTH:(y + 1) * HASH_WIDTH]
+        for x in range(HASH_WIDTH - 1):
+            h = (h << 1) | (row[x + 1] > row[x])
+    return h
+
+
+def dhash_batch(pixels):
+    """
+    return the list of hashes of a list of 9 x 8 gray pixels
+    """
+    if numpy is None or not pixels:
+        return [dhash(p) for p in pixels]
+    a = numpy.frombuffer(b"".join(bytes(p) for p in pixels), dtype=numpy.uint8).reshape(-1, HASH_HEIGHT, HASH_WIDTH)
+    bits = (a[:, :, 1:] > a[:, :, :-1]).reshape(len(pixels), 64)
+    return [int(h) for h in numpy.packbits(bits, axis=1).view(">u8").ravel()]
+
+
+class MultiIndex:
+    """
+    multi-index hashing of hashes for the Hamming distance: the 64 bits are cut
+    in CHUNKS chunks of 16 bits, two hashes within distance have a chunk at
+    most distance // CHUNKS bits apart (pigeonhole), so only the hashes of the
+    buckets of the chunk values near the chunks of a hash are compared
+    """
+
+    def __init__(self, distance=DEFAULT_DISTANCE):
+        self.distance = distance
+        # chunk value -> ids, for each chunk
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.hashes = {}
+        # masks of the chunk values at most distance // CHUNKS bits apart
+        bits = 64 // CHUNKS
+        self.flips = [sum(1 << b for b in combination)
+                      for r in range(distance // CHUNKS + 1)
+                      for combination in itertools.combinations(range(bits), r)]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _chunks(self, h):
+        bits = 64 // CHUNKS
+        mask = (1 << bits) - 1
+        return [(h >> (k * bits)) & mask for k in range(CHUNKS)]
+
+    def add(self, h, id_):
+        self.hashes[id_] = h
+        for chunk, table in zip(self._chunks(h), self.tables):
+            table.setdefault(chunk, []).append(id_)
+
+    def search(self, h):
+        """
+        return the list of (distance, id) of the hashes within distance of h
+        """
+        candidates = set()
+        for chunk, table in zip(self._chunks(h), self.tables):
+            for flip in self.flips:
+                ids = table.get(chunk ^ flip)
+                if ids:
+                    candidates.update(ids)
+        result = []
+        for id_ in candidates:
+            d = hamming(h, self.hashes[id_])
+            if d <= self.distance:
+                result.append((d, id_))
+        return result
+
+
+def group_duplicates(hashes, distance=DEFAULT_DISTANCE):
+    """
+    return the groups of near-duplicates of hashes, a list of (id, hash)
+    a group is a sorted list of at least two ids, the groups are sorted by first id
+    """
+    index = MultiIndex(distance)
+    for id_, h in hashes:
+        index.add(h, id_)
+
+    # union-find of the ids
+    parent = {id_: id_ for id_, _ in hashes}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for id_, h in hashes:
+        for _, other in index.search(h):
+            a, b = find(id_), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for id_ in parent:
+        groups.setdefault(find(id_), []).append(id_)
+    return sorted(sorted(group) for group in groups.values() if len(group) > 1)
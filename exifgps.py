@@ -0,0 +1,132 @@
+"""
+EXIF GPS helpers for PhotoGeoTagger.
+
+This module does not depend on Qt so that the functions can be used
+from worker processes.
+"""
+
+import sys
+
+try:
+    import pyexiv2
+except ImportError:
+    print("pyexiv2 is not installed. ")
+    sys.exit(1)
+
+from coordinates import dms_to_decimal, decimal_to_dms, dms_fractions, altitude, altitude_rational
+
+GPS = "Exif.GPSInfo.GPS"
+DATETIME_ORIGINAL = "Exif.Photo.DateTimeOriginal"
+
+NO_POSITION = (0, 0, 0)
+
+
+def decCoordinate(ref, coord):
+    """
+    Convert degree, minutes coordinates to decimal coordinates
+    """
+    return dms_to_decimal(ref, coord)
+
+
+def read_gps(metadata):
+    """
+    return the (lat, lon, alt) tuple of an already read pyexiv2 metadata
+    (0, 0, 0) if the picture has no position
+    """
+    latRaw, lonRaw = 0, 0
+    try:
+        latRaw = metadata[GPS + 'Latitude'].raw_value
+        latRef = metadata[GPS + 'LatitudeRef'].raw_value
+        lonRaw = metadata[GPS + 'Longitude'].raw_value
+        lonRef = metadata[GPS + 'LongitudeRef'].raw_value
+    except KeyError:
+        pass
+
+    if not (latRaw and lonRaw):
+        return NO_POSITION
+
+    try:
+        altRaw = metadata[GPS + 'Altitude'].raw_value
+        altRef = metadata[GPS + 'AltitudeRef'].raw_value if GPS + 'AltitudeRef' in metadata.exif_keys else None
+        alt = altitude(altRef, altRaw)
+    except (KeyError, ValueError, IndexError):
+        alt = 0.0
+
+    try:
+        return (decCoordinate(latRef, latRaw), decCoordinate(lonRef, lonRaw), alt)
+    except (ValueError, ZeroDivisionError):
+        return NO_POSITION
+
+
+def read_datetime(metadata):
+    """
+    return the raw Exif.Photo.DateTimeOriginal value (YYYY:MM:DD HH:MM:SS) or None
+    """
+    try:
+        return metadata[DATETIME_ORIGINAL].raw_value
+    except KeyError:
+        return None
+
+
+def _delete(metadata, tags):
+    for tag in tags:
+        if GPS + tag in metadata.exif_keys:
+            del metadata[GPS + tag]
+
+
+def set_gps(metadata, gps, dms=None):
+    """
+    set the GPS exif tags of an already read pyexiv2 metadata
+    the tags are removed if gps is (0, 0, 0), the altitude tags are removed if the altitude is 0
+    dms: (lat, lon) (degrees, minutes, seconds numerator) triples already converted by batch_decimal_to_dms
+    """
+    if tuple(gps) == NO_POSITION:
+        _delete(metadata, ('Latitude', 'LatitudeRef', 'Longitude', 'LongitudeRef', 'Altitude', 'AltitudeRef'))
+        return
+
+    if dms is None:
+        metadata[GPS + 'Latitude'] = decimal_to_dms(gps[0])
+        metadata[GPS + 'Longitude'] = decimal_to_dms(gps[1])
+    else:
+        metadata[GPS + 'Latitude'] = dms_fractions(dms[0])
+        metadata[GPS + 'Longitude'] = dms_fractions(dms[1])
+    metadata[GPS + 'LatitudeRef'] = 'N' if gps[0] >= 0 else 'S'
+    metadata[GPS + 'LongitudeRef'] = 'E' if gps[1] >= 0 else 'W'
+
+    if len(gps) > 2 and gps[2]:
+        metadata[GPS + 'Altitude'], metadata[GPS + 'AltitudeRef'] = altitude_rational(gps[2])
+    else:
+        _delete(metadata, ('Altitude', 'AltitudeRef'))
+
+
+# IPTC and XMP tags of the city, region, country name and country code
+LOCATION_TAGS = (('Iptc.Application2.City', 'Xmp.photoshop.City'),
+                 ('Iptc.Application2.ProvinceState', 'Xmp.photoshop.State'),
+                 ('Iptc.Application2.CountryName', 'Xmp.photoshop.Country'),
+                 ('Iptc.Application2.CountryCode', 'Xmp.iptc.CountryCode'))
+
+
+def set_location(metadata, place):
+    """
+    set the IPTC and XMP city, region and country tags of an already read pyexiv2 metadata
+    place: gazetteer.Place, the tags of its empty fields are removed
+    """
+    for (iptc, xmp), value in zip(LOCATION_TAGS, (place.city, place.region, place.country, place.country_code)):
+        if value:
+            metadata[iptc] = [value]
+            metadata[xmp] = value
+        else:
+            if iptc in metadata.iptc_keys:
+                del metadata[iptc]
+            if xmp in metadata.xmp_keys:
+                del metadata[xmp]
+
+
+def scan_file(pic):
+    """
+    read the GPS exif tags of picture
+    return the coord dictionary emitted by the scanner
+    """
+    metadata = pyexiv2.ImageMetadata(pic)
+    metadata.read()
+    return {'gps': read_gps(metadata), 'filename': pic, 'datetime': read_datetime(metadata)}
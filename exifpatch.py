@@ -0,0 +1,271 @@
+"""
+In-place patch of the GPS tags of JPEG pictures for PhotoGeoTagger.
+
+A GPSIndex locates the GPS IFD inside the EXIF (APP1) segment of a JPEG.
+It is built from the file head (a few hundred bytes) the first time a
+position is written and kept in INDEXES with the mtime and size of the
+file for the next writes: the scan does not read anything more.
+
+When the GPS tags to write already exist with the same type and number of
+values (a picture tagged before), only their values are overwritten: a few
+bytes are written instead of a copy and a rewrite of the whole file. The
+values already equal to the new position are not written at all.
+
+patch_gps returns None when the layout does not allow an in-place patch
+(no EXIF segment, no GPS IFD, tags to add or to remove): the picture must be
+rewritten with pyexiv2.
+
+Unlike the rewrite of a copy renamed over the picture, the patch is not
+atomic: a crash while writing can leave a mix of the old and new values.
+Only the value bytes of the tags are written, never the structure of the
+IFD (tags, types, counts, offsets), so the picture stays readable, and the
+values are fsynced before the write is reported done.
+
+This module depends neither on Qt nor on pyexiv2.
+"""
+
+import os
+import struct
+import threading
+import collections
+
+from coordinates import dms_fractions, decimal_to_dms, altitude_rational
+
+NO_POSITION = (0, 0, 0)
+
+# file offsets of the TIFF header, of the GPS IFD (0 if there is none) and of the end of the APP1 segment
+GPSIndex = collections.namedtuple("GPSIndex", "mtime size order tiff ifd end")
+
+# GPS IFD tags
+LATITUDE_REF, LATITUDE, LONGITUDE_REF, LONGITUDE, ALTITUDE_REF, ALTITUDE = range(1, 7)
+GPS_TAGS = (LATITUDE_REF, LATITUDE, LONGITUDE_REF, LONGITUDE, ALTITUDE_REF, ALTITUDE)
+GPS_IFD_POINTER = 0x8825
+
+# TIFF types
+BYTE, ASCII, LONG, RATIONAL = 1, 2, 4, 5
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+SOI = b"\xff\xd8"
+APP1 = 0xe1
+SOS = 0xda
+EOI = 0xd9
+EXIF_HEADER = b"Exif\0\0"
+
+# results of patch_gps
+PATCHED = "patched"
+UNCHANGED = "unchanged"
+
+
+class _Reader:
+    """
+    file wrapper counting the bytes read
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read_at(self, offset, size):
+        self.f.seek(offset)
+        data = self.f.read(size)
+        self.count += len(data)
+        return data
+
+
+def _stat_key(st):
+    return st.st_mtime_ns, st.st_size
+
+
+def _index(reader, st):
+    """
+    return the GPSIndex of an open JPEG or None if it has no EXIF segment
+    """
+    if reader.read_at(0, 2) != SOI:
+        return None
+    offset = 2
+    while True:
+        header = reader.read_at(offset, 4)
+        if len(header) < 4 or header[0] != 0xff or header[1] in (SOS, EOI):
+            return None
+        length = struct.unpack(">H", header[2:])[0]
+        start = offset + 4
+        end = offset + 2 + length
+        if header[1] == APP1 and reader.read_at(start, 6) == EXIF_HEADER:
+            break
+        offset = end
+
+    tiff = start + 6
+    head = reader.read_at(tiff, 8)
+    if head[:2] == b"II":
+        order = "<"
+    elif head[:2] == b"MM":
+        order = ">"
+    else:
+        return None
+    magic, ifd0 = struct.unpack(order + "HI", head[2:8])
+    if magic != 42 or tiff + ifd0 + 2 > end:
+        return None
+
+    n = struct.unpack(order + "H", reader.read_at(tiff + ifd0, 2))[0]
+    data = reader.read_at(tiff + ifd0 + 2, 12 * n)
+    ifd = 0
+    for k in range(len(data) // 12):
+        tag, type_, count, value = struct.unpack(order + "HHII", data[12 * k:12 * k + 12])
+        if tag == GPS_IFD_POINTER and type_ == LONG and count == 1:
+            if tiff + value + 2 <= end:
+                ifd = value
+            break
+
+    mtime, size = _stat_key(st)
+    return GPSIndex(mtime, size, order, tiff, ifd, end)
+
+
+def read_index(path):
+    """
+    return (GPSIndex or None, number of bytes read) of a picture
+    None if the picture is not a JPEG with an EXIF segment
+    """
+    with open(path, "rb") as f:
+        reader = _Reader(f)
+        try:
+            index = _index(reader, os.fstat(f.fileno()))
+        except struct.error:
+            index = None
+        return index, reader.count
+
+
+class IndexCache:
+    """
+    thread safe {path: GPSIndex} of the pictures written
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def put(self, path, index):
+        with self._lock:
+            if index is None:
+                self._indexes.pop(path, None)
+            else:
+                self._indexes[path] = index
+
+    def get(self, path, st):
+        """
+        return the GPSIndex of path if the file was not modified since it was indexed
+        """
+        with self._lock:
+            index = self._indexes.get(path)
+        if index is not None and (index.mtime, index.size) == _stat_key(st):
+            return index
+        return None
+
+    def forget(self, path):
+        self.put(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes = {}
+
+
+# indexes of the pictures written in this process
+INDEXES = IndexCache()
+
+
+def _entries(reader, index):
+    """
+    return {tag: (type, count, file offset of the value)} of the GPS tags of the GPS IFD
+    """
+    start = index.tiff + index.ifd
+    n = struct.unpack(index.order + "H", reader.read_at(start, 2))[0]
+    data = reader.read_at(start + 2, 12 * n)
+    entries = {}
+    for k in range(len(data) // 12):
+        tag, type_, count = struct.unpack(index.order + "HHI", data[12 * k:12 * k + 8])
+        if tag not in GPS_TAGS or type_ not in TYPE_SIZES:
+            continue
+        size = TYPE_SIZES[type_] * count
+        if size <= 4:
+            offset = start + 2 + 12 * k + 8
+        else:
+            offset = index.tiff + struct.unpack(index.order + "I", data[12 * k + 8:12 * k + 12])[0]
+        if offset + size <= index.end:
+            entries[tag] = (type_, count, offset)
+    return entries
+
+
+def _rationals(order, values):
+    return b"".join(struct.pack(order + "II", f.numerator, f.denominator) for f in values)
+
+
+def gps_values(gps, dms=None, order="<"):
+    """
+    return {tag: (type, count, bytes)} of the GPS tags written by exifgps.set_gps for gps
+    the altitude tags are left out if the altitude is 0
+    """
+    if dms is None:
+        lat, lon = decimal_to_dms(gps[0]), decimal_to_dms(gps[1])
+    else:
+        lat, lon = dms_fractions(dms[0]), dms_fractions(dms[1])
+    values = {LATITUDE_REF: (ASCII, 2, b"N\0" if gps[0] >= 0 else b"S\0"),
+              LATITUDE: (RATIONAL, 3, _rationals(order, lat)),
+              LONGITUDE_REF: (ASCII, 2, b"E\0" if gps[1] >= 0 else b"W\0"),
+              LONGITUDE: (RATIONAL, 3, _rationals(order, lon))}
+    if len(gps) > 2 and gps[2]:
+        alt, ref = altitude_rational(gps[2])
+        values[ALTITUDE] = (RATIONAL, 1, _rationals(order, [alt]))
+        values[ALTITUDE_REF] = (BYTE, 1, bytes([int(ref)]))
+    return values
+
+
+def patch_gps(path, gps, dms=None, index=None):
+    """
+    overwrite the GPS tags of path in place
+    gps: (lat, lon, alt), dms: (lat, lon) converted by batch_decimal_to_dms or None
+    index: GPSIndex of path (read from the file if None or stale)
+    return (PATCHED, UNCHANGED or None if the picture must be rewritten, bytes read, bytes written)
+    """
+    with open(path, "rb+") as f:
+        st = os.fstat(f.fileno())
+        reader = _Reader(f)
+        try:
+            if index is None or (index.mtime, index.size) != _stat_key(st):
+                index = _index(reader, st)
+            if index is None:
+                return None, reader.count, 0
+            entries = _entries(reader, index) if index.ifd else {}
+        except struct.error:
+            return None, reader.count, 0
+
+        INDEXES.put(path, index)
+        if tuple(gps) == NO_POSITION:
+            # the tags must be removed
+            return (None if entries else UNCHANGED), reader.count, 0
+
+        values = gps_values(gps, dms, index.order)
+        # tags to add or to remove change the size of the IFD
+        if set(entries) != set(values):
+            return None, reader.count, 0
+        changes = []
+        for tag, (type_, count, data) in values.items():
+            entryType, entryCount, offset = entries[tag]
+            if (entryType, entryCount) != (type_, count):
+                return None, reader.count, 0
+            if reader.read_at(offset, len(data)) != data:
+                changes.append((offset, data))
+
+        if not changes:
+            return UNCHANGED, reader.count, 0
+        written = 0
+        for offset, data in changes:
+            f.seek(offset)
+            f.write(data)
+            written += len(data)
+        f.flush()
+        os.fsync(f.fileno())
+        mtime, size = _stat_key(os.fstat(f.fileno()))
+    INDEXES.put(path, index._replace(mtime=mtime, size=size))
+    return PATCHED, reader.count, written
@@ -0,0 +1,334 @@
+"""
+Export and import of positions for PhotoGeoTagger.
+
+The positions are written one record at a time (CSV, GeoJSON, GPX or KML)
+so that the memory used does not depend on the number of pictures: the
+records can come from the Catalog or directly from the scan engine.
+
+The positions are read back from CSV (path,lat,lon[,alt] with an optional
+header) or GeoJSON (Point features with a "path" or "filename" property,
+decoded one feature at a time) and matched to the pictures by path,
+absolute path or file name when the name is not ambiguous.
+
+This module does not depend on Qt.
+"""
+
+import os
+import sys
+import csv
+import json
+import collections
+from xml.sax.saxutils import escape
+
+NO_POSITION = (0, 0, 0)
+
+FORMATS = ("csv", "geojson", "gpx", "kml")
+
+EXTENSIONS = {".csv": "csv", ".geojson": "geojson", ".json": "geojson", ".gpx": "gpx", ".kml": "kml"}
+
+# place: gazetteer.Place or None
+Record = collections.namedtuple("Record", "path lat lon alt datetime place")
+
+# size of the chunks of the GeoJSON files read
+READ_SIZE = 64 * 1024
+
+_DECODER = json.JSONDecoder()
+
+
+def format_from_name(fileName, default="csv"):
+    """
+    return the format of a file from its extension
+    """
+    return EXTENSIONS.get(os.path.splitext(fileName)[1].lower(), default)
+
+
+def _iso_time(datetime):
+    """
+    return the ISO 8601 time of an EXIF date time (2018:09:25 10:11:12) or None
+    """
+    if not datetime or len(datetime) < 19:
+        return None
+    return datetime[:10].replace(":", "-") + "T" + datetime[11:19]
+
+
+def catalog_records(catalog, indices=None):
+    """
+    yield the records of the pictures with position of catalog
+    indices: pictures to export (default all)
+    """
+    for i in (catalog.indices() if indices is None else indices):
+        if catalog.is_tagged(i):
+            lat, lon, alt = catalog.position(i)
+            yield Record(catalog.paths[i], lat, lon, alt, catalog.datetimes[i], catalog.places[i])
+
+
+def coord_records(coords):
+    """
+    yield the records of the coord dictionaries with position (as returned by the scan engine)
+    """
+    for coord in coords:
+        if tuple(coord['gps']) != NO_POSITION:
+            lat, lon, alt = coord['gps']
+            yield Record(coord['filename'], lat, lon, alt, coord.get('datetime'), None)
+
+
+class CSVWriter:
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(["path", "lat", "lon", "alt", "datetime", "city", "region", "country"])
+
+    def write(self, r):
+        place = r.place or ("", "", "")
+        self.writer.writerow([r.path, r.lat, r.lon, r.alt, r.datetime or "", place[0], place[1], place[2]])
+
+    def close(self):
+        pass
+
+
+class GeoJSONWriter:
+
+    def __init__(self, f):
+        self.f = f
+        self.f.write('{"type": "FeatureCollection", "features": [\n')
+        self.first = True
+
+    def write(self, r):
+        properties = {"path": r.path, "filename": os.path.basename(r.path), "datetime": r.datetime}
+        if r.place:
+            properties.update(city=r.place.city, region=r.place.region, country=r.place.country)
+        feature = {"type": "Feature",
+                   "geometry": {"type": "Point", "coordinates": [r.lon, r.lat, r.alt]},
+                   "properties": properties}
+        self.f.write(("" if self.first else ",\n") + json.dumps(feature))
+        self.first = False
+
+    def close(self):
+        self.f.write("\n]}\n")
+
+
+class GPXWriter:
+
+    def __init__(self, f):
+        self.f = f
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<gpx version="1.1" creator="PhotoGeoTagger" xmlns="http://www.topografix.com/GPX/1/1">\n')
+
+    def write(self, r):
+        time = _iso_time(r.datetime)
+        self.f.write('<wpt lat="{:.7f}" lon="{:.7f}"><ele>{:.1f}</ele>{}<name>{}</name><desc>{}</desc></wpt>\n'.format(
+                     r.lat, r.lon, r.alt, "<time>{}</time>".format(time) if time else "",
+                     escape(os.path.basename(r.path)), escape(r.path)))
+
+    def close(self):
+        self.f.write("</gpx>\n")
+
+
+class KMLWriter:
+
+    def __init__(self, f):
+        self.f = f
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+
+    def write(self, r):
+        time = _iso_time(r.datetime)
+        self.f.write("<Placemark><name>{}</name><description>{}</description>{}"
+                     "<Point><coordinates>{:.7f},{:.7f},{:.1f}</coordinates></Point></Placemark>\n".format(
+                     escape(os.path.basename(r.path)), escape(r.path),
+                     "<TimeStamp><when>{}</when></TimeStamp>".format(time) if time else "",
+                     r.lon, r.lat, r.alt))
+
+    def close(self):
+        self.f.write("</Document></kml>\n")
+
+
+WRITERS = {"csv": CSVWriter, "geojson": GeoJSONWriter, "gpx": GPXWriter, "kml": KMLWriter}
+
+
+def export(records, f, fmt):
+    """
+    write records to the text file f in format fmt (one of FORMATS)
+    return the number of records written
+    """
+    writer = WRITERS[fmt](f)
+    n = 0
+    for record in records:
+        writer.write(record)
+        n += 1
+    writer.close()
+    return n
+
+
+def export_file(records, fileName, fmt=None):
+    """
+    write records to fileName (- for stdout), the format is found from the extension if fmt is None
+    return the number of records written
+    """
+    fmt = fmt or format_from_name(fileName)
+    if fileName == "-":
+        return export(records, sys.stdout, fmt)
+    with open(fileName, "w", newline="", encoding="utf-8") as f:
+        return export(records, f, fmt)
+
+
+def read_csv(fileName):
+    """
+    yield (path or file name, (lat, lon, alt)) of a CSV file with columns path,lat,lon[,alt]
+    a header line is allowed
+    """
+    with open(fileName, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            try:
+                gps = (float(row[1]), float(row[2]), float(row[3]) if len(row) > 3 and row[3] else 0.0)
+            except ValueError:
+                # header
+                continue
+            yield row[0], gps
+
+
+class _JSONStream:
+    """
+    JSON values decoded one at a time from a text file read by chunks
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _more(self):
+        chunk = self.f.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        return the next character after white space ("" at the end of the file)
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def next(self, expected):
+        """
+        read the next character, one of expected (ValueError otherwise)
+        """
+        c = self.peek()
+        if not c or c not in expected:
+            raise ValueError("invalid JSON: {!r} instead of {!r}".format(c, expected))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self._more():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._more():
+                continue
+            self.pos = end
+            return value
+
+
+def _features(f):
+    """
+    yield the features of a GeoJSON file, the "features" array is not loaded at once
+    a lone Feature object is yielded too
+    """
+    stream = _JSONStream(f)
+    stream.next("{")
+    top = {}
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.next(":")
+        if key == "features" and stream.peek() == "[":
+            stream.next("[")
+            if stream.peek() == "]":
+                stream.next("]")
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.next(",]") == "]":
+                        break
+        else:
+            top[key] = stream.value()
+        if stream.next(",}") == "}":
+            break
+    if top.get("type") == "Feature":
+        yield top
+
+
+def read_geojson(fileName):
+    """
+    yield (path or file name, (lat, lon, alt)) of the Point features of a GeoJSON file
+    """
+    with open(fileName, encoding="utf-8") as f:
+        for feature in _features(f):
+            if not isinstance(feature, dict):
+                continue
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            key = properties.get("path") or properties.get("filename")
+            if geometry.get("type") != "Point" or not key:
+                continue
+            coordinates = geometry.get("coordinates") or []
+            try:
+                yield key, (float(coordinates[1]), float(coordinates[0]),
+                            float(coordinates[2]) if len(coordinates) > 2 and coordinates[2] is not None else 0.0)
+            except (IndexError, TypeError, ValueError):
+                continue
+
+
+def read_positions(fileName):
+    """
+    return {path or file name: (lat, lon, alt)} of a CSV or GeoJSON file
+    """
+    if format_from_name(fileName) == "geojson":
+        return dict(read_geojson(fileName))
+    return dict(read_csv(fileName))
+
+
+def match_positions(positions, paths):
+    """
+    return ({path: (lat, lon, alt)}, [paths skipped]) of the paths found in positions by path, absolute path
+    or file name, a file name is used only if it is unique in positions and in paths (the paths skipped
+    have a file name found several times)
+    """
+    paths = list(paths)
+    keyNames = collections.Counter(os.path.basename(key) for key in positions)
+    pathNames = collections.Counter(os.path.basename(path) for path in paths)
+    byName = {os.path.basename(key): gps for key, gps in positions.items()}
+    found, ambiguous = {}, []
+    for path in paths:
+        for key in (path, os.path.abspath(path)):
+            if key in positions:
+                found[path] = positions[key]
+                break
+        else:
+            name = os.path.basename(path)
+            if name not in byName:
+                continue
+            if keyNames[name] == 1 and pathNames[name] == 1:
+                found[path] = byName[name]
+            else:
+                ambiguous.append(path)
+    return found, ambiguous
@@ -0,0 +1,155 @@
+"""
+Offline reverse geocoding for PhotoGeoTagger.
+
+The places are read from a GeoNames dump (cities1000.txt, cities15000.txt
+... or the zip files distributed by GeoNames, see
+http://download.geonames.org/export/dump/). The region and country names are
+read from admin1CodesASCII.txt and countryInfo.txt if they are found next to
+the dump, else the GeoNames codes are used.
+
+The places are kept in columns and indexed with a KDTree; the lookups are
+memoized on coordinates rounded to MEMO_DIGITS decimals (about 100 m), so
+that the photos of a same spot are looked up once.
+
+This module does not depend on Qt.
+"""
+
+import os
+import io
+import zipfile
+import contextlib
+import collections
+
+from spatialindex import KDTree
+
+# places farther than this distance (meters) are not used
+MAX_DISTANCE = 50000
+
+MEMO_DIGITS = 3
+MEMO_SIZE = 100000
+
+Place = collections.namedtuple("Place", "city region country country_code distance")
+
+# written to remove the location tags
+NO_PLACE = Place("", "", "", "", None)
+
+
+@contextlib.contextmanager
+def _open_text(path):
+    """
+    context manager of a text file of path, a zip file is read from its member of the same name
+    """
+    if not path.lower().endswith(".zip"):
+        with open(path, encoding="utf-8") as f:
+            yield f
+        return
+    with zipfile.ZipFile(path) as archive:
+        name = os.path.splitext(os.path.basename(path))[0] + ".txt"
+        if name not in archive.namelist():
+            name = archive.namelist()[0]
+        with io.TextIOWrapper(archive.open(name), encoding="utf-8") as f:
+            yield f
+
+
+def _read_table(path, keyColumn, valueColumn):
+    """
+    return {key: value} of a tab separated GeoNames file, {} if the file does not exist
+    """
+    table = {}
+    if not os.path.isfile(path):
+        return table
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) > max(keyColumn, valueColumn):
+                table[fields[keyColumn]] = fields[valueColumn]
+    return table
+
+
+class Gazetteer:
+
+    def __init__(self, names, lats, lons, countryCodes, regionCodes, regions=None, countries=None):
+        """
+        names, lats, lons, countryCodes, regionCodes: columns of the places
+        regions: {"country code.region code": region name}
+        countries: {country code: country name}
+        """
+        self.names = names
+        self.countryCodes = countryCodes
+        self.regionCodes = regionCodes
+        self.regions = regions or {}
+        self.countries = countries or {}
+        self.tree = KDTree(lats, lons)
+        self._memo = {}
+
+    @classmethod
+    def load(cls, path, min_population=0):
+        """
+        read a GeoNames dump (txt or zip)
+        min_population: places with less inhabitants are skipped
+        """
+        names, lats, lons, countryCodes, regionCodes = [], [], [], [], []
+        # the region codes are shared by many places
+        shared = {}
+        with _open_text(path) as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 15:
+                    continue
+                try:
+                    lat, lon = float(fields[4]), float(fields[5])
+                    population = int(fields[14] or 0)
+                except ValueError:
+                    continue
+                if population < min_population:
+                    continue
+                names.append(fields[1])
+                lats.append(lat)
+                lons.append(lon)
+                countryCodes.append(shared.setdefault(fields[8], fields[8]))
+                regionCodes.append(shared.setdefault(fields[10], fields[10]))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        regions = _read_table(os.path.join(directory, "admin1CodesASCII.txt"), 0, 1)
+        countries = _read_table(os.path.join(directory, "countryInfo.txt"), 0, 4)
+        return cls(names, lats, lons, countryCodes, regionCodes, regions, countries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def place(self, i, distance=None):
+        cc = self.countryCodes[i]
+        return Place(self.names[i],
+                     self.regions.get("{}.{}".format(cc, self.regionCodes[i]), self.regionCodes[i]),
+                     self.countries.get(cc, cc), cc, distance)
+
+    def lookup(self, lat, lon, max_distance=MAX_DISTANCE):
+        """
+        return the Place nearest to (lat, lon) or None if no place is nearer than max_distance
+        """
+        key = (round(lat, MEMO_DIGITS), round(lon, MEMO_DIGITS))
+        if key in self._memo:
+            nearest = self._memo[key]
+        else:
+            nearest = self.tree.nearest(*key)
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[key] = nearest
+        if nearest is None or nearest[0] > max_distance:
+            return None
+        return self.place(nearest[1], nearest[0])
+
+    def lookup_batch(self, positions, max_distance=MAX_DISTANCE):
+        """
+        return the list of Place of positions (lat, lon, ...)
+        NO_PLACE for the positions (0, 0) and the positions far from any place
+        """
+        places = []
+        for gps in positions:
+            if not gps[0] and not gps[1]:
+                places.append(NO_PLACE)
+            else:
+                places.append(self.lookup(gps[0], gps[1], max_distance) or NO_PLACE)
+        return places
@@ -0,0 +1,203 @@
+"""
+Edit journal of PhotoGeoTagger: undo/redo of position changes and crash recovery.
+
+Each edit (one action of the user, possibly on many photos) is appended to
+a journal file as one JSON line holding, for each photo, its path, the
+position before and the position after. Undo and redo are appended the
+same way, so that reading the journal again gives the positions not saved
+when the program stopped, and the undo/redo stacks.
+
+The lines are written to the file at once but fsync is called at most every
+FSYNC_INTERVAL seconds (or with sync()), so that a burst of edits costs one
+disk sync. Once positions are saved, compact() rewrites the journal with
+only the positions still not saved (an empty journal if none).
+
+This module does not depend on Qt.
+"""
+
+import os
+import json
+import time
+import collections
+
+# maximum number of edits that can be undone
+MAX_UNDO = 100
+
+# maximum time (seconds) between two fsync of the journal
+FSYNC_INTERVAL = 1.0
+
+
+def default_journal_path():
+    """
+    return the path of the journal (XDG state directory)
+    """
+    state_dir = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_dir, "photogeotagger", "journal.jsonl")
+
+
+def _position(value):
+    return tuple(float(x) for x in value)
+
+
+class EditJournal:
+
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # (label, [(path, old position, new position), ...])
+        self.undoStack = collections.deque(maxlen=MAX_UNDO)
+        self.redoStack = []
+        # position saved in the picture of the paths edited since the last save
+        self.base = {}
+        # positions not saved found in the journal when it was opened: {path: position}
+        self.recovered = self._replay()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._synced = time.monotonic()
+        self._unsynced = False
+
+    def _replay(self):
+        """
+        read the journal, rebuild the undo/redo stacks and return the positions not saved
+        """
+        current = {}
+        if not os.path.isfile(self.path):
+            return current
+        # end of the last complete record
+        end = 0
+        with open(self.path, "rb+") as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                    changes = [(path, _position(old), _position(new)) for path, old, new in record["changes"]]
+                except (ValueError, KeyError, TypeError):
+                    # last line not completely written before the crash: removed
+                    f.truncate(end)
+                    break
+                end += len(line)
+                op = record.get("op")
+                if op == "edit":
+                    self.undoStack.append((record.get("label", ""), changes))
+                    self.redoStack = []
+                elif op == "undo" and self.undoStack:
+                    self.redoStack.append(self.undoStack.pop())
+                elif op == "redo" and self.redoStack:
+                    self.undoStack.append(self.redoStack.pop())
+                for path, old, new in changes:
+                    self.base.setdefault(path, old)
+                    current[path] = old if op == "undo" else new
+        return {path: position for path, position in current.items() if position != self.base.get(path)}
+
+    def _append(self, op, label, changes):
+        self._file.write(json.dumps({"op": op, "label": label, "changes": changes}) + "\n")
+        self._file.flush()
+        self._unsynced = True
+        if time.monotonic() - self._synced >= FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """
+        write the journal to disk
+        """
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._synced = time.monotonic()
+
+    def record(self, label, changes):
+        """
+        record an edit
+        changes: list of (path, old position, new position)
+        """
+        changes = [(path, tuple(old), tuple(new)) for path, old, new in changes if tuple(old) != tuple(new)]
+        if not changes:
+            return
+        for path, old, _ in changes:
+            self.base.setdefault(path, old)
+        self.undoStack.append((label, changes))
+        self.redoStack = []
+        self._append("edit", label, changes)
+
+    def can_undo(self):
+        return bool(self.undoStack)
+
+    def can_redo(self):
+        return bool(self.redoStack)
+
+    def undo_label(self):
+        return self.undoStack[-1][0] if self.undoStack else ""
+
+    def redo_label(self):
+        return self.redoStack[-1][0] if self.redoStack else ""
+
+    def undo(self):
+        """
+        undo the last edit
+        return the positions to set: list of (path, position)
+        """
+        if not self.undoStack:
+            return []
+        label, changes = self.undoStack.pop()
+        self.redoStack.append((label, changes))
+        for path, _, new in changes:
+            self.base.setdefault(path, new)
+        self._append("undo", label, changes)
+        return [(path, old) for path, old, _ in changes]
+
+    def redo(self):
+        """
+        redo the last edit undone
+        return the positions to set: list of (path, position)
+        """
+        if not self.redoStack:
+            return []
+        label, changes = self.redoStack.pop()
+        self.undoStack.append((label, changes))
+        for path, old, _ in changes:
+            self.base.setdefault(path, old)
+        self._append("redo", label, changes)
+        return [(path, new) for path, _, new in changes]
+
+    def is_saved(self, path, position):
+        """
+        return True if position is the position saved in the picture of path
+        """
+        return path in self.base and self.base[path] == tuple(position)
+
+    def saved(self, positions):
+        """
+        the positions [(path, position), ...] were saved in the pictures
+        """
+        for path, position in positions:
+            self.base[path] = tuple(position)
+
+    def compact(self, pending):
+        """
+        rewrite the journal with the positions not saved only
+        pending: list of (path, position) not saved
+        the undo/redo stacks are kept in memory
+        """
+        changes = [(path, self.base.get(path, tuple(position)), tuple(position)) for path, position in pending]
+        self._file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            if changes:
+                f.write(json.dumps({"op": "edit", "label": "Unsaved changes", "changes": changes}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._unsynced = False
+
+    def clear(self):
+        """
+        forget all the edits (the positions not saved are discarded)
+        """
+        self.undoStack.clear()
+        self.redoStack = []
+        self.base = {}
+        self.recovered = {}
+        self.compact([])
+
+    def close(self):
+        self.sync()
+        self._file.close()
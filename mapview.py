@@ -0,0 +1,174 @@
+"""
+Map view of PhotoGeoTagger: Leaflet page in a QWebEngineView.
+
+This module imports QtWebEngineWidgets (slow to load and to initialize):
+it is imported by the main window once the window is shown, so that the
+photo list is usable before the map. The application must be created with
+the Qt.AA_ShareOpenGLContexts attribute to import QtWebEngineWidgets after
+the QApplication.
+
+The page calls the slots of WebPage (registered as "bridge" in the web
+channel); ready is called once the channel is connected, the scripts run
+before are queued by the main window.
+
+The messages of the javascript console go to the "photogeotagger.map"
+logger (warnings and errors are shown on stderr unless logging is
+configured otherwise).
+"""
+
+import logging
+
+from PyQt5.QtCore import QUrl, pyqtSlot
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
+from PyQt5.QtWebChannel import QWebChannel
+
+from metrics import METRICS
+
+log = logging.getLogger("photogeotagger.map")
+
+# javascript console level -> logging level
+CONSOLE_LEVELS = {QWebEnginePage.InfoMessageLevel: logging.DEBUG,
+                  QWebEnginePage.WarningMessageLevel: logging.WARNING,
+                  QWebEnginePage.ErrorMessageLevel: logging.ERROR}
+
+HTML = """
+<html>
+<head>
+<style>#map { position:absolute; left:0; top:0; bottom:0; width:100%%; }</style></head>
+<body>
+<script src="%(static)s/leaflet.js"></script>
+<link rel="stylesheet" href="%(static)s/leaflet.css" />
+<script src="%(static)s/leaflet.markercluster.js"></script>
+<link rel="stylesheet" href="%(static)s/MarkerCluster.css" />
+<link rel="stylesheet" href="%(static)s/MarkerCluster.Default.css" />
+<script src="qrc:///qtwebchannel/qwebchannel.js"></script>
+<script>    
+new QWebChannel(qt.webChannelTransport, function (channel) {
+    window.bridge = channel.objects.bridge;
+    bridge.ready();
+    if (window.sendView) { sendView(); }
+});
+</script>
+
+<div id="map"></div>
+
+<script>
+if (!window.L) {
+    document.getElementById('map').textContent = "The map can not be shown: leaflet.js was not found in the static " +
+        "directory of PhotoGeoTagger. Run photogeotagger_cli.py static to download it.";
+}
+</script>
+
+<script>
+var map = L.map('map').setView([%(defaultLat)f, %(defaultLon)f], %(defaultZoom)f);
+
+var tileLayer = L.tileLayer('%(tiles)s', { attribution: '&copy; <a href="http://osm.org/copyright">OpenStreetMap</a> contributors'}).addTo(map);
+
+function setTileLayer(url) {
+    map.removeLayer(tileLayer);
+    tileLayer = L.tileLayer(url, { attribution: '&copy; <a href="http://osm.org/copyright">OpenStreetMap</a> contributors'}).addTo(map);
+}
+
+map.on('click', function(e) { window.bridge.print(e.latlng.lat + "|" + e.latlng.lng)})
+// bounds and zoom of the view, the markers outside the view are not sent
+function sendView() {
+    var b = map.getBounds();
+    if (window.bridge) { window.bridge.view_changed(b.getSouth(), b.getWest(), b.getNorth(), b.getEast(), map.getZoom()); }
+}
+map.on('moveend', sendView)
+
+// single layer holding the markers of all photos, clustered if the plugin is available
+var markers = (L.markerClusterGroup ? L.markerClusterGroup({chunkedLoading: true}) : L.featureGroup()).addTo(map);
+var markerById = {};
+
+function popupContent(label) {
+    var e = document.createElement('span');
+    e.textContent = label;
+    return e;
+}
+
+// diff = {add: [[id, lat, lon, selected, label], ...], remove: [id, ...], focus: id, view: [lat, lon, zoom]}
+function updateMarkers(diff) {
+    var toRemove = [], toAdd = [];
+    diff.remove.forEach(function (id) {
+        if (markerById[id]) { toRemove.push(markerById[id]); delete markerById[id]; }
+    });
+    diff.add.forEach(function (m) {
+        if (markerById[m[0]]) { toRemove.push(markerById[m[0]]); }
+        var marker = L.marker([m[1], m[2]], {opacity: m[3] ? 1.0 : 0.6, zIndexOffset: m[3] ? 1000 : 0}).bindPopup(popupContent(m[4]));
+        markerById[m[0]] = marker;
+        toAdd.push(marker);
+    });
+    if (markers.removeLayers) {
+        markers.removeLayers(toRemove);
+        markers.addLayers(toAdd);
+    } else {
+        toRemove.forEach(function (marker) { markers.removeLayer(marker); });
+        toAdd.forEach(function (marker) { markers.addLayer(marker); });
+    }
+    if (diff.view) { map.setView([diff.view[0], diff.view[1]], diff.view[2]); }
+    var focused = diff.focus !== null ? markerById[diff.focus] : null;
+    if (focused) {
+        if (markers.zoomToShowLayer) { markers.zoomToShowLayer(focused, function () { focused.openPopup(); }); }
+        else { focused.openPopup(); }
+    }
+}
+
+</script>
+</body>
+</html>
+"""
+
+
+def map_html(tileServer, layer, lat, lon, zoom):
+    """
+    return the html of the map page served by the local tile server
+    """
+    return HTML % {"defaultLat": lat, "defaultLon": lon, "defaultZoom": zoom,
+                   "static": tileServer.url + "/static", "tiles": tileServer.tile_url(layer)}
+
+
+class WebPage(QWebEnginePage):
+
+    def __init__(self, parent=None):
+        super(WebPage, self).__init__(parent)
+        self.parent = parent
+
+    def javaScriptConsoleMessage(self, level, msg, linenumber, source_id):
+        log.log(CONSOLE_LEVELS.get(level, logging.INFO), "%s:%s: %s", source_id, linenumber, msg)
+
+    @pyqtSlot()
+    def ready(self):
+        """
+        web channel connected: the queued scripts can be run
+        """
+        self.parent.map_ready()
+
+    @pyqtSlot(float, float, float, float, int)
+    def view_changed(self, south, west, north, east, z):
+        """
+        map moved or zoomed: update zoom value and markers in view
+        """
+        with METRICS.timer("bridge.view_changed"):
+            self.parent.zoom = z
+            self.parent.set_view_bounds(south, west, north, east)
+
+    @pyqtSlot(str)
+    def print(self, text):
+        with METRICS.timer("bridge.click"):
+            click_lat, click_long = [float(x) for x in text.split('|')]
+            self.parent.map_clicked(click_lat, click_long)
+
+
+def create_map_view(parent, tileServer, layer, lat, lon, zoom):
+    """
+    return the QWebEngineView of the map with the WebPage of parent (the main window) as bridge
+    """
+    view = QWebEngineView()
+    page = WebPage(parent)
+    view.setPage(page)
+    channel = QWebChannel(page)
+    channel.registerObject('bridge', page)
+    page.setWebChannel(channel)
+    view.setHtml(map_html(tileServer, layer, lat, lon, zoom), QUrl(tileServer.url + "/"))
+    return view
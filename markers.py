@@ -0,0 +1,49 @@
+"""
+Marker layer of the PhotoGeoTagger map.
+
+The map holds a single (clustered) marker layer. MarkerLayer remembers the
+markers already sent to the map and returns the payload of the changes only,
+sent to the updateMarkers javascript function in one call.
+
+This module does not depend on Qt.
+"""
+
+import json
+
+
+class MarkerLayer:
+
+    def __init__(self):
+        self.shown = {}
+
+    def reset(self):
+        """
+        forget the markers shown (the page was reloaded)
+        """
+        self.shown = {}
+
+    def diff(self, wanted, focus=None, view=None):
+        """
+        wanted: {id: (lat, lon, selected, label)} of all the markers to show
+        focus: id of the marker whose popup is opened
+        view: (lat, lon, zoom) of the map or None
+        return the payload of the changes or None if nothing changed
+        """
+        add = [[id_, lat, lon, selected, label] for id_, (lat, lon, selected, label) in wanted.items()
+               if self.shown.get(id_) != (lat, lon, selected, label)]
+        remove = [id_ for id_ in self.shown if id_ not in wanted]
+        if add or remove:
+            self.shown = dict(wanted)
+
+        if not add and not remove and focus is None and view is None:
+            return None
+        return {"add": add, "remove": remove, "focus": focus, "view": view}
+
+    def script(self, wanted, focus=None, view=None):
+        """
+        return the javascript updating the map or an empty string
+        """
+        payload = self.diff(wanted, focus, view)
+        if payload is None:
+            return ""
+        return "updateMarkers({});".format(json.dumps(payload))
@@ -0,0 +1,229 @@
+"""
+Instrumentation of PhotoGeoTagger: timers and counters of the hot paths.
+
+The timers (number of calls, total and maximum time) and the counters are
+kept in METRICS, shared by all the modules and thread safe. A timer costs two
+perf_counter calls and a lock.
+The live throughput of a timer is the number of calls in the last
+RATE_WINDOW seconds.
+
+Profiler captures the CPU profile (cProfile, thread calling start) and the
+memory allocations (tracemalloc, all threads) between start and stop.
+
+The metrics are dumped as JSON at exit if the environment variable
+PHOTOGEOTAGGER_METRICS is set to a file name (see dump_at_exit).
+
+This module does not depend on Qt.
+"""
+
+import os
+import io
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import collections
+
+# time (seconds) over which the live throughput is computed
+RATE_WINDOW = 5.0
+
+# maximum number of calls of a timer kept to compute the throughput
+RATE_SAMPLES = 4096
+
+# number of stack frames kept by tracemalloc and lines of the reports
+TRACE_FRAMES = 10
+REPORT_LINES = 30
+
+
+class _Timing:
+    """
+    context manager adding the time spent in its block to a timer
+    """
+
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # name -> [count, total seconds, max seconds]
+            self.timers = {}
+            # name -> deque of the end times (monotonic) of the last calls
+            self._ends = {}
+            self.counters = collections.Counter()
+            self.started = time.monotonic()
+
+    def add(self, name, seconds):
+        """
+        add one call of seconds to the timer name
+        """
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = [0, 0.0, 0.0]
+                self._ends[name] = collections.deque(maxlen=RATE_SAMPLES)
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+            self._ends[name].append(time.monotonic())
+
+    def count(self, name, n=1):
+        """
+        add n to the counter name
+        """
+        with self._lock:
+            self.counters[name] += n
+
+    def timer(self, name):
+        """
+        return a context manager timing its block: with METRICS.timer("scan.exif"): ...
+        """
+        return _Timing(self, name)
+
+    def rate(self, name, window=RATE_WINDOW):
+        """
+        return the number of calls per second of the timer name in the last window seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            ends = self._ends.get(name)
+            if not ends:
+                return 0.0
+            n = 0
+            for end in reversed(ends):
+                if now - end > window:
+                    break
+                n += 1
+        return n / window
+
+    def snapshot(self):
+        """
+        return the metrics as a dictionary (timers in ms)
+        """
+        rates = {name: self.rate(name) for name in list(self.timers)}
+        with self._lock:
+            timers = {name: {"count": count,
+                             "total_ms": total * 1000,
+                             "mean_ms": total * 1000 / count if count else 0.0,
+                             "max_ms": peak * 1000,
+                             "per_s": rates.get(name, 0.0)}
+                      for name, (count, total, peak) in sorted(self.timers.items())}
+            return {"uptime_s": time.monotonic() - self.started,
+                    "timers": timers,
+                    "counters": dict(sorted(self.counters.items()))}
+
+    def summary(self):
+        """
+        return the metrics as lines of text
+        """
+        snapshot = self.snapshot()
+        lines = ["{:24s} {:>8s} {:>10s} {:>9s} {:>9s} {:>8s}".format("timer", "calls", "total ms", "mean ms", "max ms", "/s")]
+        for name, t in snapshot["timers"].items():
+            lines.append("{:24s} {:8d} {:10.1f} {:9.2f} {:9.2f} {:8.1f}".format(
+                         name, t["count"], t["total_ms"], t["mean_ms"], t["max_ms"], t["per_s"]))
+        if snapshot["counters"]:
+            lines.append("")
+            lines.extend("{:24s} {:8d}".format(name, n) for name, n in snapshot["counters"].items())
+        return lines
+
+    def dump(self, path):
+        """
+        write the metrics as JSON in path
+        """
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+            f.write("\n")
+
+
+METRICS = Metrics()
+
+
+def dump_at_exit(path=None):
+    """
+    dump METRICS as JSON in path (default $PHOTOGEOTAGGER_METRICS) when the program exits
+    return the path or None
+    """
+    path = path or os.environ.get("PHOTOGEOTAGGER_METRICS")
+    if not path:
+        return None
+
+    def dump():
+        try:
+            METRICS.dump(path)
+        except OSError as e:
+            print("error writing metrics {}: {}".format(path, e))
+
+    atexit.register(dump)
+    return path
+
+
+class Profiler:
+    """
+    CPU profile (cProfile) and memory allocations (tracemalloc) between start and stop
+    """
+
+    def __init__(self):
+        self._profile = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        if self.running:
+            return
+        tracemalloc.start(TRACE_FRAMES)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self, directory):
+        """
+        stop the capture and write profile-TIME.prof (pstats), profile-TIME.txt (top functions)
+        and memory-TIME.txt (top allocations) in directory
+        return the list of paths written
+        """
+        if not self.running:
+            return []
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        memory = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        paths = [os.path.join(directory, name.format(stamp))
+                 for name in ("profile-{}.prof", "profile-{}.txt", "memory-{}.txt")]
+
+        profile.dump_stats(paths[0])
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(REPORT_LINES)
+        with open(paths[1], "w") as f:
+            f.write(text.getvalue())
+
+        with open(paths[2], "w") as f:
+            stats = memory.statistics("lineno")
+            f.write("{:.1f} MB allocated\n\n".format(sum(stat.size for stat in stats) / 1024 / 1024))
+            for stat in stats[:REPORT_LINES]:
+                f.write("{}\n".format(stat))
+        return paths
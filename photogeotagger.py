@@ -12,16 +12,26 @@ change the tile layer:
 https://stackoverflow.com/questions/33759578/how-to-change-base-layer-using-js-and-leaflet-layers-control
 """
 
+import time
+import gc
+
+# start of the program, the startup steps are timed from it
+STARTED = time.perf_counter()
+
 import sys
 import os
-import glob
-import fractions
+import json
 import math
-from PyQt5.QtCore import *
-from PyQt5.QtGui import *
-from PyQt5.QtWidgets import *
-from PyQt5.QtWebEngineWidgets import *
-from PyQt5.Qt import *
+import threading
+import collections
+import concurrent.futures
+from PyQt5.QtCore import (Qt, QObject, QThread, QTimer, QEventLoop, QSize, QCoreApplication, QItemSelection,
+                          QItemSelectionModel,
+                          pyqtSignal, QT_VERSION_STR, PYQT_VERSION_STR)
+from PyQt5.QtGui import QIcon, QKeySequence, QFontDatabase
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QAction, QStatusBar, QDockWidget, QLabel,
+                             QPlainTextEdit, QProgressBar, QPushButton, QMessageBox, QInputDialog, QFileDialog,
+                             QLineEdit, QListView, QAbstractItemView, QSplitter, QHBoxLayout, QVBoxLayout, qApp)
 
 try:
     import pyexiv2
@@ -29,77 +39,79 @@ except:
     print("pyexiv2 is not installed. ")
     sys.exit(1)
 
+from scanner import ScanEngine, DEFAULT_WORKERS, EXTENSIONS, walk_pictures, parse_extensions
+from thumbnails import ThumbnailPipeline, dhash_pixels
+from thumbcache import MetadataCache, DEFAULT_MAX_BYTES
+from photomodel import PhotoListModel, ThumbnailLoader
+from writer import BatchWriter, DEFAULT_WORKERS as DEFAULT_WRITE_WORKERS
+from markers import MarkerLayer
+from catalog import Catalog
+from dirwatcher import DirectoryWatcher
+from autofill import autofill, DEFAULT_WINDOW as DEFAULT_AUTOFILL_WINDOW
+from journal import EditJournal, FSYNC_INTERVAL
+from workspace import Workspace, workspace_path, list_workspaces
+from exifpatch import INDEXES
+from metrics import METRICS, Profiler, dump_at_exit
+from duplicates import dhash_batch, group_duplicates, DEFAULT_DISTANCE as DEFAULT_DUPLICATE_DISTANCE
+from exporters import catalog_records, export_file, read_positions, match_positions, format_from_name
+from tilecache import TileCache, TileServer, tiles_server, MAPBOX_TOKEN, DEFAULT_MAX_BYTES as DEFAULT_TILES_MAX_BYTES
+
 __version__ = 0.5
 __version_date__ = "2018-09-25"
 
-THUNDERFOREST_API_KEY = os.environ["TF_API_KEY"]
-MAPBOX_TOKEN = os.environ["MAPBOX_TOKEN"]
+defaultServer = "mapbox" if MAPBOX_TOKEN else "OSM"
 
-tiles_server = {"Outdoors": f"https://tile.thunderforest.com/outdoors/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}",
-                "OpenCycleMap": f"https://tile.thunderforest.com/cycle/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}",
-                "Landscape": f"https://tile.thunderforest.com/landscape/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}", 
-                "OSM": "https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png",
-                "mapbox": f"https://api.tiles.mapbox.com/v4/{{id}}/{{z}}/{{x}}/{{y}}.png?access_token={MAPBOX_TOKEN}",
-}
-
-defaultServer = tiles_server["mapbox"]
+# maximum size of the tiles cache of each tile server
+TILES_MAX_BYTES = DEFAULT_TILES_MAX_BYTES
 
 THUMBNAIL_SIZE = 128
 
-defaultLat = 45.03
-defaultLon = 7.66
-defaultZoom = 12
-GPS = "Exif.GPSInfo.GPS"
+# number of workers used to scan the pictures, processes are used for metadata if SCAN_USE_PROCESSES
+SCAN_WORKERS = DEFAULT_WORKERS
+SCAN_USE_PROCESSES = False
 
-HTML = """
-<html>
-<head>
-<style>#map { position:absolute; left:0; top:0; bottom:0; width:100%%; }</style></head>
-<body>
-<script src="https://unpkg.com/leaflet@1.3.4/dist/leaflet.js"></script>
-<link rel="stylesheet" href="https://unpkg.com/leaflet@1.3.4/dist/leaflet.css" />
-<script src="qrc:///qtwebchannel/qwebchannel.js"></script>
-<script>    
-new QWebChannel(qt.webChannelTransport, function (channel) { window.bridge = channel.objects.bridge;});
-</script>
+# number of workers used to write the positions
+WRITE_WORKERS = DEFAULT_WRITE_WORKERS
 
-<div id="map"></div>
+# maximum size of the thumbnails in the persistent cache
+CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
 
-<script>
-var map = L.map('map').setView([%(defaultLat)f, %(defaultLon)f], %(defaultZoom)f);
+# part of the size of the view added on each side when the markers in view are sent
+VIEW_MARGIN = 0.5
 
-L.tileLayer('%(defaultServer)s', { attribution: '&copy; <a href="http://osm.org/copyright">OpenStreetMap</a> contributors'}).addTo(map);
+# distance (pixels) of the photos found by a click on the map
+NEAREST_PIXELS = 24
 
-map.on('click', function(e) { window.bridge.print(e.latlng.lat + "|" + e.latlng.lng)})
-map.on('moveend', function(e) {window.bridge.get_zoom(map.getZoom())})
+# the scanned pictures are sent to the GUI by batches of at most SCAN_BATCH pictures,
+# at least every SCAN_BATCH_INTERVAL seconds; the scan waits when SCAN_BATCHES_IN_FLIGHT
+# batches are not yet added by the GUI
+SCAN_BATCH = 256
+SCAN_BATCH_INTERVAL = 0.05
+SCAN_BATCHES_IN_FLIGHT = 4
 
-</script>
-</body>
-</html>
-""" % globals()
+# number of pictures whose perceptual hashes are computed at once
+HASH_BATCH = 256
 
+# refresh interval (ms) of the metrics panel
+METRICS_REFRESH = 1000
 
-class Fraction(fractions.Fraction):
-    def __new__(cls, value, ignore=None):
-        return fractions.Fraction.from_float(value).limit_denominator(99999)
+# time (ms) after the window is shown before the web engine of the map is created
+MAP_DELAY = 50
+
+defaultLat = 45.03
+defaultLon = 7.66
+defaultZoom = 12
 
-def decimal_to_dms(decimal):
-    """
-    Convert decimal degrees into degrees, minutes, seconds.
-    """
-    remainder, degrees = math.modf(abs(decimal))
-    remainder, minutes = math.modf(remainder * 60)
-    return [Fraction(n) for n in (degrees, minutes, remainder * 60)]
 
-def decCoordinate(ref, coord):
+def startup_step(name):
     """
-    Convert degree, minutes coordinates to decimal coordinates
+    record the time since the start of the program of a startup step (once)
     """
-    deg, min, sec = coord.split(" ")
-    coordDec = eval(deg) + eval(min)/60 + eval(sec)/3600
-    if ref in ["S", "W"]:
-        coordDec =- coordDec
-    return coordDec
+    if name not in METRICS.timers:
+        METRICS.add(name, time.perf_counter() - STARTED)
+
+
+startup_step("startup.imports")
 
 
 def MessageDialog(title, text, buttons):
@@ -118,148 +130,263 @@ def MessageDialog(title, text, buttons):
     return message.clickedButton().text()
 
 
-class WebPage(QWebEnginePage):
-    
-    def __init__(self, parent=None):
-        super(WebPage, self).__init__(parent)
-        self.parent = parent
+class MySignal(QObject):
+    sig = pyqtSignal(str)
+    # generation of the scan, [(path, gps, datetime), ...]
+    coords = pyqtSignal(int, list)
+    # directory, [(path, mtime_ns, size), ...]
+    directory = pyqtSignal(str, list)
 
-    def javaScriptConsoleMessage(self, level, msg, linenumber, source_id):
-        try:
-            print('%s:%s: %s' % (source_id, linenumber, msg))
-        except OSError:
-            pass
 
-    @pyqtSlot(int)
-    def get_zoom(self, z):
+class MyLongThread(QThread):
+
+    def __init__(self, parent = None):
+        QThread.__init__(self, parent)
+        # directories or pictures to scan
+        self.picturesPaths = []
+        self.signal = MySignal()
+        self.workers = SCAN_WORKERS
+        self.use_processes = SCAN_USE_PROCESSES
+        self.engine = None
+        self.cache = None
+        self.recursive = False
+        self.extensions = EXTENSIONS
+        # pictures to scan instead of picturesPaths (changes found by the directory watcher)
+        self.files = None
+        # {path: (mtime_ns, size)} of the pictures already loaded, not scanned again if not modified
+        self.known = {}
+        # pictures found in picturesPaths by the last scan
+        self.seen = set()
+        # incremented when the pictures are closed: the batches of an older scan still queued are dropped
+        self.generation = 0
+        # emission times of the batches not yet received (delivery latency)
+        self.emitted = collections.deque()
+        # batches sent and not yet added by the GUI (released by batch_done)
+        self.inFlight = threading.Semaphore(SCAN_BATCHES_IN_FLIGHT)
+
+    def start(self, *args):
+        # the engine exists before the thread runs so that a cancel right after start is not lost
+        self.engine = ScanEngine(self.workers, self.use_processes, cache=self.cache)
+        QThread.start(self, *args)
+
+    def cancel(self):
         """
-        update zoom value from leaflet value
+        stop the running scan
         """
+        if self.engine:
+            self.engine.cancel()
 
-        print("zoom", z)
-        self.parent.zoom = z
-        self.parent.statusbar.showMessage("Zoom: {}".format(z), 0)
-
-
-    @pyqtSlot(str)
-    def print(self, text):
-        print('From JS:', text)
-        
-        click_lat, click_long = [float(x) for x in text.split('|')]
-        print(click_lat, click_long)
-
-        
-        self.parent.statusbar.showMessage('Position %.6f, %.6f  ' % (click_lat, click_long ), 0)
-
-
-        '''
-        if self.parent.listWidget.selectedItems():
-            self.parent.removeAllMarkers()
-        '''
-
-        for item in self.parent.listWidget.selectedItems():
-
-            flagChanged = False
-
-            if self.parent.gps_dict[ item.text() ]['gps'] == (0.0, 0.0, 0.0):
-                flagChanged = True
-
-                b = QBrush()
-                b.setColor(QColor(0,0,0))
-                item.setForeground( b)
-
-            else:
-
-                if MessageDialog("photoGeoTagger", "Replace current position?", ['Yes', 'No']) == 'Yes':
-                    flagChanged = True
-
-            if flagChanged:
-
-                    self.parent.gps_dict[ item.text()]['gps'] = ( click_lat, click_long,  0.0)
-
-                    id = item.text().replace("-", "")
-                    s = "m%(id)s = new L.Marker([%(lat)f, %(lon)f], {draggable:true});map.addLayer(m%(id)s);m%(id)s.bindPopup('%(id)s').openPopup();" % {'lat':click_lat, 'lon':click_long, 'id': id}
-
-                    self.parent.browser.page().runJavaScript(s)
-                    self.parent.memMarker.append(id)
+    def pictures(self):
+        """
+        yield the pictures of picturesPaths as the directories are read
+        """
+        for directory, files in walk_pictures(self.picturesPaths, self.recursive, self.extensions):
+            if self.engine.cancelled:
+                return
+            if directory is not None:
+                self.signal.directory.emit(directory, files)
+            for path, mtime, size in files:
+                self.seen.add(path)
+                if self.known.get(path) != (mtime, size):
+                    yield path
 
-                    self.parent.get_map(click_lat, click_long, self.parent.zoom)
+    def run(self):
 
-                    self.parent.statusbar.showMessage("Set picture position %.6f, %.6f  " % (click_lat, click_long ), 0)
+        self.seen = set()
+        imgList = self.files if self.files is not None else self.pictures()
+
+        # only the positions are read (engine created by start), the thumbnails are loaded on demand by the list model
+        # coordinates are streamed in the order of the pictures, directory by directory, by batches
+        batch = []
+        sent = time.monotonic()
+        t0 = time.perf_counter()
+        for coord, _ in self.engine.scan(imgList):
+            METRICS.add("scan.wait", time.perf_counter() - t0)
+            batch.append((coord['filename'], coord['gps'], coord.get('datetime')))
+            if len(batch) >= SCAN_BATCH or time.monotonic() - sent >= SCAN_BATCH_INTERVAL:
+                if not self.send(batch):
+                    break
+                batch = []
+                sent = time.monotonic()
+            t0 = time.perf_counter()
+        if batch and not self.engine.cancelled:
+            self.send(batch)
+
+        if self.engine.cancelled:
+            self.signal.sig.emit('cancelled')
+
+    def send(self, batch):
+        """
+        emit a batch of pictures, wait while too many batches are not added by the GUI
+        return False if the scan was cancelled while waiting
+        """
+        t0 = time.perf_counter()
+        while not self.inFlight.acquire(timeout=0.1):
+            if self.engine.cancelled:
+                return False
+        METRICS.add("scan.backpressure", time.perf_counter() - t0)
+        self.emitted.append(time.perf_counter())
+        self.signal.coords.emit(self.generation, batch)
+        return True
+
+    def batch_done(self):
+        """
+        a batch was added by the GUI
+        """
+        self.inFlight.release()
 
-                    self.parent.changed.append( item.text() )
 
 
-class MySignal(QObject):
-    sig = pyqtSignal(str)
-    coord = pyqtSignal(dict)
-    thumbnail = pyqtSignal(QImage, str)
+class SaveSignal(QObject):
+    progress = pyqtSignal(int, int)
+    report = pyqtSignal(list)
 
 
-class MyLongThread(QThread):
+class SaveThread(QThread):
+    """
+    write the positions of jobs (list of (path, gps)) with a BatchWriter
+    """
 
     def __init__(self, parent = None):
         QThread.__init__(self, parent)
-        self.picturesPath = ""
-        self.signal = MySignal()
+        self.jobs = []
+        self.signal = SaveSignal()
+        self.workers = WRITE_WORKERS
+        self.writer = None
+        # GeoNames dump used to write city, region and country (None to keep the location tags)
+        self.gazetteerPath = None
+        self.gazetteer = None
+        # patch the GPS tags in place (fast, not crash safe) instead of rewriting a copy renamed over the photo
+        self.inPlace = False
+
+    def cancel(self):
+        if self.writer:
+            self.writer.cancel()
 
     def run(self):
+        gazetteer = None
+        if self.gazetteerPath:
+            # loaded once, in this thread
+            if self.gazetteer is None or self.gazetteer[0] != self.gazetteerPath:
+                from gazetteer import Gazetteer
+                try:
+                    self.gazetteer = (self.gazetteerPath, Gazetteer.load(self.gazetteerPath))
+                except Exception as e:
+                    print("error reading gazetteer {}: {}".format(self.gazetteerPath, e))
+                    self.gazetteer = None
+            if self.gazetteer is not None:
+                gazetteer = self.gazetteer[1]
+
+        self.writer = BatchWriter(self.workers, gazetteer, in_place=self.inPlace)
+        report = self.writer.write(self.jobs, progress=self.signal.progress.emit)
+        self.signal.report.emit(report)
+
+
+class HashSignal(QObject):
+    progress = pyqtSignal(int, int)
+    # {path: hash}
+    hashes = pyqtSignal(dict)
+
+
+class HashThread(QThread):
+    """
+    compute the perceptual hashes of paths from their thumbnails, the hashes are stored in the cache
+    """
 
-        path = self.picturesPath
-
-        if os.path.isdir(path):
-            imgList = sorted(glob.glob(path + "/*.jpg") + glob.glob(path + "/*.JPG"))
-
-        if os.path.isfile(path):
-            imgList = [path]
+    def __init__(self, thumbnailer, parent = None):
+        QThread.__init__(self, parent)
+        self.thumbnailer = thumbnailer
+        self.paths = []
+        self.cache = None
+        self.workers = SCAN_WORKERS
+        self.signal = HashSignal()
+        self._cancel = False
+
+    def start(self, *args):
+        # reset before the thread runs so that a cancel right after start is not lost
+        self._cancel = False
+        QThread.start(self, *args)
+
+    def cancel(self):
+        self._cancel = True
+
+    def pixels(self, path):
+        """
+        return the pixels of the hash of path or None if the picture can not be read
+        """
+        try:
+            entry = self.cache.get(path) if self.cache is not None else None
+            image = self.thumbnailer.decode(entry[1]) if entry and entry[1] else None
+            if image is None:
+                image = self.thumbnailer(path)
+            return None if image.isNull() else dhash_pixels(image)
+        except Exception as e:
+            print("error reading {}: {}".format(path, e))
+            return None
 
-        self.changed =  []
+    def run(self):
+        hashes = {}
+        missing = []
+        for path in self.paths:
+            h = self.cache.get_dhash(path) if self.cache is not None else None
+            if h is None:
+                missing.append(path)
+            else:
+                hashes[path] = h
 
-        for pic in sorted(imgList):
-            print('processing {}'.format(pic))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for start in range(0, len(missing), HASH_BATCH):
+                if self._cancel:
+                    break
+                batch = missing[start:start + HASH_BATCH]
+                with METRICS.timer("duplicates.batch"):
+                    read = [(path, pixels) for path, pixels in zip(batch, pool.map(self.pixels, batch)) if pixels]
+                    for (path, _), h in zip(read, dhash_batch([pixels for _, pixels in read])):
+                        hashes[path] = h
+                        if self.cache is not None:
+                            self.cache.put_dhash(path, h)
+                self.signal.progress.emit(start + len(batch), len(missing))
 
-            label = os.path.basename(pic).replace('.jpg','').replace('.JPG','')
+        if self.cache is not None:
+            self.cache.flush()
+        self.signal.hashes.emit(hashes)
 
-            # read GPS exif tag
-            metadata = pyexiv2.ImageMetadata(pic)
-            metadata.read()
-            latRaw, lonRaw = 0, 0
-            try:
-                latRaw = metadata['Exif.GPSInfo.GPSLatitude'].raw_value
-                latRef = metadata['Exif.GPSInfo.GPSLatitudeRef'].raw_value
-                lonRaw = metadata['Exif.GPSInfo.GPSLongitude'].raw_value
-                lonRef = metadata['Exif.GPSInfo.GPSLongitudeRef'].raw_value
-            except KeyError:
-                pass
-
-            if latRaw and lonRaw:
-                #self.gps_dict[ label ] = {'gps': (decCoordinate(latRef, latRaw), decCoordinate(lonRef, lonRaw), 0.0),  'filename': pic}
-                self.signal.coord.emit({'gps': (decCoordinate(latRef, latRaw), decCoordinate(lonRef, lonRaw), 0.0),  'filename': pic})
-            else:
-                #self.gps_dict[ label ] = {'gps': (0, 0, 0), 'filename': pic}
-                self.signal.coord.emit({'gps': (0, 0, 0), 'filename': pic})
 
-            i = QImage(pic).scaledToWidth(THUMBNAIL_SIZE)
-            self.signal.thumbnail.emit(i, label)
+class PrefetchSignal(QObject):
+    progress = pyqtSignal(int, int)
+    message = pyqtSignal(str)
 
 
-            # filename in red for pictures with no location
-            '''
-            if self.gps_dict[ label]['gps'] == (0, 0, 0):
-                b = QBrush()
-                b.setColor(QColor(255,0,0))
-                configButton.setForeground( b)
-            '''
+class PrefetchThread(QThread):
+    """
+    download the tiles of bbox at zoom levels zooms in the tile cache
+    """
 
+    def __init__(self, tileCache, parent = None):
+        QThread.__init__(self, parent)
+        self.tileCache = tileCache
+        self.layer = defaultServer
+        self.bbox = None
+        self.zooms = []
+        self.signal = PrefetchSignal()
+        self._cancel = False
 
-        '''
-        if len(imgList) == 1:
-            print 'set current item',self.listWidget.item(0)
-            self.listWidget.setCurrentItem(self.listWidget.item(0))
-        '''
+    def start(self, *args):
+        # reset before the thread runs so that a cancel right after start is not lost
+        self._cancel = False
+        QThread.start(self, *args)
 
-        '''self.signal.sig.emit('OK')'''
+    def cancel(self):
+        self._cancel = True
 
+    def run(self):
+        try:
+            n = self.tileCache.prefetch(self.layer, self.bbox, self.zooms, progress=self.signal.progress.emit,
+                                        cancelled=lambda: self._cancel)
+        except ValueError as e:
+            self.signal.message.emit(str(e))
+            return
+        self.signal.message.emit("{} tiles downloaded".format(n))
 
 
 class MainWindow(QMainWindow):
@@ -267,7 +394,8 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
 
-        self.changed = []
+        # positions of the loaded photos
+        self.catalog = Catalog()
 
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
@@ -281,12 +409,44 @@ class MainWindow(QMainWindow):
         self.actionClear = QAction("Clear", self)
         self.actionClear.setObjectName("actionClear")
 
+        self.actionStop_loading = QAction("Stop loading photos", self)
+        self.actionStop_loading.setObjectName("actionStop_loading")
+        self.actionStop_loading.setShortcut('Esc')
+
+        self.actionGeotag_from_tracks = QAction("Geotag photos from track logs", self)
+        self.actionGeotag_from_tracks.setObjectName("actionGeotag_from_tracks")
+
+        self.actionAutofill = QAction("Fill positions from photos taken at the same time", self)
+        self.actionAutofill.setObjectName("actionAutofill")
+
+        self.actionExport = QAction("Export positions", self)
+        self.actionExport.setObjectName("actionExport")
+
+        self.actionImport = QAction("Import positions", self)
+        self.actionImport.setObjectName("actionImport")
+
+        self.actionNewWorkspace = QAction("New workspace", self)
+        self.actionNewWorkspace.triggered.connect(self.new_workspace)
+        self.actionOpenWorkspace = QAction("Open workspace", self)
+        self.actionOpenWorkspace.triggered.connect(lambda: self.open_workspace())
+        self.actionSaveWorkspace = QAction("Save workspace", self)
+        self.actionSaveWorkspace.triggered.connect(self.save_workspace)
+
         exitAction = QAction(QIcon('exit.png'), '&Exit', self)
         exitAction.setShortcut('Ctrl+Q')
         exitAction.setStatusTip('Exit application')
         exitAction.triggered.connect(qApp.quit)
 
         fileMenu.addAction(self.actionLoad_photo_from_directory)
+        workspaceMenu = fileMenu.addMenu("Workspaces")
+        workspaceMenu.addAction(self.actionNewWorkspace)
+        workspaceMenu.addAction(self.actionOpenWorkspace)
+        workspaceMenu.addAction(self.actionSaveWorkspace)
+        fileMenu.addAction(self.actionStop_loading)
+        fileMenu.addAction(self.actionGeotag_from_tracks)
+        fileMenu.addAction(self.actionAutofill)
+        fileMenu.addAction(self.actionImport)
+        fileMenu.addAction(self.actionExport)
         fileMenu.addAction(self.actionSave_positions_to_photo)
         fileMenu.addAction(self.actionClear)
         fileMenu.addAction(exitAction)
@@ -295,7 +455,68 @@ class MainWindow(QMainWindow):
         actionServer = QAction("Tile server", self)
         actionServer.triggered.connect(self.select_tiles_server)
         fileMenu.addAction(actionServer)
+        actionWorkers = QAction("Scan workers", self)
+        actionWorkers.triggered.connect(self.select_scan_workers)
+        fileMenu.addAction(actionWorkers)
+        self.actionRecursive = QAction("Load photos of sub-directories", self)
+        self.actionRecursive.setCheckable(True)
+        fileMenu.addAction(self.actionRecursive)
+        actionExtensions = QAction("Photo file types", self)
+        actionExtensions.triggered.connect(self.select_extensions)
+        fileMenu.addAction(actionExtensions)
+        self.actionWatch = QAction("Watch directories for changes", self)
+        self.actionWatch.setCheckable(True)
+        self.actionWatch.setChecked(True)
+        self.actionWatch.toggled.connect(self.set_watching)
+        fileMenu.addAction(self.actionWatch)
+        self.actionPlaces = QAction("Write city, region and country", self)
+        self.actionPlaces.setCheckable(True)
+        self.actionPlaces.toggled.connect(self.set_write_places)
+        fileMenu.addAction(self.actionPlaces)
+        # off by default: a crash while patching can leave a photo with a mix of old and new values
+        self.actionInPlace = QAction("Fast save (patch GPS tags in place, not crash safe)", self)
+        self.actionInPlace.setCheckable(True)
+        self.actionInPlace.toggled.connect(self.set_in_place)
+        fileMenu.addAction(self.actionInPlace)
+        actionClearCache = QAction("Clear thumbnail cache", self)
+        actionClearCache.triggered.connect(self.clear_cache)
+        fileMenu.addAction(actionClearCache)
+        actionPrefetch = QAction("Prefetch tiles of current view", self)
+        actionPrefetch.triggered.connect(self.prefetch_tiles)
+        fileMenu.addAction(actionPrefetch)
+        self.actionOffline = QAction("Work offline", self)
+        self.actionOffline.setCheckable(True)
+        self.actionOffline.toggled.connect(self.set_offline)
+        fileMenu.addAction(self.actionOffline)
         
+        editMenu = menubar.addMenu('&Edit')
+        self.actionUndo = QAction("Undo", self)
+        self.actionUndo.setShortcut(QKeySequence.Undo)
+        self.actionUndo.triggered.connect(self.undo)
+        editMenu.addAction(self.actionUndo)
+        self.actionRedo = QAction("Redo", self)
+        self.actionRedo.setShortcut(QKeySequence.Redo)
+        self.actionRedo.triggered.connect(self.redo)
+        editMenu.addAction(self.actionRedo)
+        self.actionDuplicates = QAction("Find near-duplicate photos", self)
+        self.actionDuplicates.triggered.connect(self.find_duplicates)
+        editMenu.addAction(self.actionDuplicates)
+
+        toolsMenu = menubar.addMenu('&Tools')
+        self.actionMetrics = QAction("Show performance metrics", self)
+        self.actionMetrics.setCheckable(True)
+        toolsMenu.addAction(self.actionMetrics)
+        self.actionProfile = QAction("Profile CPU and memory", self)
+        self.actionProfile.setCheckable(True)
+        self.actionProfile.toggled.connect(self.set_profiling)
+        toolsMenu.addAction(self.actionProfile)
+        actionSaveMetrics = QAction("Save performance metrics", self)
+        actionSaveMetrics.triggered.connect(self.save_metrics)
+        toolsMenu.addAction(actionSaveMetrics)
+        actionResetMetrics = QAction("Reset performance metrics", self)
+        actionResetMetrics.triggered.connect(METRICS.reset)
+        toolsMenu.addAction(actionResetMetrics)
+
         menuHelp = menubar.addMenu('&Help')
 
         self.actionAbout = QAction("About", self)
@@ -309,24 +530,101 @@ class MainWindow(QMainWindow):
         self.actionSave_positions_to_photo.triggered.connect(self.save_positions)
         self.actionLoad_photo_from_directory.triggered.connect(self.load_directory_activated)
         self.actionClear.triggered.connect(self.clear)
+        self.actionStop_loading.triggered.connect(self.stop_loading)
+        self.actionGeotag_from_tracks.triggered.connect(self.geotag_from_tracks)
+        self.actionAutofill.triggered.connect(self.autofill_positions)
+        self.actionExport.triggered.connect(self.export_positions)
+        self.actionImport.triggered.connect(self.import_positions)
 
         self.actionAbout.triggered.connect(self.actionAbout_activated)
 
         self.statusbar = QStatusBar(self)
         self.setStatusBar(self.statusbar)
 
+        # live timers and counters of the hot paths
+        self.metricsDock = QDockWidget("Performance", self)
+        self.metricsDock.setObjectName("metricsDock")
+        self.metricsText = QPlainTextEdit()
+        self.metricsText.setReadOnly(True)
+        self.metricsText.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.metricsText.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.metricsDock.setWidget(self.metricsText)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.metricsDock)
+        self.metricsDock.hide()
+        self.metricsDock.visibilityChanged.connect(self.actionMetrics.setChecked)
+        self.actionMetrics.toggled.connect(self.metricsDock.setVisible)
+        self.metricsTimer = QTimer(self)
+        self.metricsTimer.timeout.connect(self.update_metrics)
+        self.metricsTimer.start(METRICS_REFRESH)
+        self.profiler = Profiler()
+
+        try:
+            self.cache = MetadataCache(max_bytes=CACHE_MAX_BYTES)
+        except Exception as e:
+            print("thumbnail cache not available: {}".format(e))
+            self.cache = None
+
         self.longthread = MyLongThread()
+        self.longthread.cache = self.cache
         self.longthread.finished.connect(self.terminated)
-        self.longthread.signal.coord.connect(self.addCoord)
-        self.longthread.signal.thumbnail.connect(self.addThumbnail)
+        self.longthread.signal.coords.connect(self.addCoords)
+        self.longthread.signal.sig.connect(self.scan_message)
+        self.longthread.signal.directory.connect(self.watch_directory)
+
+        self.extensions = EXTENSIONS
+        self.watcher = DirectoryWatcher(self)
+        self.watcher.changed.connect(self.files_changed)
+        # pictures added or modified waiting for longthread
+        self.pendingFiles = []
+
+        # workspace opened (None if no workspace), directories or pictures loaded
+        self.workspace = None
+        self.folders = []
+        # pictures of the workspace added from the cache, removed if not found by the scan
+        self.preloaded = set()
+
+        # undo/redo of the position changes, replayed after a crash
+        self.journal = EditJournal()
+        self.recovered = {}
+        self.journalTimer = QTimer(self)
+        self.journalTimer.timeout.connect(self.journal.sync)
+        self.journalTimer.start(int(FSYNC_INTERVAL * 1000))
+        self.update_undo_actions()
+        QTimer.singleShot(0, self.recover_journal)
+
+        self.saving = {}
+        self.savePending = False
+        self.saveStarted = 0
+        self.savethread = SaveThread()
+        self.savethread.signal.progress.connect(self.save_progress)
+        self.savethread.signal.report.connect(self.save_report)
+
+        self.saveProgress = QProgressBar()
+        self.saveProgress.setMaximumWidth(200)
+        self.saveProgress.hide()
+        self.statusbar.addPermanentWidget(self.saveProgress)
+        self.saveCancel = QPushButton("Cancel")
+        self.saveCancel.clicked.connect(self.cancel_saving)
+        self.saveCancel.hide()
+        self.statusbar.addPermanentWidget(self.saveCancel)
         
-        self.gps_dict = {}
         self.lat = defaultLat
         self.long = defaultLon
         self.zoom = defaultZoom
+        # (south, west, north, east) of the markers sent to the map, None for all
+        self.viewBounds = None
         self.memPosition = (0, 0, 0)
+        self.cameraOffset = "+00:00"
+        self.autofillWindow = DEFAULT_AUTOFILL_WINDOW
         
-        self.memMarker = []
+        self.markerLayer = MarkerLayer()
+
+        self.tileLayer = defaultServer
+        self.tileCache = TileCache(max_bytes=TILES_MAX_BYTES)
+        self.tileServer = TileServer(self.tileCache).start()
+        self.prefetchthread = PrefetchThread(self.tileCache)
+        self.prefetchthread.signal.progress.connect(self.prefetch_progress)
+        self.prefetchthread.signal.message.connect(self.prefetch_message)
 
         _widget = QWidget()
 
@@ -336,44 +634,68 @@ class MainWindow(QMainWindow):
         self.splitter = QSplitter(_widget)
         self.splitter.setOrientation(Qt.Horizontal)
 
-        self.listWidget = QListWidget(self.splitter)
-        self.listWidget.width()
-        self.listWidget.setViewMode(QListView.IconMode)
-        self.listWidget.setIconSize(QSize(128, 128))
-        self.listWidget.setMovement(QListView.Static)
-        self.listWidget.setMaximumWidth(256)
-        self.listWidget.setSpacing(12)
-        self.listWidget.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.thumbnailer = ThumbnailPipeline(THUMBNAIL_SIZE)
+        self.thumbnailLoader = ThumbnailLoader(self.thumbnailer, self.cache, parent=self)
+        self.model = PhotoListModel(self.thumbnailLoader, self.catalog, THUMBNAIL_SIZE, self)
+
+        self.listView = QListView(self.splitter)
+        self.listView.setViewMode(QListView.IconMode)
+        self.listView.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.listView.setMovement(QListView.Static)
+        self.listView.setResizeMode(QListView.Adjust)
+        self.listView.setMinimumWidth(THUMBNAIL_SIZE + 48)
+        self.listView.setMaximumWidth(256)
+        self.listView.setSpacing(12)
+        # uniform sizes: the view does not ask the model for the thumbnails of hidden rows
+        self.listView.setUniformItemSizes(True)
+        self.listView.setLayoutMode(QListView.Batched)
+        self.listView.setBatchSize(256)
+        self.listView.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.listView.setModel(self.model)
         
-        self.listWidget.setContextMenuPolicy(Qt.ActionsContextMenu)
-        self.actionCopyPosition = QAction("Copy position", self.listWidget)
-        self.listWidget.addAction(self.actionCopyPosition)
+        self.listView.setContextMenuPolicy(Qt.ActionsContextMenu)
+        self.actionCopyPosition = QAction("Copy position", self.listView)
+        self.listView.addAction(self.actionCopyPosition)
         self.actionCopyPosition.triggered.connect(self.copyPosition)
 
-        self.actionPastePosition = QAction("Paste position", self.listWidget)
-        self.listWidget.addAction(self.actionPastePosition)
+        self.actionPastePosition = QAction("Paste position", self.listView)
+        self.listView.addAction(self.actionPastePosition)
         self.actionPastePosition.triggered.connect(self.pastePosition)
 
-        self.actionDeletePosition = QAction("Delete position", self.listWidget)
-        self.listWidget.addAction(self.actionDeletePosition)
+        self.actionDeletePosition = QAction("Delete position", self.listView)
+        self.listView.addAction(self.actionDeletePosition)
         self.actionDeletePosition.triggered.connect(self.delete_position)
 
+        self.actionSelectDuplicates = QAction("Select near-duplicates", self.listView)
+        self.listView.addAction(self.actionSelectDuplicates)
+        self.actionSelectDuplicates.triggered.connect(self.select_duplicates)
 
-        self.listWidget.itemSelectionChanged.connect(self.itemSelectionChanged)
-        
-        self.hbox.addWidget(self.listWidget)
+        # perceptual hashes of the photos {path: hash} and groups of near-duplicates {catalog index: group}
+        self.hashes = {}
+        self.duplicateGroups = {}
+        self.hashthread = HashThread(self.thumbnailer)
+        self.hashthread.cache = self.cache
+        self.hashthread.signal.progress.connect(self.hash_progress)
+        self.hashthread.signal.hashes.connect(self.hashes_done)
 
-        # self.browser = QWebEngineView(self.splitter)
-        self.browser = QWebEngineView()
-        self.p = WebPage(self)
-        self.browser.setPage(self.p)
-        c = QWebChannel(self)
-        c.registerObject('bridge', self.p)
-        self.p.setWebChannel(c)
-        self.browser.setHtml(HTML)
 
+        self.listView.selectionModel().selectionChanged.connect(self.itemSelectionChanged)
         
-        self.hbox.addWidget(self.browser)
+        self.hbox.addWidget(self.listView)
+
+        # the web engine is created once the window is shown (init_map), the photo list is usable before
+        self.browser = None
+        self.mapReady = False
+        # scripts run before the map is ready: [(script, callback), ...]
+        self.jsQueue = []
+        self.mapPlaceholder = QLabel("Loading map...")
+        self.mapPlaceholder.setAlignment(Qt.AlignCenter)
+        self.hbox.addWidget(self.mapPlaceholder, 1)
+        QTimer.singleShot(MAP_DELAY, self.init_map)
+        # quit once the first thumbnail is shown and the map is ready (startup benchmark)
+        self.exitAfterStartup = False
+        self.thumbnailLoader.loaded.connect(self.first_thumbnail)
+
         # self.hbox.addWidget(self.splitter)
         self.vbox.addLayout(self.hbox)
         _widget.setLayout(self.vbox)
@@ -386,51 +708,566 @@ class MainWindow(QMainWindow):
 
         if ok and item:
            print(item)
-           s = "L.tileLayer('{}').addTo(map);".format(tiles_server[item])
-           self.browser.page().runJavaScript(s)
+           self.tileLayer = item
+           s = "setTileLayer({});".format(json.dumps(self.tileServer.tile_url(item)))
+           self.run_js(s)
+
+    def set_offline(self, offline):
+        """
+        use only the cached tiles
+        """
+        self.tileCache.offline = offline
+
+    def prefetch_tiles(self):
+        """
+        download the tiles of the current view for zoom levels chosen by user
+        """
+        if self.prefetchthread.isRunning():
+            self.statusbar.showMessage("Tiles are downloading", 5000)
+            return
+        self.run_js("[map.getBounds().getSouth(), map.getBounds().getWest(), "
+                    "map.getBounds().getNorth(), map.getBounds().getEast()];",
+                    self.prefetch_bounds)
+
+    def prefetch_bounds(self, bbox):
+        if not bbox:
+            return
+        text, ok = QInputDialog.getText(self, "Prefetch tiles", "Zoom levels (e.g. 10-16)",
+                                        QLineEdit.Normal, "{}-{}".format(self.zoom, min(self.zoom + 4, 18)))
+        if not ok:
+            return
+        try:
+            first, _, last = text.partition("-")
+            zooms = range(int(first), int(last or first) + 1)
+        except ValueError:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Invalid zoom levels: {}".format(text))
+            return
+
+        self.prefetchthread.layer = self.tileLayer
+        self.prefetchthread.bbox = bbox
+        self.prefetchthread.zooms = zooms
+        self.prefetchthread.start()
+
+    def prefetch_progress(self, done, total):
+        self.statusbar.showMessage("Downloading tiles {}/{}".format(done, total), 0)
+
+    def prefetch_message(self, msg):
+        self.statusbar.showMessage(msg, 0)
+
+    def update_metrics(self):
+        """
+        refresh the metrics panel and show the throughput of loading, thumbnails and saving
+        """
+        if not self.metricsDock.isVisible():
+            return
+        rates = "loading {:.0f}/s, thumbnails {:.0f}/s, saving {:.0f}/s".format(
+                METRICS.rate("scan.wait"), METRICS.rate("thumbnail.load"), METRICS.rate("write.file"))
+        thumbnails = "thumbnails: " + (self.thumbnailer.stats.summary() or "none")
+        self.metricsText.setPlainText("\n".join([rates, thumbnails, ""] + METRICS.summary()))
+
+    def set_profiling(self, profiling):
+        """
+        start the capture of the CPU profile and memory allocations, or stop it and write the reports
+        """
+        if profiling:
+            self.profiler.start()
+            self.statusbar.showMessage("Profiling started", 5000)
+            return
+        # the current directory if no directory is chosen
+        directory = QFileDialog.getExistingDirectory(self, "Save profile in directory", os.getcwd()) or os.getcwd()
+        paths = self.profiler.stop(directory)
+        self.statusbar.showMessage("Profile saved: " + ", ".join(os.path.basename(p) for p in paths), 0)
+
+    def save_metrics(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, "Save performance metrics", "metrics.json",
+                                                  "JSON (*.json);;All files (*)")
+        if not fileName:
+            return
+        try:
+            METRICS.dump(fileName)
+        except OSError as e:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Error writing {}: {}".format(fileName, e))
+
+    def select_scan_workers(self):
+        """
+        set the number of workers used to scan the pictures
+        """
+        n, ok = QInputDialog.getInt(self, "Scan workers", "Number of workers", self.longthread.workers, 1, 64)
+        if ok:
+            self.longthread.workers = n
+
+    def select_extensions(self):
+        """
+        set the file types of the photos loaded from directories
+        """
+        text, ok = QInputDialog.getText(self, "Photo file types", "Extensions",
+                                        QLineEdit.Normal, " ".join(self.extensions))
+        if not ok:
+            return
+        try:
+            self.extensions = parse_extensions(text)
+        except ValueError:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Invalid extensions: {}".format(text))
+
+    def set_write_places(self, write):
+        """
+        write the city, region and country of the positions found in a GeoNames dump
+        """
+        if not write:
+            self.savethread.gazetteerPath = None
+            return
+        fileName, _ = QFileDialog.getOpenFileName(self, "GeoNames dump (e.g. cities1000.zip)", os.getcwd(),
+                                                  "GeoNames dump (*.txt *.zip);;All files (*)")
+        if not fileName:
+            self.actionPlaces.setChecked(False)
+            return
+        self.savethread.gazetteerPath = fileName
+
+    def set_in_place(self, inPlace):
+        """
+        patch the GPS tags of the photos in place when saving instead of rewriting them atomically
+        """
+        self.savethread.inPlace = inPlace
+
+    def set_watching(self, watching):
+        """
+        stop watching the directories, or watch the directories loaded from now
+        """
+        if not watching:
+            self.watcher.clear()
+
+    def watch_directory(self, directory, files):
+        """
+        directory read by longthread
+        """
+        if self.actionWatch.isChecked():
+            self.watcher.set_directory(directory, files)
+
+    def files_changed(self, added, removed, modified):
+        """
+        pictures added, removed or modified in a watched directory
+        """
+        self.model.removeIndices([self.catalog.remove(path) for path in removed])
+        for path in modified:
+            self.model.forgetThumbnail(path)
+            self.hashes.pop(path, None)
+        if removed:
+            self.update_markers()
+
+        self.pendingFiles.extend(added + modified)
+        self.scan_pending()
+
+    def scan_pending(self):
+        """
+        scan the pictures found by the directory watcher if longthread is not running
+        """
+        if not self.pendingFiles or self.longthread.isRunning():
+            return
+        self.longthread.files, self.pendingFiles = self.pendingFiles, []
+        self.longthread.start()
+
+    def clear_cache(self):
+        """
+        delete all entries of the thumbnail cache
+        """
+        if self.cache is None:
+            return
+        if self.longthread.isRunning():
+            self.statusbar.showMessage("Photos are loading, retry later", 5000)
+            return
+        self.cache.clear()
+        self.statusbar.showMessage("Thumbnail cache cleared", 5000)
+
+    def stop_loading(self):
+        """
+        cancel the running scan
+        """
+        if self.longthread.isRunning():
+            self.longthread.cancel()
+
+    def scan_message(self, msg):
+        """
+        message from longthread
+        """
+        if msg == 'cancelled':
+            self.statusbar.showMessage("Loading of photos cancelled", 5000)
 
     def terminated(self):
         """
         longthread terminated
         """
-        self.listWidget.setMinimumWidth(self.listWidget.sizeHintForColumn(0))
-        self.statusbar.showMessage("Photos loaded from directory")
+        if not self.longthread.engine or not self.longthread.engine.cancelled:
+            if self.longthread.files is not None:
+                self.statusbar.showMessage("{} photos updated".format(len(self.longthread.files)), 5000)
+            else:
+                # thumbnails are loaded on demand: only those of the visible photos are counted here
+                summary = self.thumbnailer.stats.summary()
+                self.statusbar.showMessage("Photos loaded from directory" +
+                                           (" - thumbnails: " + summary if summary else ""))
+                # a new scan may have started before this signal was received
+                if not self.longthread.isRunning():
+                    self.remove_missing(self.preloaded - self.longthread.seen)
+        if self.longthread.files is None and not self.longthread.isRunning():
+            self.preloaded = set()
+        self.update_markers()
+        self.scan_pending()
+
+
+    def addCoords(self, generation, batch):
+        """
+        add a batch of pictures [(path, gps, datetime), ...] to catalog and list view in one model update
+        """
+        t0 = time.perf_counter()
+        if self.longthread.emitted:
+            METRICS.add("signal.batch", t0 - self.longthread.emitted.popleft())
+        if generation == self.longthread.generation:
+            self.add_pictures(batch)
+        self.longthread.batch_done()
+        METRICS.add("ui.addCoords", time.perf_counter() - t0)
+        METRICS.count("ui.pictures", len(batch))
+
+    def add_pictures(self, batch):
+        """
+        add or update the pictures [(path, gps, datetime), ...] in catalog and list view
+        the positions not saved of the previous session or of the workspace replace the positions read
+        """
+        added, updated = [], []
+        for path, gps, datetime in batch:
+            i, new = self.catalog.add(path, gps, datetime)
+            if path in self.recovered:
+                position = self.recovered.pop(path)
+                if tuple(position) != self.catalog.position(i):
+                    self.catalog.set_position(i, position)
+            (added if new else updated).append(i)
+        self.model.extend(added)
+        self.model.positionsChanged(updated)
+
+    def remove_missing(self, paths):
+        """
+        remove the pictures of paths not found on disk anymore
+        """
+        self.model.removeIndices([self.catalog.remove(path) for path in paths])
+        if self.cache is not None:
+            for path in paths:
+                self.cache.invalidate(path)
 
+    def selectedIndices(self):
+        """
+        return the catalog indices of the selected pictures in list order
+        """
+        return [self.model.catalogIndex(index.row())
+                for index in sorted(self.listView.selectionModel().selectedIndexes(), key=lambda index: index.row())]
 
-    def addCoord(self, coord):
+    def geotag_from_tracks(self):
         """
-        add coordinates to dictionary
+        set the positions of the photos from GPX/KML/NMEA track logs using the date time of the photos
         """
+        from tracklog import Track, parse_offset, DEFAULT_MAX_GAP
+
+        if not len(self.catalog):
+            self.statusbar.showMessage("No photos loaded", 5000)
+            return
+
+        fileNames, _ = QFileDialog.getOpenFileNames(self, "Open track logs", os.getcwd(),
+                                                    "Track logs (*.gpx *.GPX *.kml *.KML *.nmea *.txt *.log);;All files (*)")
+        if not fileNames:
+            return
+
+        text, ok = QInputDialog.getText(self, "Camera clock", "Camera clock offset from UTC ([+-]HH:MM[:SS] or seconds)",
+                                        QLineEdit.Normal, self.cameraOffset)
+        if not ok:
+            return
+        try:
+            offset = parse_offset(text)
+        except ValueError:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Invalid clock offset: {}".format(text))
+            return
+        self.cameraOffset = text
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            track = Track.load(fileNames)
+            positions = track.match(((i, self.catalog.datetimes[i]) for i in self.catalog.indices()),
+                                    offset=offset, max_gap=DEFAULT_MAX_GAP)
+        except Exception as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.warning(self, "PhotoGeoTagger", "Error reading track logs: {}".format(e))
+            return
+        QApplication.restoreOverrideCursor()
 
-        label = os.path.basename(coord['filename']).replace('.jpg','').replace('.JPG','')
-        self.gps_dict[label] = coord
+        tagged = [i for i in positions if self.catalog.is_tagged(i)]
+        if tagged and MessageDialog("PhotoGeoTagger", "Replace current position of {} photos?".format(len(tagged)),
+                                    ['Yes', 'No']) != 'Yes':
+            for i in tagged:
+                del positions[i]
 
-    def addThumbnail(self, image, label):
+        self.set_positions(list(positions.items()), "Geotag from track logs")
+        self.update_markers()
+
+        self.statusbar.showMessage("{} photos geotagged from {} track points".format(len(positions), len(track)), 0)
+
+    def autofill_positions(self):
         """
-        add thumbnail to listview
+        set the positions of the untagged photos from the geotagged photos taken within a time window
+        the changes are shown before being applied
         """
-        configButton = QListWidgetItem(self.listWidget)
-        configButton.setIcon(QIcon(QPixmap(image)))
+        if not len(self.catalog):
+            self.statusbar.showMessage("No photos loaded", 5000)
+            return
+
+        window, ok = QInputDialog.getInt(self, "Fill positions", "Maximum time to a geotagged photo (seconds)",
+                                         self.autofillWindow, 1, 86400)
+        if not ok:
+            return
+        self.autofillWindow = window
+
+        # only the selected photos if several are selected
+        selected = self.selectedIndices()
+        preview = autofill(self.catalog, window, indices=selected if len(selected) > 1 else None)
+        if not preview:
+            self.statusbar.showMessage("No photo taken within {} s of a geotagged photo".format(window), 5000)
+            return
+
+        label = self.catalog.label
+        lines = ["{}\t{:.6f}, {:.6f}\t{}".format(label(i), gps[0], gps[1],
+                                                 "from " + label(sources[0]) if len(sources) == 1
+                                                 else "between {} and {}".format(label(sources[0]), label(sources[1])))
+                 for i, gps, sources in preview]
+        message = QMessageBox(self)
+        message.setWindowTitle("PhotoGeoTagger")
+        message.setText("Set the position of {} photos?".format(len(preview)))
+        message.setDetailedText("\n".join(lines))
+        applyButton = message.addButton("Apply", QMessageBox.AcceptRole)
+        message.addButton("Cancel", QMessageBox.RejectRole)
+        message.exec_()
+        if message.clickedButton() != applyButton:
+            return
+
+        modified = [i for i, _, _ in preview]
+        self.set_positions([(i, gps) for i, gps, _ in preview], "Fill positions")
+        self.update_markers()
+        self.statusbar.showMessage("{} photos geotagged from photos taken within {} s".format(len(modified), window), 0)
 
-        print(label)
-        if label in self.gps_dict:
-            print( self.gps_dict[label] )
+    def find_duplicates(self):
+        """
+        group the near-duplicate photos (perceptual hashes of the thumbnails computed in hashthread)
+        """
+        if not len(self.catalog):
+            self.statusbar.showMessage("No photos loaded", 5000)
+            return
+        if self.hashthread.isRunning():
+            self.statusbar.showMessage("Near-duplicates are searched", 5000)
+            return
+        self.hashthread.paths = [self.catalog.paths[i] for i in self.catalog.indices()
+                                 if self.catalog.paths[i] not in self.hashes]
+        if not self.hashthread.paths:
+            self.hashes_done({})
+            return
+        self.hashthread.workers = self.longthread.workers
+        self.hashthread.start()
 
-        if label in self.gps_dict and self.gps_dict[label]['gps'] == (0, 0, 0):
-            b = QBrush()
-            b.setColor(QColor(255,0,0))
-            configButton.setForeground( b)
+    def hash_progress(self, done, total):
+        self.statusbar.showMessage("Searching near-duplicates {}/{}".format(done, total), 0)
 
-        configButton.setText(label)
+    def hashes_done(self, hashes):
+        """
+        hashes computed: group the near-duplicates and fill the untagged photos of the groups
+        with the position of their tagged photos (if they all have the same position)
+        """
+        self.hashes.update(hashes)
+        items = [(i, self.hashes[self.catalog.paths[i]]) for i in self.catalog.indices()
+                 if self.catalog.paths[i] in self.hashes]
+        with METRICS.timer("duplicates.group"):
+            groups = group_duplicates(items, DEFAULT_DUPLICATE_DISTANCE)
+        self.duplicateGroups = {i: group for group in groups for i in group}
+        if not groups:
+            self.statusbar.showMessage("No near-duplicate photos", 5000)
+            return
 
-        configButton.setTextAlignment(Qt.AlignHCenter)
-        configButton.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+        changes, lines, ambiguous = [], [], 0
+        label = self.catalog.label
+        for group in groups:
+            positions = {self.catalog.position(i) for i in group if self.catalog.is_tagged(i)}
+            if len(positions) > 1:
+                ambiguous += 1
+            if len(positions) != 1:
+                continue
+            gps = positions.pop()
+            source = next(i for i in group if self.catalog.is_tagged(i))
+            for i in group:
+                if not self.catalog.is_tagged(i):
+                    changes.append((i, gps))
+                    lines.append("{}\t{:.6f}, {:.6f}\tfrom {}".format(label(i), gps[0], gps[1], label(source)))
+
+        summary = "{} groups of near-duplicates ({} photos)".format(len(groups), len(self.duplicateGroups))
+        if ambiguous:
+            summary += ", {} groups with different positions".format(ambiguous)
+        if not changes:
+            self.statusbar.showMessage(summary, 0)
+            return
+
+        message = QMessageBox(self)
+        message.setWindowTitle("PhotoGeoTagger")
+        message.setText("{}.\nSet the position of {} photos from their near-duplicates?".format(summary, len(changes)))
+        message.setDetailedText("\n".join(lines))
+        applyButton = message.addButton("Apply", QMessageBox.AcceptRole)
+        message.addButton("Cancel", QMessageBox.RejectRole)
+        message.exec_()
+        if message.clickedButton() != applyButton:
+            self.statusbar.showMessage(summary, 0)
+            return
+
+        self.set_positions(changes, "Share position with near-duplicates")
+        self.update_markers()
+        self.statusbar.showMessage("{} photos geotagged from their near-duplicates".format(len(changes)), 0)
+
+    def select_duplicates(self):
+        """
+        select the near-duplicates of the selected photos (a position set on the map is then set on the whole group)
+        """
+        if not self.duplicateGroups:
+            self.statusbar.showMessage("Find near-duplicate photos first (Edit menu)", 5000)
+            return
+        selection = QItemSelection()
+        count = 0
+        for i in {j for i in self.selectedIndices() for j in self.duplicateGroups.get(i, [i])}:
+            row = self.model.row(i)
+            if row is not None:
+                index = self.model.index(row)
+                selection.select(index, index)
+                count += 1
+        self.listView.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        self.statusbar.showMessage("{} photos selected".format(count), 5000)
+
+    def export_positions(self):
+        """
+        write the positions of the photos (the selected photos if several are selected) to a CSV, GeoJSON, GPX or KML file
+        the positions not yet saved are exported too
+        """
+        if not len(self.catalog):
+            self.statusbar.showMessage("No photos loaded", 5000)
+            return
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export positions", os.path.join(os.getcwd(), "positions.geojson"),
+                                                  "GeoJSON (*.geojson);;CSV (*.csv);;GPX (*.gpx);;KML (*.kml)")
+        if not fileName:
+            return
+        selected = self.selectedIndices()
+        try:
+            n = export_file(catalog_records(self.catalog, selected if len(selected) > 1 else None), fileName)
+        except OSError as e:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Error writing {}: {}".format(fileName, e))
+            return
+        self.statusbar.showMessage("{} positions exported to {} ({})".format(
+                                   n, os.path.basename(fileName), format_from_name(fileName).upper()), 5000)
+
+    def import_positions(self):
+        """
+        set the positions of the photos found in a CSV or GeoJSON file (by path or file name) as one edit
+        the positions are written in the photos with Save positions
+        """
+        if not len(self.catalog):
+            self.statusbar.showMessage("No photos loaded", 5000)
+            return
+        fileName, _ = QFileDialog.getOpenFileName(self, "Import positions", os.getcwd(),
+                                                  "Positions (*.csv *.geojson *.json);;All files (*)")
+        if not fileName:
+            return
+        try:
+            found, ambiguous = match_positions(read_positions(fileName),
+                                               (self.catalog.paths[i] for i in self.catalog.indices()))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "PhotoGeoTagger", "Error reading {}: {}".format(fileName, e))
+            return
+        for path in ambiguous:
+            print("position of {} not imported: file name found several times".format(path))
+        skipped = ", {} photos skipped (same file name in several folders)".format(len(ambiguous)) if ambiguous else ""
+        if not found:
+            self.statusbar.showMessage("No position of the loaded photos in {}{}".format(
+                                       os.path.basename(fileName), skipped), 5000)
+            return
+
+        changes = [(self.catalog.get(path), gps) for path, gps in found.items()]
+        tagged = [i for i, gps in changes if self.catalog.is_tagged(i) and self.catalog.position(i) != tuple(gps)]
+        if tagged and MessageDialog("PhotoGeoTagger", "Replace current position of {} photos?".format(len(tagged)),
+                                    ['Yes', 'No']) != 'Yes':
+            tagged = set(tagged)
+            changes = [(i, gps) for i, gps in changes if i not in tagged]
+
+        self.set_positions(changes, "Import positions")
+        self.update_markers()
+        self.statusbar.showMessage("{} positions imported from {}{}".format(
+                                   len(changes), os.path.basename(fileName), skipped), 0)
+
+    def set_positions(self, changes, label):
+        """
+        set the positions of changes, a list of (catalog index, gps), as one edit of the journal (undone at once)
+        """
+        journal = []
+        for i, gps in changes:
+            journal.append((self.catalog.paths[i], self.catalog.position(i), tuple(gps)))
+            self.catalog.set_position(i, gps)
+        self.journal.record(label, journal)
+        self.model.positionsChanged([i for i, _ in changes])
+        self.update_undo_actions()
+
+    def apply_journal(self, positions):
+        """
+        set the positions [(path, gps), ...] given by an undo or a redo
+        a photo back to its saved position is not marked as modified
+        """
+        modified = []
+        for path, gps in positions:
+            i = self.catalog.get(path)
+            if i is None:
+                continue
+            self.catalog.set_position(i, gps)
+            if self.journal.is_saved(path, gps):
+                self.catalog.mark_clean(i)
+            modified.append(i)
+        self.model.positionsChanged(modified)
+        self.update_markers()
+        self.update_undo_actions()
+
+    def undo(self):
+        label = self.journal.undo_label()
+        self.apply_journal(self.journal.undo())
+        self.statusbar.showMessage("Undo " + label, 5000)
+
+    def redo(self):
+        label = self.journal.redo_label()
+        self.apply_journal(self.journal.redo())
+        self.statusbar.showMessage("Redo " + label, 5000)
+
+    def update_undo_actions(self):
+        self.actionUndo.setEnabled(self.journal.can_undo())
+        self.actionUndo.setText("Undo " + self.journal.undo_label())
+        self.actionRedo.setEnabled(self.journal.can_redo())
+        self.actionRedo.setText("Redo " + self.journal.redo_label())
+
+    def recover_journal(self):
+        """
+        ask to restore the positions not saved when the program stopped
+        """
+        recovered = self.journal.recovered
+        if not recovered:
+            return
+        response = MessageDialog("PhotoGeoTagger", "Restore the positions of {} photos not saved "
+                                 "in the previous session?".format(len(recovered)), ["Yes", "No"])
+        if response != "Yes":
+            self.journal.clear()
+            self.update_undo_actions()
+            return
+        # the positions are set when the photos are loaded (addCoords)
+        self.recovered = dict(recovered)
+        self.pendingFiles.extend(path for path in recovered if os.path.isfile(path))
+        self.scan_pending()
 
     def copyPosition(self):
 
-        if len(self.listWidget.selectedItems()) == 1:
+        selected = self.selectedIndices()
+        if len(selected) == 1:
 
-            self.memPosition = self.gps_dict[ self.listWidget.selectedItems()[0].text() ]['gps']
+            self.memPosition = self.catalog.position(selected[0])
             if self.memPosition != (0,0,0):
                 self.statusbar.showMessage('Copied position ' + str(self.memPosition)  , 5000)
             else:
@@ -443,41 +1280,23 @@ class MainWindow(QMainWindow):
             self.statusbar.showMessage("No position in clipboard" , 5000)
             return
 
-        if self.listWidget.selectedItems():
-            self.removeAllMarkers()
-
-        for item in self.listWidget.selectedItems():
-            self.gps_dict[item.text()]['gps'] = self.memPosition
-            self.changed.append(item.text())
-
-            id_ = item.text().replace("-", "")
-            s = ("m{id_} = new L.Marker([{lat}, {lon}], {{draggable:true}});"
-                 "map.addLayer(m{id_});"
-                 "m{id_}.bindPopup('{id_}').openPopup();").format(lat=self.memPosition[0],
-                                                                lon=self.memPosition[1],
-                                                                id_=id_)
-
-            self.browser.page().runJavaScript(s)
-            self.memMarker.append(id_)
+        selected = self.selectedIndices()
+        if not selected:
+            return
 
-            self.get_map(self.memPosition[0], self.memPosition[1], self.zoom)
+        self.set_positions([(i, self.memPosition) for i in selected], "Paste position")
 
-            self.statusbar.showMessage("Set photo position %.6f, %.6f  " % (self.memPosition[0], self.memPosition[1] ), 0)
+        self.statusbar.showMessage("Set photo position %.6f, %.6f  " % (self.memPosition[0], self.memPosition[1] ), 0)
 
-            b = QBrush()
-            b.setColor(QColor(0,0,0))
-            item.setForeground( b)
+        self.update_markers(focus=selected[-1], view=(self.memPosition[0], self.memPosition[1], self.zoom))
 
 
     def delete_position(self):
         """
         delete position from exif metadata
         """
-        for item in self.listWidget.selectedItems():
-            self.gps_dict[item.text()]['gps'] = (0, 0, 0)
-            self.changed.append(item.text())
-            self.browser.page().runJavaScript("map.removeLayer({});".format(item.text()))
-            self.memMarker.remove(item.text())
+        self.set_positions([(i, (0, 0, 0)) for i in self.selectedIndices()], "Delete position")
+        self.update_markers()
 
 
     def actionAbout_activated(self):
@@ -502,115 +1321,540 @@ class MainWindow(QMainWindow):
 
     def save_positions(self):
         """
-        save modified position to photo
+        save modified position to photo in background
         """
-        if self.changed:
-            for pic in self.changed:
-                metadata = pyexiv2.ImageMetadata(self.gps_dict[pic]["filename"])
-                metadata.read()
+        if not self.catalog.has_changes() or self.savethread.isRunning():
+            return
 
-                metadata[GPS + 'Latitude'] = decimal_to_dms(self.gps_dict[ pic ]['gps'][0])
-                metadata[GPS + 'LatitudeRef'] = 'N' if self.gps_dict[ pic ]['gps'][0] >= 0 else 'S'
-                metadata[GPS + 'Longitude'] = decimal_to_dms(self.gps_dict[ pic ]['gps'][1])
-                metadata[GPS + 'LongitudeRef'] = 'E' if self.gps_dict[ pic ]['gps'][1] >= 0 else 'W'
-                metadata.write()
+        # positions are copied: they can be modified while saving
+        self.saving = {}
+        jobs = []
+        for i in self.catalog.dirty_indices():
+            path, gps = self.catalog.paths[i], self.catalog.position(i)
+            self.saving[path] = (i, gps)
+            jobs.append((path, gps))
+
+        self.savethread.jobs = jobs
+        self.savePending = True
+        self.saveStarted = time.perf_counter()
+        self.saveProgress.setRange(0, len(jobs))
+        self.saveProgress.setValue(0)
+        self.saveProgress.show()
+        self.saveCancel.show()
+        self.savethread.start()
+
+    def save_positions_and_wait(self):
+        """
+        save modified position to photo and return when done
+        return True if all positions were saved
+        """
+        self.save_positions()
+        if self.savePending:
+            loop = QEventLoop()
+            self.savethread.signal.report.connect(loop.quit)
+            loop.exec_()
+            self.savethread.signal.report.disconnect(loop.quit)
+        return not self.catalog.has_changes()
+
+    def save_progress(self, done, total):
+        self.saveProgress.setValue(done)
+        self.statusbar.showMessage("Saving positions {}/{}".format(done, total), 0)
+
+    def cancel_saving(self):
+        if self.savethread.isRunning():
+            self.savethread.cancel()
+
+    def save_report(self, report):
+        """
+        mark saved pictures as clean and show result
+        """
+        METRICS.add("save.total", time.perf_counter() - self.saveStarted)
+        METRICS.count("save.files", len(report))
+        self.savePending = False
+        self.saveProgress.hide()
+        self.saveCancel.hide()
+
+        errors = []
+        written = []
+        for path, error in report:
+            i, gps = self.saving[path]
+            if error:
+                print("error saving {}: {}".format(path, error))
+                errors.append(os.path.basename(path))
+                continue
+            written.append((path, gps))
+            if self.catalog.get(path) == i and self.catalog.position(i) == gps:
+                # position not modified while saving
+                self.catalog.mark_clean(i)
+                if path in self.savethread.writer.places:
+                    self.catalog.set_place(i, self.savethread.writer.places[path])
+
+        # the journal keeps only the positions still not saved
+        self.journal.saved(written)
+        self.journal.compact([(self.catalog.paths[i], self.catalog.position(i)) for i in self.catalog.dirty_indices()])
+
+        saved = len(report) - len(errors)
+        if errors:
+            self.statusbar.showMessage("Positions saved in {} photos, {} errors: {}".format(
+                                       saved, len(errors), ", ".join(errors[:10]) + (" ..." if len(errors) > 10 else "")), 0)
+        elif self.savethread.writer and self.savethread.writer.cancelled:
+            self.statusbar.showMessage("Saving cancelled, positions saved in {} photos".format(saved), 5000)
+        else:
+            self.statusbar.showMessage('Positions saved in photos ({})'.format(self.savethread.writer.summary()), 5000)
+
+
+    def update_markers(self, focus=None, view=None):
+        '''
+        send the changes of the markers of all geotagged photos to leaflet in one call
+        focus: catalog index of the photo whose popup is opened
+        view: (lat, lon, zoom) of the map
+        the markers are sent when the map is ready
+        '''
+        if not self.mapReady:
+            return
+        with METRICS.timer("ui.markers"):
+            self._update_markers(focus, view)
+
+    def _update_markers(self, focus, view):
+        catalog = self.catalog
+        selected = set(self.selectedIndices())
+        shown = catalog.in_bbox(*self.viewBounds) if self.viewBounds else catalog.tagged()
+        if focus is not None and catalog.is_tagged(focus):
+            shown.append(focus)
+        wanted = {i: (catalog.lats[i], catalog.lons[i], i in selected, catalog.label(i)) for i in shown}
+        s = self.markerLayer.script(wanted, focus, view)
+        if s:
+            self.run_js(s)
+
+    def run_js(self, script, callback=None):
+        """
+        run script in the map page, the round trip is timed
+        the script is queued until the map is ready
+        callback: function called with the value of the script
+        """
+        if not self.mapReady:
+            self.jsQueue.append((script, callback))
+            return
+        t0 = time.perf_counter()
+        METRICS.count("js.calls")
+        METRICS.count("js.bytes", len(script))
 
-            self.statusbar.showMessage('Positions saved in photos', 5000)
-            self.changed = []
+        def done(value):
+            METRICS.add("js.roundtrip", time.perf_counter() - t0)
+            if callback:
+                callback(value)
 
+        self.browser.page().runJavaScript(script, done)
 
-    def removeAllMarkers(self):
-        '''
-        remove all markers from leaflet
-        '''
-        for m in self.memMarker:
-            self.browser.page().runJavaScript("map.removeLayer({});".format(m))
-        self.memMarker = []
+    def set_view_bounds(self, south, west, north, east):
+        """
+        send the markers of the view extended by VIEW_MARGIN of its size on each side
+        """
+        self.lat, self.long = (south + north) / 2, (west + east) / 2
+        height, width = north - south, east - west
+        if width * (1 + 2 * VIEW_MARGIN) >= 360:
+            self.viewBounds = (max(south - height * VIEW_MARGIN, -90), -180, min(north + height * VIEW_MARGIN, 90), 180)
+        else:
+            # leaflet longitudes are not wrapped to [-180, 180]
+            self.viewBounds = (max(south - height * VIEW_MARGIN, -90),
+                               (west - width * VIEW_MARGIN + 180) % 360 - 180,
+                               min(north + height * VIEW_MARGIN, 90),
+                               (east + width * VIEW_MARGIN + 180) % 360 - 180)
+        self.update_markers()
+
+    def select_nearest(self, lat, lon):
+        """
+        select the photo nearest to the clicked position (within NEAREST_PIXELS on the map)
+        """
+        metersPerPixel = 40075016.7 * math.cos(math.radians(lat)) / (256 * 2 ** self.zoom)
+        nearest = self.catalog.nearest(lat, lon, k=5, max_distance=NEAREST_PIXELS * metersPerPixel)
+        if not nearest:
+            self.statusbar.showMessage("No photo near %.6f, %.6f" % (lat, lon), 5000)
+            return
 
+        row = self.model.row(nearest[0][1])
+        if row is not None:
+            index = self.model.index(row)
+            self.listView.setCurrentIndex(index)
+            self.listView.scrollTo(index)
+        self.statusbar.showMessage("Nearest photos: " + ", ".join("{} ({:.0f} m)".format(self.catalog.label(i), d)
+                                                                  for d, i in nearest), 0)
 
-    def itemSelectionChanged(self):
+    def map_clicked(self, click_lat, click_long):
+        """
+        click on the map: set the position of the selected photos or select the nearest photo
+        """
+        self.statusbar.showMessage('Position %.6f, %.6f  ' % (click_lat, click_long), 0)
 
-        for item in self.listWidget.selectedItems():
-            pictLat, pictLon = self.gps_dict[ item.text()]["gps"][0:2]
-            if pictLat or pictLon:
-                id = item.text().replace("-", "")
-                s = "m%(id)s = new L.Marker([%(lat)f, %(lon)f], {draggable:true});map.addLayer(m%(id)s);m%(id)s.bindPopup('%(id)s').openPopup();" % {'lat':pictLat, 'lon':pictLon, 'id': id}
+        selected = self.selectedIndices()
+        if not selected:
+            self.select_nearest(click_lat, click_long)
+            return
 
-                self.browser.page().runJavaScript(s)
-                self.memMarker.append(id)
-                self.get_map(pictLat, pictLon, self.zoom)
+        modified = []
+        for i in selected:
+            if not self.catalog.is_tagged(i) or \
+               MessageDialog("photoGeoTagger", "Replace current position?", ['Yes', 'No']) == 'Yes':
+                modified.append(i)
 
+        if modified:
+            self.statusbar.showMessage("Set picture position %.6f, %.6f  " % (click_lat, click_long), 0)
+            self.set_positions([(i, (click_lat, click_long, 0.0)) for i in modified], "Set position")
+            self.update_markers(focus=modified[-1], view=(click_lat, click_long, self.zoom))
 
-    def get_map(self, lat, lng, zoom):
+    def init_map(self):
         """
-        set leaflet with parameters latitude, longitude and zoom
+        create the web engine view of the map
+        """
+        if self.browser is not None:
+            return
+        t0 = time.perf_counter()
+        from mapview import create_map_view
+        self.browser = create_map_view(self, self.tileServer, self.tileLayer, defaultLat, defaultLon, defaultZoom)
+        self.browser.loadStarted.connect(self.map_loading)
+        self.hbox.replaceWidget(self.mapPlaceholder, self.browser)
+        self.mapPlaceholder.deleteLater()
+        missing = self.tileCache.missing_static()
+        if missing:
+            print("map files missing: {}".format(", ".join(missing)))
+            self.statusbar.showMessage("Map files missing ({}): run photogeotagger_cli.py static".format(
+                                       ", ".join(missing)), 0)
+        METRICS.add("startup.map_init", time.perf_counter() - t0)
+
+    def map_loading(self):
         """
-        if lat or lng:
-            self.browser.page().runJavaScript(f"map.setView([{lat}, {lng}], {zoom});")
+        page (re)loading: the scripts are queued until the web channel is connected
+        """
+        self.mapReady = False
+
+    def map_ready(self):
+        """
+        web channel of the page connected: run the queued scripts and send all markers
+        """
+        self.mapReady = True
+        startup_step("startup.map_ready")
+        queue, self.jsQueue = self.jsQueue, []
+        for script, callback in queue:
+            self.run_js(script, callback)
+        self.markerLayer.reset()
+        self.update_markers()
+        self.startup_done()
+
+    def first_thumbnail(self, path, image):
+        startup_step("startup.first_thumbnail")
+        self.thumbnailLoader.loaded.disconnect(self.first_thumbnail)
+        self.startup_done()
+
+    def startup_done(self):
+        if self.exitAfterStartup and all(name in METRICS.timers for name in
+                                         ("startup.first_thumbnail", "startup.map_ready")):
+            QTimer.singleShot(0, self.close)
+
+
+    def itemSelectionChanged(self):
+
+        selected = self.selectedIndices()
+        tagged = [i for i in selected if self.catalog.is_tagged(i)]
+        if tagged:
+            pictLat, pictLon = self.catalog.position(tagged[-1])[0:2]
+            self.update_markers(focus=tagged[-1] if len(selected) == 1 else None, view=(pictLat, pictLon, self.zoom))
+        else:
+            self.update_markers()
 
 
     def load_directory_activated(self):
 
-        if self.changed:
+        if self.catalog.has_changes():
             response = MessageDialog("PhotoGeoTagger", "Save positions to photos?", ["Yes", "No", "Cancel"])
             if response == "Yes":
-                self.save_positions()
+                if not self.save_positions_and_wait():
+                    return
             if response == "Cancel":
                 return
 
         directory = QFileDialog.getExistingDirectory(self, "Open Directory",
                                                      os.getcwd(),
                                                      QFileDialog.DontResolveSymlinks | QFileDialog.ShowDirsOnly)
+        if not directory:
+            return
+
+        self.load_pictures(directory)
 
-        self.longthread.picturesPath = directory
+    def load_pictures(self, path):
+        """
+        scan path (directory or picture) in longthread, a running scan is cancelled
+        path is added to the folders of the workspace
+        """
+        if path not in self.folders:
+            self.folders.append(path)
+        self.preloaded = set()
+        self.scan_folders([path])
+
+    def scan_folders(self, paths, known=None):
+        """
+        scan paths (directories or pictures) in longthread, a running scan is cancelled
+        known: {path: (mtime_ns, size)} of the pictures already loaded (default the pictures watched)
+        """
+        if self.longthread.isRunning():
+            self.longthread.cancel()
+            self.longthread.wait()
+
+        self.watcher.recursive = self.actionRecursive.isChecked()
+        self.watcher.extensions = self.extensions
+        self.longthread.picturesPaths = list(paths)
+        self.longthread.recursive = self.actionRecursive.isChecked()
+        self.longthread.extensions = self.extensions
+        self.longthread.files = None
+        # pictures already loaded and not modified are not read again
+        if known is None:
+            known = {p: st for p, st in self.watcher.snapshot().items() if p in self.catalog}
+        self.longthread.known = known
+        self.thumbnailer.stats.reset()
         self.longthread.start()
 
+    def new_workspace(self):
+        """
+        close the pictures and start an empty workspace
+        """
+        name, ok = QInputDialog.getText(self, "New workspace", "Name of the workspace:")
+        if not ok or not name.strip():
+            return
+        try:
+            path = workspace_path(name)
+        except ValueError as e:
+            self.statusbar.showMessage(str(e), 5000)
+            return
+        if os.path.exists(path) and MessageDialog("PhotoGeoTagger", "Replace workspace {}?".format(name.strip()),
+                                                  ["Yes", "No"]) != "Yes":
+            return
+        if not self.close_pictures():
+            return
+        self.workspace = Workspace(name.strip())
+        self.store_workspace()
+        self.update_title()
 
-    def closeEvent(self, event):
+    def open_workspace(self, name=None):
         """
-        check if pictures position are saved and close program
+        close the pictures and open a saved workspace
+        the pictures are shown at once from the cache, then the folders are scanned for changes
         """
+        if name is None:
+            names = list_workspaces()
+            if not names:
+                self.statusbar.showMessage("No workspace saved", 5000)
+                return
+            current = names.index(self.workspace.name) if self.workspace and self.workspace.name in names else 0
+            name, ok = QInputDialog.getItem(self, "Open workspace", "Workspaces", names, current, False)
+            if not ok:
+                return
+        # the open workspace is saved first (it may be the workspace opened)
+        if not self.close_pictures():
+            return
+        try:
+            workspace = Workspace.load(workspace_path(name))
+        except (OSError, ValueError) as e:
+            print("error reading workspace {}: {}".format(name, e))
+            self.statusbar.showMessage("Can not open workspace {}".format(name), 5000)
+            self.workspace = None
+            self.update_title()
+            return
 
-        if self.changed:
-            response = MessageDialog('PhotoGeoTagger', 'Save positions to photos?', ['Yes', 'No', 'Cancel'])
-            if response == 'Yes':
-                self.save_positions()
-            if response == 'Cancel':
-                event.ignore()
+        t0 = time.perf_counter()
+        self.workspace = workspace
+        self.update_title()
+        self.actionRecursive.setChecked(workspace.recursive)
+        self.folders = list(workspace.folders)
+        self.recovered = dict(workspace.pending)
+
+        # the pictures are listed from the cache without opening them, the thumbnails are loaded on demand
+        known = {}
+        batch = []
+        if self.cache is not None:
+            for folder in self.folders:
+                for path, mtime, size, gps, datetime in self.cache.entries_under(folder, workspace.recursive):
+                    if path.lower().endswith(self.extensions):
+                        known[path] = (mtime, size)
+                        batch.append((path, gps, datetime))
+        self.add_pictures(batch)
+        self.preloaded = set(known)
+
+        if workspace.view:
+            self.lat, self.long, self.zoom = workspace.view
+            self.run_js("map.setView([{}, {}], {});".format(*workspace.view))
+        i = self.catalog.get(workspace.current) if workspace.current else None
+        if i is not None and self.model.row(i) is not None:
+            index = self.model.index(self.model.row(i))
+            self.listView.setCurrentIndex(index)
+            self.listView.scrollTo(index)
+        self.update_markers()
+        METRICS.add("workspace.open", time.perf_counter() - t0)
+        self.statusbar.showMessage("Workspace {}: {} photos".format(workspace.name, len(batch)), 5000)
+
+        # new, modified and removed pictures
+        self.scan_folders(self.folders, known)
+
+    def save_workspace(self):
+        """
+        save the folders, the positions not saved and the view in the workspace (a name is asked if none is open)
+        """
+        if self.workspace is None:
+            name, ok = QInputDialog.getText(self, "Save workspace", "Name of the workspace:")
+            if not ok or not name.strip():
+                return
+            try:
+                workspace_path(name)
+            except ValueError as e:
+                self.statusbar.showMessage(str(e), 5000)
+                return
+            self.workspace = Workspace(name.strip())
+            self.update_title()
+        if self.store_workspace():
+            self.statusbar.showMessage("Workspace {} saved".format(self.workspace.name), 5000)
 
-    def clear(self):
+    def store_workspace(self):
         """
-        clear list view
+        write the state of the open workspace
+        return True if written
         """
+        workspace = self.workspace
+        workspace.folders = list(self.folders)
+        workspace.recursive = self.actionRecursive.isChecked()
+        workspace.view = (self.lat, self.long, self.zoom)
+        current = self.listView.currentIndex()
+        workspace.current = self.catalog.paths[self.model.catalogIndex(current.row())] if current.isValid() else None
+        # the positions of the pictures not loaded yet are kept
+        workspace.pending = dict(self.recovered)
+        workspace.pending.update((self.catalog.paths[i], self.catalog.position(i)) for i in self.catalog.dirty_indices())
+        try:
+            workspace.save(workspace_path(workspace.name))
+        except (OSError, ValueError) as e:
+            print("error saving workspace {}: {}".format(workspace.name, e))
+            self.statusbar.showMessage("Can not save workspace {}".format(workspace.name), 5000)
+            return False
+        return True
 
-        if self.changed:
+    def update_title(self):
+        self.setWindowTitle("PhotoGeoTagger - " + self.workspace.name if self.workspace else "PhotoGeoTagger")
+
+    def keep_changes(self):
+        """
+        keep the positions not saved in the open workspace, or ask to save them in the photos
+        return False if cancelled
+        """
+        if self.workspace is not None and self.store_workspace():
+            # the positions not saved are in the workspace
+            self.journal.clear()
+            self.update_undo_actions()
+            return True
+        if self.catalog.has_changes():
             response = MessageDialog('PhotoGeoTagger', 'Save positions to photos?', ['Yes', 'No', 'Cancel'])
             if response == "Yes":
-                self.save_positions()
+                if not self.save_positions_and_wait():
+                    return False
             if response == "Cancel":
-                return
+                return False
+            if response == "No":
+                self.journal.clear()
+                self.update_undo_actions()
+        return True
+
+    def close_pictures(self):
+        """
+        keep or save the changes then remove all pictures and free their memory
+        return False if cancelled
+        """
+        if self.savethread.isRunning():
+            self.statusbar.showMessage("Positions are being saved, retry later", 5000)
+            return False
+        if not self.keep_changes():
+            return False
+
+        if self.longthread.isRunning():
+            self.longthread.cancel()
+            self.longthread.wait()
+        if self.hashthread.isRunning():
+            self.hashthread.cancel()
+            self.hashthread.wait()
+
+        self.watcher.clear()
+        self.pendingFiles = []
+        self.model.clear()
+        self.catalog.clear()
+        self.hashes = {}
+        self.duplicateGroups = {}
+        self.recovered = {}
+        self.preloaded = set()
+        self.folders = []
+        self.longthread.known = {}
+        self.longthread.seen = set()
+        self.longthread.generation += 1
+        INDEXES.clear()
+        self.update_markers()
+        gc.collect()
+        return True
 
-        self.removeAllMarkers()
 
-        self.changed = []
-        self.gps_dict = {}
-        self.listWidget.clear()
+    def closeEvent(self, event):
+        """
+        check if pictures position are saved and close program
+        the positions not saved are kept in the open workspace
+        """
+
+        if not self.keep_changes():
+            event.ignore()
+            return
+
+        if self.longthread.isRunning():
+            self.longthread.cancel()
+            self.longthread.wait()
+
+        self.thumbnailLoader.cancel()
+        self.thumbnailLoader.pool.waitForDone()
+        self.hashthread.cancel()
+        self.hashthread.wait()
+        if self.cache is not None:
+            self.cache.close()
+
+        self.prefetchthread.cancel()
+        self.prefetchthread.wait()
+        self.tileServer.stop()
+        self.tileCache.close()
+        self.journalTimer.stop()
+        self.journal.close()
+        self.metricsTimer.stop()
+        if self.profiler.running:
+            self.profiler.stop(os.getcwd())
+
+    def clear(self):
+        """
+        clear list view and close the workspace
+        """
+
+        if not self.close_pictures():
+            return
+        self.workspace = None
+        self.update_title()
 
 
 def main():
+    # PHOTOGEOTAGGER_METRICS=metrics.json dumps the timers and counters at exit
+    dump_at_exit()
+    # QtWebEngineWidgets is imported after the application is created (mapview)
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
+    # --exit-after-startup: quit once the first thumbnail is shown and the map is ready
+    args = [arg for arg in sys.argv[1:] if arg != "--exit-after-startup"]
     win = MainWindow()
+    win.exitAfterStartup = len(args) < len(sys.argv) - 1
+    # the scan starts before the window is shown
+    if len(args) > 1 and args[0] == "--workspace":
+        win.open_workspace(args[1])
+    elif args:
+        if os.path.isdir(os.path.abspath(args[0])) or os.path.isfile(os.path.abspath(args[0])):
+            win.load_pictures(os.path.abspath(args[0]))
+
     win.showMaximized()
-    if len(sys.argv) > 1:
-        if os.path.isdir(os.path.abspath(sys.argv[1])) or os.path.isfile(os.path.abspath(sys.argv[1])):
-            longthread = MyLongThread()
-            longthread.finished.connect(win.terminated)
-            longthread.signal.coord.connect(win.addCoord)
-            longthread.signal.thumbnail.connect(win.addThumbnail)
-            longthread.picturesPath = os.path.abspath(sys.argv[1])
-            longthread.start()
-
-    win.show()
+    QTimer.singleShot(0, lambda: startup_step("startup.window"))
     app.exec_()
 
 
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3.6
+
+"""
+PhotoGeoTagger command line interface for batch work without Qt.
+
+photogeotagger_cli.py scan DIR...            summary of the pictures with/without position
+photogeotagger_cli.py list DIR...            position of each picture
+photogeotagger_cli.py apply --positions FILE DIR... set positions from a CSV (path,lat,lon[,alt]) or GeoJSON file
+photogeotagger_cli.py apply --track FILE DIR... set positions from GPX/KML/NMEA track logs
+photogeotagger_cli.py autofill --window 120 DIR...   set positions from photos taken at the same time
+photogeotagger_cli.py strip DIR...           remove positions
+photogeotagger_cli.py geocode --gazetteer cities1000.zip DIR...   write city, region and country of positions
+photogeotagger_cli.py export -o FILE DIR...  export positions (CSV, GeoJSON, GPX or KML)
+photogeotagger_cli.py prefetch --bbox S,W,N,E --zoom 10-15   download map tiles for offline use
+photogeotagger_cli.py static                 download the Leaflet files of the map again
+
+This module must not import PyQt5.
+"""
+
+import os
+import sys
+import argparse
+
+from exifgps import NO_POSITION
+from scanner import ScanEngine, DEFAULT_WORKERS, EXTENSIONS, find_pictures, parse_extensions
+from thumbcache import MetadataCache
+from writer import BatchWriter
+from tracklog import Track, parse_offset, DEFAULT_MAX_GAP
+from tilecache import TileCache, tiles_server
+from gazetteer import Gazetteer
+from catalog import Catalog
+from autofill import autofill, DEFAULT_WINDOW as DEFAULT_AUTOFILL_WINDOW
+from exporters import FORMATS, coord_records, export_file, read_positions, match_positions
+from metrics import dump_at_exit
+
+
+def scan_iter(args):
+    """
+    yield the coord dictionaries of the pictures of args.paths as they are read
+    """
+    cache = MetadataCache() if args.cache else None
+    engine = ScanEngine(args.workers, use_processes=not args.threads, cache=cache)
+    try:
+        for coord, _ in engine.scan(find_pictures(args.paths, recursive=args.recursive, extensions=args.extensions)):
+            yield coord
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def scan(args):
+    """
+    return the list of coord dictionaries of the pictures of args.paths
+    """
+    return list(scan_iter(args))
+
+
+def write(args, jobs):
+    """
+    write the positions of jobs (list of (path, gps)) and print the errors
+    the city, region and country are written too if args.gazetteer
+    return the exit code
+    """
+    gazetteer = Gazetteer.load(args.gazetteer, args.min_population) if args.gazetteer else None
+
+    if args.dry_run:
+        places = gazetteer.lookup_batch([gps for _, gps in jobs]) if gazetteer else [None] * len(jobs)
+        for (path, gps), place in zip(jobs, places):
+            print("{}\t{}{}".format(path, format_position(gps), "\t" + format_place(place) if place else ""))
+        print("{} pictures would be modified".format(len(jobs)), file=sys.stderr)
+        return 0
+
+    def progress(done, total):
+        if not args.quiet:
+            print("\r{}/{}".format(done, total), end="", file=sys.stderr, flush=True)
+
+    writer = BatchWriter(args.workers, gazetteer, in_place=not args.no_in_place)
+    report = writer.write(jobs, progress=progress)
+    if not args.quiet and report:
+        print(file=sys.stderr)
+    if args.verbose:
+        for path, error in report:
+            if not error:
+                print("{}\t{}\t{}\t{}".format(path, *writer.io[path]))
+    errors = [(path, error) for path, error in report if error]
+    for path, error in errors:
+        print("error writing {}: {}".format(path, error), file=sys.stderr)
+    print("{} pictures modified, {} errors ({})".format(len(report) - len(errors), len(errors), writer.summary()),
+          file=sys.stderr)
+    return 1 if errors else 0
+
+
+def format_position(gps):
+    if tuple(gps) == NO_POSITION:
+        return "\t\t"
+    return "{:.7f}\t{:.7f}\t{:.1f}".format(*gps)
+
+
+def format_place(place):
+    return "\t".join((place.city, place.region, place.country))
+
+
+def cmd_scan(args):
+    coords = scan(args)
+    tagged = sum(1 for coord in coords if coord['gps'] != NO_POSITION)
+    print("{} pictures, {} with position, {} without position".format(len(coords), tagged, len(coords) - tagged))
+    return 0
+
+
+def cmd_list(args):
+    coords = scan(args)
+    for coord in coords:
+        if args.untagged and coord['gps'] != NO_POSITION:
+            continue
+        print("{}\t{}\t{}".format(coord['filename'], format_position(coord['gps']), coord.get('datetime') or ""))
+    return 0
+
+
+def cmd_apply(args):
+    coords = scan(args)
+
+    if args.positions:
+        found, ambiguous = match_positions(read_positions(args.positions), [coord['filename'] for coord in coords])
+        for path in ambiguous:
+            print("skipped {}: file name found several times".format(path), file=sys.stderr)
+    else:
+        track = Track.load(args.track)
+        found = track.match(((coord['filename'], coord.get('datetime')) for coord in coords),
+                            offset=parse_offset(args.offset), max_gap=args.max_gap)
+
+    jobs = [(coord['filename'], found[coord['filename']]) for coord in coords
+            if coord['filename'] in found and (args.replace or coord['gps'] == NO_POSITION)]
+    return write(args, jobs)
+
+
+def cmd_autofill(args):
+    catalog = Catalog()
+    for coord in scan(args):
+        catalog.add(coord['filename'], coord['gps'], coord.get('datetime'))
+    preview = autofill(catalog, window=args.window, interpolate=not args.no_interpolate)
+    return write(args, [(catalog.paths[i], gps) for i, gps, _ in preview])
+
+
+def cmd_strip(args):
+    coords = scan(args)
+    return write(args, [(coord['filename'], NO_POSITION) for coord in coords if coord['gps'] != NO_POSITION])
+
+
+def cmd_geocode(args):
+    if not args.gazetteer:
+        print("geocode needs a gazetteer (--gazetteer FILE)", file=sys.stderr)
+        return 2
+    coords = scan(args)
+    return write(args, [(coord['filename'], coord['gps']) for coord in coords if coord['gps'] != NO_POSITION])
+
+
+def cmd_export(args):
+    # the positions are written as the pictures are read
+    n = export_file(coord_records(scan_iter(args)), args.output, args.format)
+    if not args.quiet:
+        print("{} positions exported".format(n), file=sys.stderr)
+    return 0
+
+
+def cmd_prefetch(args):
+    try:
+        bbox = [float(x) for x in args.bbox.split(",")]
+        first, _, last = args.zoom.partition("-")
+        zooms = range(int(first), int(last or first) + 1)
+    except ValueError:
+        print("invalid bounding box or zoom levels", file=sys.stderr)
+        return 2
+    if len(bbox) != 4:
+        print("the bounding box must be south,west,north,east", file=sys.stderr)
+        return 2
+
+    def progress(done, total):
+        if not args.quiet:
+            print("\r{}/{}".format(done, total), end="", file=sys.stderr, flush=True)
+
+    cache = TileCache()
+    try:
+        n = cache.prefetch(args.server, bbox, zooms, workers=args.workers, progress=progress)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        cache.close()
+    if not args.quiet:
+        print(file=sys.stderr)
+    print("{} tiles downloaded in {}".format(n, cache.cache_dir), file=sys.stderr)
+    return 0
+
+
+def cmd_static(args):
+    cache = TileCache()
+    try:
+        failed = cache.refresh_static()
+    finally:
+        cache.close()
+    if failed:
+        print("{} map files not downloaded".format(len(failed)), file=sys.stderr)
+        return 1
+    print("map files downloaded in {}".format(os.path.join(cache.cache_dir, "static")), file=sys.stderr)
+    return 0
+
+
+def parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("paths", nargs="+", help="pictures or directories")
+    common.add_argument("-r", "--recursive", action="store_true", help="scan sub-directories")
+    common.add_argument("--ext", dest="extensions", type=parse_extensions, default=EXTENSIONS,
+                        help="extensions of the pictures (default: {})".format(",".join(e[1:] for e in EXTENSIONS)))
+    common.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS, help="number of workers")
+    common.add_argument("--threads", action="store_true", help="read the metadata with threads instead of processes")
+    common.add_argument("--cache", action="store_true", help="use the metadata cache of PhotoGeoTagger")
+    common.add_argument("-q", "--quiet", action="store_true")
+
+    writing = argparse.ArgumentParser(add_help=False)
+    writing.add_argument("-n", "--dry-run", action="store_true", help="print the changes without writing")
+    writing.add_argument("--no-in-place", action="store_true",
+                         help="always rewrite a copy renamed over the picture (atomic) instead of patching the GPS tags")
+    writing.add_argument("-v", "--verbose", action="store_true",
+                         help="print how each picture was written (patched, unchanged, rewritten) and the bytes read and written")
+    writing.add_argument("--gazetteer", help="GeoNames dump (cities1000.txt or .zip) to write city, region and country")
+    writing.add_argument("--min-population", type=int, default=0, help="skip the places of the gazetteer with less inhabitants")
+
+    p = argparse.ArgumentParser(prog="photogeotagger_cli", description="PhotoGeoTagger batch mode")
+    p.add_argument("--metrics", metavar="FILE", help="write the timers and counters as JSON at exit")
+    sub = p.add_subparsers(dest="command")
+    sub.required = True
+
+    sub.add_parser("scan", parents=[common], help="count pictures with and without position").set_defaults(func=cmd_scan)
+
+    s = sub.add_parser("list", parents=[common], help="list positions")
+    s.add_argument("-u", "--untagged", action="store_true", help="list only pictures without position")
+    s.set_defaults(func=cmd_list)
+
+    s = sub.add_parser("apply", parents=[common, writing], help="set positions from a CSV/GeoJSON file or track logs")
+    source = s.add_mutually_exclusive_group(required=True)
+    source.add_argument("--positions", "--csv", dest="positions",
+                        help="CSV file with columns path,lat,lon[,alt] or GeoJSON file of Point features")
+    source.add_argument("--track", nargs="+", help="GPX/KML/NMEA track logs")
+    s.add_argument("--offset", default="0", help="camera clock offset from UTC ([+-]HH:MM[:SS] or seconds)")
+    s.add_argument("--max-gap", type=float, default=DEFAULT_MAX_GAP, help="maximum time between track points (s)")
+    s.add_argument("--replace", action="store_true", help="replace existing positions")
+    s.set_defaults(func=cmd_apply)
+
+    s = sub.add_parser("autofill", parents=[common, writing], help="set positions from photos taken at the same time")
+    s.add_argument("--window", type=float, default=DEFAULT_AUTOFILL_WINDOW,
+                   help="maximum time to a photo with position (s)")
+    s.add_argument("--no-interpolate", action="store_true", help="copy the nearest position in time instead of interpolating")
+    s.set_defaults(func=cmd_autofill)
+
+    sub.add_parser("strip", parents=[common, writing], help="remove positions").set_defaults(func=cmd_strip)
+
+    s = sub.add_parser("geocode", parents=[common, writing], help="write city, region and country of the positions")
+    s.set_defaults(func=cmd_geocode)
+
+    s = sub.add_parser("export", parents=[common], help="export positions")
+    s.add_argument("-o", "--output", default="-", help="output file (- for stdout)")
+    s.add_argument("-f", "--format", choices=FORMATS, help="output format (default from file extension)")
+    s.set_defaults(func=cmd_export)
+
+    s = sub.add_parser("prefetch", help="download map tiles for offline use")
+    s.add_argument("--bbox", required=True, help="bounding box south,west,north,east")
+    s.add_argument("--zoom", required=True, help="zoom levels (e.g. 10-15)")
+    s.add_argument("--server", choices=sorted(tiles_server), default="OSM", help="tile server")
+    s.add_argument("-w", "--workers", type=int, default=2, help="number of downloads in parallel")
+    s.add_argument("-q", "--quiet", action="store_true")
+    s.set_defaults(func=cmd_prefetch)
+
+    s = sub.add_parser("static", help="download the Leaflet files of the map (used if the static directory is missing)")
+    s.set_defaults(func=cmd_static)
+
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    dump_at_exit(args.metrics)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Lazy photo list model for PhotoGeoTagger.
+
+The rows of the model are indices of the photo Catalog (file names and
+positions).
+The thumbnails are decoded on demand when the view asks for the decoration
+of a row (only visible rows are asked for when the view uses uniform item
+sizes), the neighbouring rows are prefetched and the pixmaps are kept in a
+bounded LRU so that memory use does not depend on the number of pictures.
+"""
+
+import collections
+import threading
+
+from PyQt5.QtCore import (Qt, QObject, QRunnable, QThreadPool, QAbstractListModel,
+                          QModelIndex, QVariant, pyqtSignal)
+from PyQt5.QtGui import QImage, QPixmap, QIcon, QBrush, QColor
+
+from metrics import METRICS
+from thumbnails import dhash_pixels
+from duplicates import dhash
+
+# number of pixmaps kept in memory
+PIXMAP_CACHE_SIZE = 512
+
+# number of rows prefetched before and after a requested row
+PREFETCH_ROWS = 8
+
+# maximum number of thumbnail requests waiting to be loaded (older requests are dropped)
+MAX_PENDING = 256
+
+
+class ThumbnailTask(QRunnable):
+
+    def __init__(self, loader, path):
+        super(ThumbnailTask, self).__init__()
+        self.loader = loader
+        self.path = path
+
+    def run(self):
+        # the request may be stale if the user scrolled away
+        if not self.loader.wanted(self.path):
+            return
+        try:
+            with METRICS.timer("thumbnail.load"):
+                image = self.loader.load(self.path)
+        except Exception as e:
+            print('error loading thumbnail of {}: {}'.format(self.path, e))
+            image = QImage()
+        self.loader.done(self.path)
+        self.loader.loaded.emit(self.path, image)
+
+
+class ThumbnailLoader(QObject):
+    """
+    load thumbnails on a thread pool, most recent requests first
+    """
+
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, thumbnailer, cache=None, workers=None, parent=None):
+        super(ThumbnailLoader, self).__init__(parent)
+        self.thumbnailer = thumbnailer
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        if workers:
+            self.pool.setMaxThreadCount(workers)
+        self._lock = threading.Lock()
+        self._wanted = collections.OrderedDict()
+        self._priority = 0
+
+    def request(self, path):
+        """
+        ask for the thumbnail of path, loaded is emitted when ready
+        """
+        with self._lock:
+            if path in self._wanted:
+                self._wanted.move_to_end(path)
+                return
+            self._wanted[path] = True
+            while len(self._wanted) > MAX_PENDING:
+                self._wanted.popitem(last=False)
+
+        self._priority = (self._priority + 1) % 2**31
+        self.pool.start(ThumbnailTask(self, path), self._priority)
+
+    def wanted(self, path):
+        with self._lock:
+            return path in self._wanted
+
+    def done(self, path):
+        with self._lock:
+            self._wanted.pop(path, None)
+
+    def cancel(self):
+        """
+        drop all waiting requests
+        """
+        with self._lock:
+            self._wanted.clear()
+        self.pool.clear()
+
+    def load(self, path):
+        """
+        return the thumbnail of path from the cache or from the picture
+        """
+        if self.cache is not None:
+            entry = self.cache.get(path)
+            if entry and entry[1]:
+                image = self.thumbnailer.decode(entry[1])
+                if image is not None:
+                    return image
+
+        image = self.thumbnailer(path)
+        if self.cache is not None and not image.isNull():
+            self.cache.put_thumbnail(path, self.thumbnailer.encode(image))
+            # the perceptual hash costs little once the thumbnail is decoded
+            self.cache.put_dhash(path, dhash(dhash_pixels(image)))
+        return image
+
+
+class PhotoListModel(QAbstractListModel):
+
+    def __init__(self, loader, catalog, thumbnailSize, parent=None):
+        """
+        loader: ThumbnailLoader
+        catalog: Catalog of the pictures
+        """
+        super(PhotoListModel, self).__init__(parent)
+        self.loader = loader
+        self.catalog = catalog
+        self._rows = []
+        self._rowOf = {}
+        self._pixmaps = collections.OrderedDict()
+
+        self._placeholder = QPixmap(thumbnailSize, thumbnailSize * 3 // 4)
+        self._placeholder.fill(QColor(220, 220, 220))
+
+        self.loader.loaded.connect(self.thumbnailLoaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def flags(self, index):
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return QVariant()
+
+        i = self._rows[index.row()]
+
+        if role == Qt.DisplayRole:
+            return self.catalog.label(i)
+        if role == Qt.DecorationRole:
+            return QIcon(self.thumbnail(index.row()))
+        if role == Qt.ForegroundRole:
+            # filename in red for pictures with no location
+            if not self.catalog.is_tagged(i):
+                return QBrush(QColor(255, 0, 0))
+            return QBrush(QColor(0, 0, 0))
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignHCenter
+        if role == Qt.ToolTipRole:
+            place = self.catalog.places[i]
+            if place and place.city:
+                return "{}\n{}, {}, {}".format(self.catalog.paths[i], place.city, place.region, place.country)
+            return self.catalog.paths[i]
+
+        return QVariant()
+
+    def catalogIndex(self, row):
+        """
+        return the catalog index of row
+        """
+        return self._rows[row]
+
+    def row(self, i):
+        """
+        return the row of catalog index i or None
+        """
+        return self._rowOf.get(i)
+
+    def extend(self, indices):
+        """
+        add the pictures of catalog indices at the end of the list in one insertion
+        """
+        indices = [i for i in dict.fromkeys(indices) if i not in self._rowOf]
+        if not indices:
+            return
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row + len(indices) - 1)
+        for i in indices:
+            self._rowOf[i] = len(self._rows)
+            self._rows.append(i)
+        self.endInsertRows()
+
+    def removeIndices(self, indices):
+        """
+        remove the pictures of catalog indices from the list
+        one removal is signalled per range of contiguous rows and the rows are renumbered once
+        """
+        rows = sorted(self._rowOf.pop(i) for i in set(indices) if i in self._rowOf)
+        if not rows:
+            return
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        # from the last range so that the rows of the next ranges do not move
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for i in self._rows[first:last + 1]:
+                self._pixmaps.pop(self.catalog.paths[i], None)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+        for r in range(rows[0], len(self._rows)):
+            self._rowOf[self._rows[r]] = r
+
+    def forgetThumbnail(self, path):
+        """
+        reload the thumbnail of path (the file was modified)
+        """
+        self._pixmaps.pop(path, None)
+        i = self.catalog.get(path)
+        if i is not None and i in self._rowOf:
+            index = self.index(self._rowOf[i])
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def clear(self):
+        self.loader.cancel()
+        self.beginResetModel()
+        self._rows = []
+        self._rowOf = {}
+        self._pixmaps.clear()
+        self.endResetModel()
+
+    def positionsChanged(self, indices):
+        """
+        refresh the rows of catalog indices after a change of position (one signal for the range of rows)
+        """
+        rows = [self._rowOf[i] for i in indices if i in self._rowOf]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)), [Qt.ForegroundRole])
+
+    def thumbnail(self, row):
+        """
+        return the pixmap of row or a placeholder while the thumbnail is loading
+        """
+        path = self.catalog.paths[self._rows[row]]
+        if path in self._pixmaps:
+            self._pixmaps.move_to_end(path)
+            return self._pixmaps[path]
+
+        # prefetch the neighbouring rows, the requested row is queued last to be loaded first
+        for r in range(max(0, row - PREFETCH_ROWS), min(len(self._rows), row + PREFETCH_ROWS + 1)):
+            neighbour = self.catalog.paths[self._rows[r]]
+            if r != row and neighbour not in self._pixmaps:
+                self.loader.request(neighbour)
+        self.loader.request(path)
+
+        return self._placeholder
+
+    def thumbnailLoaded(self, path, image):
+        with METRICS.timer("ui.thumbnail"):
+            self._thumbnailLoaded(path, image)
+
+    def _thumbnailLoaded(self, path, image):
+        i = self.catalog.get(path)
+        if i is None or i not in self._rowOf:
+            return
+        self._pixmaps[path] = QPixmap.fromImage(image) if not image.isNull() else self._placeholder
+        while len(self._pixmaps) > PIXMAP_CACHE_SIZE:
+            self._pixmaps.popitem(last=False)
+
+        index = self.index(self._rowOf[i])
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
@@ -0,0 +1,228 @@
+"""
+Parallel scanning engine for PhotoGeoTagger.
+
+The EXIF metadata are read on a pool of worker threads or processes,
+the thumbnails are generated on a pool of threads (QImage can not be
+sent between processes). Results are returned in the order of the input
+list whatever the order of completion.
+
+If a MetadataCache is given, the pictures found in the cache are not opened
+and the new results are stored in the cache. The thumbnailer must then
+provide encode(image) and decode(data) methods.
+"""
+
+import os
+import threading
+import collections
+import concurrent.futures
+
+from exifgps import scan_file
+from metrics import METRICS
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg", ".jpe")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# RAW formats whose metadata are read by exiv2
+RAW_EXTENSIONS = (".dng", ".cr2", ".crw", ".nef", ".nrw", ".orf", ".pef", ".arw", ".sr2", ".srw", ".rw2", ".raf", ".mrw")
+
+EXTENSIONS = JPEG_EXTENSIONS + TIFF_EXTENSIONS + RAW_EXTENSIONS
+
+
+def _timed_scan_file(pic):
+    with METRICS.timer("scan.exif"):
+        return scan_file(pic)
+
+
+def parse_extensions(text):
+    """
+    return the tuple of extensions of a comma or space separated list ("jpg, tif" or ".jpg .tif")
+    """
+    extensions = []
+    for ext in text.replace(",", " ").split():
+        ext = ext.lower()
+        extensions.append(ext if ext.startswith(".") else "." + ext)
+    if not extensions:
+        raise ValueError("no extension in {!r}".format(text))
+    return tuple(extensions)
+
+
+def scan_directory(directory, extensions=EXTENSIONS):
+    """
+    return the pictures [(path, mtime_ns, size), ...] and the sub-directories of directory, sorted by name
+    hidden sub-directories and links to directories are skipped
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    files, dirs = [], []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith("."):
+                        dirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    st = entry.stat()
+                    files.append((entry.path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                # file removed while scanning
+                continue
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
+
+def walk_pictures(paths, recursive=False, extensions=EXTENSIONS):
+    """
+    yield (directory, [(path, mtime_ns, size), ...]) for each directory of paths (pictures or directories)
+    directories are yielded as soon as they are read, depth first in name order
+    pictures given in paths are yielded with None as directory
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            stack = [path]
+            while stack:
+                directory = stack.pop()
+                try:
+                    files, dirs = scan_directory(directory, extensions)
+                except OSError as e:
+                    print("error reading {}: {}".format(directory, e))
+                    continue
+                yield directory, files
+                if recursive:
+                    stack.extend(reversed(dirs))
+        elif os.path.isfile(path):
+            st = os.stat(path)
+            yield None, [(path, st.st_mtime_ns, st.st_size)]
+
+
+def find_pictures(paths, recursive=False, extensions=EXTENSIONS):
+    """
+    return the sorted list of pictures of paths (pictures or directories)
+    """
+    return sorted(path for _, files in walk_pictures(paths, recursive, extensions) for path, _, _ in files)
+
+
+class ScanEngine:
+
+    def __init__(self, workers=DEFAULT_WORKERS, use_processes=False, thumbnailer=None, cache=None):
+        """
+        workers: number of workers of the pool
+        use_processes: read the metadata in processes instead of threads
+        thumbnailer: function returning the thumbnail of a picture path (None for no thumbnail)
+        cache: MetadataCache (None for no cache)
+        """
+        self.workers = max(1, workers or 1)
+        self.use_processes = use_processes
+        self.thumbnailer = thumbnailer
+        self.cache = cache
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        ask a running or next scan to stop
+        """
+        self._cancel.set()
+
+    def reset(self):
+        """
+        clear a cancel request before starting a new scan
+        """
+        self._cancel.clear()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def scan(self, imgList):
+        """
+        yield (coord, thumbnail) for each picture of imgList in the same order
+        pictures that can not be read are skipped
+        nothing is read if the engine was cancelled before (see reset)
+        """
+        if self.cancelled:
+            return
+
+        threads = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        if self.use_processes:
+            metaPool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            metaPool = threads
+
+        # limit the number of pictures in flight to bound memory use
+        window = self.workers * 4
+        pending = collections.deque()
+        pics = iter(imgList)
+
+        def done(result):
+            future = concurrent.futures.Future()
+            future.set_result(result)
+            return future
+
+        # the time of the reads in processes is not measured
+        read = scan_file if self.use_processes else _timed_scan_file
+
+        def thumbnail(pic):
+            image = self.thumbnailer(pic)
+            return image, self.thumbnailer.encode(image) if self.cache is not None else None
+
+        def submit():
+            for pic in pics:
+                cached = self._from_cache(pic)
+                if cached:
+                    METRICS.count("scan.cache_hits")
+                    pending.append((pic, done(cached[0]), done((cached[1], None)), True))
+                else:
+                    meta = metaPool.submit(read, pic)
+                    thumb = threads.submit(thumbnail, pic) if self.thumbnailer else None
+                    pending.append((pic, meta, thumb, False))
+                if len(pending) >= window:
+                    break
+
+        try:
+            submit()
+            while pending and not self.cancelled:
+                pic, meta, thumb, cached = pending.popleft()
+                try:
+                    coord = meta.result()
+                    image, data = thumb.result() if thumb else (None, None)
+                except Exception as e:
+                    print('error reading {}: {}'.format(pic, e))
+                    METRICS.count("scan.errors")
+                    continue
+                finally:
+                    submit()
+
+                if self.cache is not None and not cached:
+                    with METRICS.timer("scan.cache_put"):
+                        self.cache.put(pic, coord, data)
+
+                if self.cancelled:
+                    break
+                yield coord, image
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+            for _, meta, thumb, _ in pending:
+                meta.cancel()
+                if thumb:
+                    thumb.cancel()
+            threads.shutdown(wait=False)
+            if metaPool is not threads:
+                metaPool.shutdown(wait=False)
+
+    def _from_cache(self, pic):
+        """
+        return (coord, thumbnail) from cache or None
+        """
+        if self.cache is None:
+            return None
+        entry = self.cache.get(pic)
+        if entry is None:
+            return None
+        coord, data = entry
+        if not self.thumbnailer:
+            return coord, None
+        if not data:
+            return None
+        image = self.thumbnailer.decode(data)
+        return (coord, image) if image is not None else None
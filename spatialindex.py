@@ -0,0 +1,265 @@
+"""
+Spatial index of the photo positions for PhotoGeoTagger.
+
+The positions are stored in a uniform grid of CELL degrees (a dictionary of
+the non-empty cells): a bounding box query reads only the cells of the box
+(or only the non-empty cells if the box holds more cells than that).
+
+Coarser grids (each cell holding FANOUT x FANOUT cells of the finer grid)
+count the positions of their cells. The nearest photos of a point are
+searched best first from the coarsest grid: the cells are read in the order
+of their distance to the point and the empty cells are never visited, so a
+query reads a few dozen cells whether the photos are dense or sparse.
+
+The distances are computed with the equirectangular approximation at the
+latitude of the query point (exact enough at the scale of a map click).
+
+KDTree is a static index of many positions (the places of a gazetteer)
+stored in arrays: the positions are converted to points of the unit sphere
+so that the nearest position is exact at any distance and across the
+antimeridian.
+
+This module does not depend on Qt.
+"""
+
+import math
+import array
+import heapq
+
+# size of the cells in degrees (about 110 m of latitude)
+CELL = 0.001
+
+# number of cells of a grid on each side of a cell of the next coarser grid
+FANOUT = 4
+
+# meters per degree of latitude
+METERS_PER_DEGREE = 6371008.8 * math.pi / 180
+
+
+class GridIndex:
+
+    def __init__(self, cell=CELL):
+        self.cell = cell
+        self.rows = int(math.ceil(180 / cell))
+        self.columns = int(math.ceil(360 / cell))
+        # number of coarser grids, the coarsest has at most 16 columns
+        self.levels = 0
+        while self.columns / FANOUT ** self.levels > 16:
+            self.levels += 1
+        self.clear()
+
+    def clear(self):
+        # (row, column) -> set of ids
+        self._cells = {}
+        # counts[l - 1]: (row, column) -> number of ids in the cells of level l
+        self._counts = [{} for _ in range(self.levels)]
+        # id -> (lat, lon, (row, column))
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, id_):
+        return id_ in self._points
+
+    def _row(self, lat):
+        return min(max(int(math.floor((lat + 90) / self.cell)), 0), self.rows - 1)
+
+    def _column(self, lon):
+        return min(max(int(math.floor((lon + 180) / self.cell)), 0), self.columns - 1)
+
+    def insert(self, id_, lat, lon):
+        """
+        add id at position (lat, lon), an id already in index is moved
+        """
+        key = (self._row(lat), self._column(lon))
+        old = self._points.get(id_)
+        if old is not None:
+            if old[2] == key:
+                self._points[id_] = (lat, lon, key)
+                return
+            self.remove(id_)
+        self._points[id_] = (lat, lon, key)
+        self._cells.setdefault(key, set()).add(id_)
+        row, col = key
+        for counts in self._counts:
+            row, col = row // FANOUT, col // FANOUT
+            counts[(row, col)] = counts.get((row, col), 0) + 1
+
+    def remove(self, id_):
+        point = self._points.pop(id_, None)
+        if point is None:
+            return
+        ids = self._cells[point[2]]
+        ids.discard(id_)
+        if not ids:
+            del self._cells[point[2]]
+        row, col = point[2]
+        for counts in self._counts:
+            row, col = row // FANOUT, col // FANOUT
+            if counts[(row, col)] == 1:
+                del counts[(row, col)]
+            else:
+                counts[(row, col)] -= 1
+
+    def position(self, id_):
+        lat, lon, _ = self._points[id_]
+        return lat, lon
+
+    def in_bbox(self, south, west, north, east):
+        """
+        return the list of ids in the bounding box
+        the box can cross the antimeridian (west > east)
+        """
+        if west > east:
+            return self.in_bbox(south, west, north, 180) + self.in_bbox(south, -180, north, east)
+
+        row0, row1 = self._row(south), self._row(north)
+        col0, col1 = self._column(west), self._column(east)
+
+        if (row1 - row0 + 1) * (col1 - col0 + 1) <= len(self._cells):
+            cells = ((key, self._cells.get(key)) for key in
+                     ((row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)))
+        else:
+            cells = ((key, ids) for key, ids in self._cells.items()
+                     if row0 <= key[0] <= row1 and col0 <= key[1] <= col1)
+
+        result = []
+        points = self._points
+        for (row, col), ids in cells:
+            if not ids:
+                continue
+            if row0 < row < row1 and col0 < col < col1:
+                # cell inside the box
+                result.extend(ids)
+            else:
+                for id_ in ids:
+                    lat, lon, _ = points[id_]
+                    if south <= lat <= north and west <= lon <= east:
+                        result.append(id_)
+        return result
+
+    def nearest(self, lat, lon, k=1, max_distance=None):
+        """
+        return the k nearest ids of (lat, lon) as a list of (distance in meters, id) sorted by distance
+        ids farther than max_distance (meters) are not returned
+        """
+        if not self._points or k < 1:
+            return []
+
+        coslat = max(math.cos(math.radians(lat)), 1e-6)
+        limit = (max_distance / METERS_PER_DEGREE) ** 2 if max_distance is not None else math.inf
+        points = self._points
+
+        def bound(level, row, col):
+            """
+            lower bound of the squared distance of the positions of a cell
+            """
+            size = self.cell * FANOUT ** level
+            lat0 = row * size - 90
+            dlat = max(lat0 - lat, lat - min(lat0 + size, 90), 0)
+            # the last cells of the coarse grids end after the antimeridian
+            lon0, lon1 = col * size - 180, min((col + 1) * size - 180, 180)
+            if lon0 <= lon <= lon1:
+                dlon = 0
+            else:
+                dlon = min((lon0 - lon) % 360, (lon - lon1) % 360)
+            return dlat ** 2 + (dlon * coslat) ** 2
+
+        # (squared distance, level, key): level -1 for a position (key is its id)
+        heap = []
+        if self.levels:
+            for (row, col) in self._counts[-1]:
+                heapq.heappush(heap, (bound(self.levels, row, col), self.levels, (row, col)))
+        else:
+            for (row, col) in self._cells:
+                heapq.heappush(heap, (bound(0, row, col), 0, (row, col)))
+
+        result = []
+        while heap and len(result) < k:
+            d2, level, key = heapq.heappop(heap)
+            if d2 > limit:
+                break
+            if level < 0:
+                result.append((math.sqrt(d2) * METERS_PER_DEGREE, key))
+            elif level == 0:
+                for id_ in self._cells[key]:
+                    plat, plon, _ = points[id_]
+                    dlon = (plon - lon + 180) % 360 - 180
+                    heapq.heappush(heap, ((plat - lat) ** 2 + (dlon * coslat) ** 2, -1, id_))
+            else:
+                cells = self._counts[level - 2] if level > 1 else self._cells
+                row0, col0 = key[0] * FANOUT, key[1] * FANOUT
+                for row in range(row0, row0 + FANOUT):
+                    for col in range(col0, col0 + FANOUT):
+                        if (row, col) in cells:
+                            heapq.heappush(heap, (bound(level - 1, row, col), level - 1, (row, col)))
+        return result
+
+
+class KDTree:
+
+    def __init__(self, lats, lons):
+        """
+        build the tree of the positions (lat, lon) of the sequences lats and lons
+        the id of a position is its index in the sequences
+        """
+        points = [(math.cos(math.radians(lat)) * math.cos(math.radians(lon)),
+                   math.cos(math.radians(lat)) * math.sin(math.radians(lon)),
+                   math.sin(math.radians(lat))) for lat, lon in zip(lats, lons)]
+        n = len(points)
+        # implicit balanced tree: the node of the range [lo, hi) is at (lo + hi) // 2
+        self.xs, self.ys, self.zs = array.array("d", bytes(8 * n)), array.array("d", bytes(8 * n)), array.array("d", bytes(8 * n))
+        self.ids = array.array("l", bytes(array.array("l").itemsize * n))
+        self.axes = array.array("b", bytes(n))
+
+        coords = [[point[axis] for point in points] for axis in range(3)]
+        stack = [(0, n, list(range(n)), 0)]
+        while stack:
+            lo, hi, items, axis = stack.pop()
+            if lo >= hi:
+                continue
+            items.sort(key=coords[axis].__getitem__)
+            mid = (lo + hi) // 2
+            median = items[mid - lo]
+            self.xs[mid], self.ys[mid], self.zs[mid] = points[median]
+            self.ids[mid] = median
+            self.axes[mid] = axis
+            stack.append((lo, mid, items[:mid - lo], (axis + 1) % 3))
+            stack.append((mid + 1, hi, items[mid - lo + 1:], (axis + 1) % 3))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, lat, lon):
+        """
+        return (distance in meters, id) of the position nearest to (lat, lon) or None if the tree is empty
+        """
+        if not len(self.ids):
+            return None
+        q = (math.cos(math.radians(lat)) * math.cos(math.radians(lon)),
+             math.cos(math.radians(lat)) * math.sin(math.radians(lon)),
+             math.sin(math.radians(lat)))
+        xs, ys, zs, axes = self.xs, self.ys, self.zs, self.axes
+
+        best, bestD2 = -1, math.inf
+        # (lo, hi, lower bound of the squared distance of the range)
+        stack = [(0, len(self.ids), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if lo >= hi or bound >= bestD2:
+                continue
+            mid = (lo + hi) // 2
+            p = (xs[mid], ys[mid], zs[mid])
+            d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if d2 < bestD2:
+                best, bestD2 = mid, d2
+            diff = q[axes[mid]] - p[axes[mid]]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # the far side is read last
+            stack.append(far + (diff * diff,))
+            stack.append(near + (bound,))
+
+        # chord length to great circle distance
+        return 2 * math.asin(min(math.sqrt(bestD2) / 2, 1)) * METERS_PER_DEGREE * 180 / math.pi, self.ids[best]
+
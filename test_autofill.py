@@ -0,0 +1,62 @@
+import pytest
+
+from autofill import autofill
+from catalog import Catalog
+
+
+def photos(*pictures):
+    """
+    pictures: (seconds after 10:00:00, position or None)
+    """
+    c = Catalog()
+    for k, (seconds, gps) in enumerate(pictures):
+        datetime = "2018:09:25 10:{:02d}:{:02d}".format(seconds // 60, seconds % 60) if seconds is not None else None
+        c.add("/p/{}.jpg".format(k), gps or (0, 0, 0), datetime)
+    return c
+
+
+A = (45.0, 7.0, 100.0)
+B = (46.0, 8.0, 200.0)
+
+
+def test_interpolate():
+    c = photos((0, A), (30, None), (120, B))
+    [(i, gps, sources)] = autofill(c)
+    assert (i, sources) == (1, (0, 2))
+    assert gps == pytest.approx((45.25, 7.25, 125.0))
+    # nothing is modified
+    assert not c.is_tagged(1)
+
+
+def test_copy_nearest():
+    c = photos((0, A), (30, None), (100, None), (120, B))
+    assert autofill(c, interpolate=False) == [(1, A, (0,)), (2, B, (3,))]
+
+
+def test_window():
+    c = photos((0, A), (100, None), (1000, None), (1090, B), (1500, None))
+    assert autofill(c, window=100) == [(1, A, (0,)), (2, B, (3,))]
+    assert autofill(c, window=10) == []
+
+
+def test_photos_without_time_are_skipped():
+    c = photos((0, A), (None, None), (10, None))
+    assert [i for i, _, _ in autofill(c)] == [2]
+
+
+def test_indices():
+    c = photos((0, A), (10, None), (20, None))
+    assert [i for i, _, _ in autofill(c, indices=[2, 0])] == [2]
+
+
+def test_interpolate_across_antimeridian():
+    c = photos((0, (0.0, 179.0, 0.0)), (50, None), (100, (0.0, -179.0, 0.0)))
+    [(_, gps, _)] = autofill(c)
+    assert abs(gps[1]) == pytest.approx(180.0)
+
+
+def test_same_time():
+    c = photos((0, A), (0, None), (0, B))
+    [(i, gps, sources)] = autofill(c)
+    assert (i, sources) == (1, (0, 2))
+    assert gps == pytest.approx(A)
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyexiv2")
+
+import pyexiv2
+from PyQt5.QtGui import QGuiApplication
+
+import benchmark
+from benchmark import percentiles, stage_result, generate_corpus, compare
+from exifgps import scan_file, NO_POSITION
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QGuiApplication.instance() or QGuiApplication([])
+
+
+@pytest.fixture(scope="module")
+def corpus(app, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("corpus"))
+    return generate_corpus(directory, 10, 320, 240, gps=0.5, seed=1)
+
+
+def contents(paths):
+    result = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            result[path] = f.read()
+    return result
+
+
+def test_percentiles():
+    assert percentiles([]) == {}
+    values = [k / 1000 for k in range(100, 0, -1)]
+    assert percentiles(values) == pytest.approx({"p50": 50, "p90": 90, "p99": 99, "max": 100})
+    assert percentiles([0.002]) == pytest.approx({"p50": 2, "p90": 2, "p99": 2, "max": 2})
+
+
+def test_stage_result():
+    result = stage_result(10, 2.0, [0.1, 0.3])
+    assert result["items_per_s"] == 5.0
+    assert result["latency_ms"]["max"] == pytest.approx(300)
+    assert result["peak_rss_mb"] > 0
+    assert stage_result(0, 0, [])["items_per_s"] is None
+
+
+def test_generate_corpus(corpus):
+    assert [os.path.basename(path) for path in corpus] == ["IMG_{:06d}.jpg".format(n) for n in range(10)]
+    assert sorted(os.listdir(os.path.dirname(corpus[0]))) == sorted(os.path.basename(path) for path in corpus)
+    coords = [scan_file(path) for path in corpus]
+    tagged = [c for c in coords if c['gps'] != NO_POSITION]
+    assert 0 < len(tagged) < len(coords)
+    assert all(44.9 <= c['gps'][0] <= 45.2 and 7.5 <= c['gps'][1] <= 7.8 for c in tagged)
+    # 7 s between two pictures
+    assert coords[1]['datetime'] == "2018:09:25 08:00:07"
+    metadata = pyexiv2.ImageMetadata(corpus[0])
+    metadata.read()
+    assert metadata.exif_thumbnail.data[:2] == b"\xff\xd8"
+
+
+def test_generate_corpus_without_gps_and_previews(app, tmp_path):
+    paths = generate_corpus(str(tmp_path), 3, 64, 48, gps=0, previews=False)
+    assert all(scan_file(path)['gps'] == NO_POSITION for path in paths)
+    metadata = pyexiv2.ImageMetadata(paths[0])
+    metadata.read()
+    assert not metadata.exif_thumbnail.data
+
+
+def test_bench_write_leaves_corpus_unchanged(corpus):
+    before = contents(corpus)
+    result = benchmark.bench_write(corpus, 2)
+    assert contents(corpus) == before
+    assert result["items"] == len(corpus)
+    assert result["errors"] == 0
+    assert result["batch_patched"] + result["batch_unchanged"] + result["batch_rewritten"] == len(corpus)
+
+
+def test_bench_scan_and_thumbnail(corpus):
+    assert benchmark.bench_scan(corpus, 2)["items"] == len(corpus)
+    result = benchmark.bench_thumbnail(corpus, 2)
+    assert result["strategies"]["exif"] == len(corpus)
+
+
+def test_bench_load_with_cache(corpus, tmp_path):
+    from thumbcache import MetadataCache
+
+    cache = MetadataCache(str(tmp_path / "cache.sqlite"))
+    try:
+        directory = os.path.dirname(corpus[0])
+        assert benchmark.bench_load(directory, 2, cache)["items"] == len(corpus)
+        assert benchmark.bench_load(directory, 2, cache)["items"] == len(corpus)
+    finally:
+        cache.close()
+
+
+def test_bench_convert_and_spatial():
+    result = benchmark.bench_convert(2500)
+    assert result["items"] == 2500
+    # one latency per batch
+    assert result["latency_ms"]["p50"] > 0
+    result = benchmark.bench_spatial(1000)
+    assert result["positions"] == 1000
+    assert result["items"] == benchmark.SPATIAL_QUERIES
+    assert set(result["bbox_latency_ms"]) == {"p50", "p90", "p99", "max"}
+
+
+def test_compare(capsys):
+    old = {"stages": {"scan": {"items_per_s": 100.0}, "startup": {"first_thumbnail_s": 2.5}}}
+    report = {"stages": {"scan": {"items_per_s": 150.0}, "write": {"items_per_s": 10.0},
+                        "startup": {"first_thumbnail_s": 1.25}}}
+    compare(report, old)
+    lines = capsys.readouterr().err.splitlines()
+    assert lines[0].split() == ["scan", "100.0", "->", "150.0", "items/s", "+50.0%"]
+    assert lines[1].split() == ["startup", "2.50", "->", "1.25", "s", "to", "first", "thumbnail"]
+    assert len(lines) == 2
+
+
+def run(*argv):
+    program = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.py")
+    return subprocess.run([sys.executable, program] + list(argv), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=120)
+
+
+def test_command_line(tmp_path):
+    output = str(tmp_path / "report.json")
+    corpus = str(tmp_path / "corpus")
+    process = run("--count", "4", "--size", "64x48", "--stages", "scan,convert,write",
+                  "--convert-count", "100", "--corpus", corpus, "-w", "2", "-o", output)
+    assert process.returncode == 0, process.stderr
+    with open(output) as f:
+        report = json.load(f)
+    assert sorted(report["stages"]) == ["convert", "scan", "write"]
+    assert report["corpus"]["count"] == 4
+    # the corpus directory given is kept
+    assert len(os.listdir(corpus)) == 4
+
+    process = run("--count", "2", "--size", "64x48", "--stages", "scan", "--compare", output)
+    assert process.returncode == 0, process.stderr
+    assert "items/s" in process.stderr
+    assert "scan" in json.loads(process.stdout)["stages"]
+
+
+def test_unknown_stage():
+    assert run("--count", "1", "--size", "16x16", "--stages", "nope").returncode == 2
@@ -0,0 +1,110 @@
+import math
+
+import pytest
+
+import catalog
+from catalog import Catalog, NO_POSITION
+
+
+@pytest.fixture(params=["numpy", "no numpy"])
+def photos(request, monkeypatch):
+    if request.param == "no numpy":
+        monkeypatch.setattr(catalog, "numpy", None)
+    elif catalog.numpy is None:
+        pytest.skip("numpy is not installed")
+    c = Catalog()
+    c.add("/p/a.jpg", (45.0, 7.0, 100.0), "2018:09:25 10:11:12")
+    c.add("/p/b.JPG")
+    c.add("/p/c.jpg", (-33.9, 151.2, 0.0), "invalid")
+    return c
+
+
+def test_add(photos):
+    assert len(photos) == 3
+    assert "/p/b.JPG" in photos
+    assert photos.index("/p/c.jpg") == 2
+    assert photos.get("/p/d.jpg") is None
+    with pytest.raises(KeyError):
+        photos.index("/p/d.jpg")
+    assert photos.label(1) == "b"
+    assert photos.coord(0) == {'gps': (45.0, 7.0, 100.0), 'filename': "/p/a.jpg", 'datetime': "2018:09:25 10:11:12"}
+    assert photos.has_time(0) and not photos.has_time(1) and not photos.has_time(2)
+    assert math.isnan(photos.times[2])
+
+
+def test_add_again_keeps_unsaved_position(photos):
+    assert photos.add("/p/a.jpg", (1.0, 2.0, 3.0)) == (0, False)
+    assert photos.position(0) == (1.0, 2.0, 3.0)
+    assert not photos.has_time(0)
+    photos.set_position(0, (4.0, 5.0, 6.0))
+    photos.add("/p/a.jpg", (1.0, 2.0, 3.0))
+    assert photos.position(0) == (4.0, 5.0, 6.0)
+
+
+def test_add_again_clears_place_of_old_position(photos):
+    photos.set_place(0, "Turin")
+    photos.add("/p/a.jpg", (45.0, 7.0, 100.0))
+    assert photos.places[0] == "Turin"
+    photos.add("/p/a.jpg", (45.5, 7.0, 100.0))
+    assert photos.places[0] is None
+    # a position not saved is kept with its place
+    photos.set_position(2, (-33.8, 151.2, 0.0))
+    photos.set_place(2, "Sydney")
+    photos.add("/p/c.jpg", (1.0, 2.0, 0.0))
+    assert photos.places[2] == "Sydney"
+
+
+def test_tagged(photos):
+    assert photos.tagged() == [0, 2]
+    assert photos.untagged() == [1]
+    photos.set_position(1, (10.0, 0.0, 0.0))
+    photos.set_position(0, NO_POSITION)
+    assert photos.tagged() == [1, 2]
+    assert photos.untagged() == [0]
+    assert photos.is_tagged(1) and not photos.is_tagged(0)
+
+
+def test_dirty(photos):
+    assert not photos.has_changes()
+    photos.set_place(2, "Sydney")
+    photos.set_position(2, (-33.8, 151.2, 0.0))
+    photos.set_position(0, (45.0, 7.0, 0.0), dirty=False)
+    assert photos.dirty_indices() == [2]
+    assert photos.is_dirty(2) and not photos.is_dirty(0)
+    assert photos.places[2] is None
+    photos.mark_clean(2)
+    assert not photos.has_changes()
+
+
+def test_remove(photos):
+    photos.set_position(0, (45.5, 7.5, 0.0))
+    assert photos.remove("/p/a.jpg") == 0
+    assert photos.remove("/p/a.jpg") is None
+    assert len(photos) == 2
+    assert "/p/a.jpg" not in photos
+    assert photos.indices() == [1, 2]
+    assert photos.tagged() == [2]
+    assert photos.untagged() == [1]
+    assert not photos.has_changes()
+    assert photos.in_bbox(-90, -180, 90, 180) == [2]
+    # a new picture gets a new index
+    assert photos.add("/p/a.jpg") == (3, True)
+
+
+def test_spatial_queries(photos):
+    assert photos.in_bbox(44, 6, 46, 8) == [0]
+    # across the antimeridian
+    assert photos.in_bbox(-40, 150, -30, -170) == [2]
+    photos.set_position(0, (45.0, 7.01, 0.0))
+    assert photos.in_bbox(44, 6, 46, 7.005) == []
+    distance, i = photos.nearest(45.0, 7.0)[0]
+    assert i == 0
+    assert distance == pytest.approx(787, rel=0.01)
+    assert photos.nearest(45.0, 7.0, max_distance=100) == []
+
+
+def test_clear(photos):
+    photos.clear()
+    assert len(photos) == 0
+    assert photos.tagged() == [] and photos.untagged() == []
+    assert photos.in_bbox(-90, -180, 90, 180) == []
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+pytest.importorskip("pyexiv2")
+
+import photogeotagger_cli
+from exifgps import scan_file
+from exifpatch import INDEXES
+from exporters import read_positions
+from test_exifpatch import jpeg, tagged
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    INDEXES.clear()
+    yield
+    INDEXES.clear()
+
+
+@pytest.fixture
+def photos(tmp_path):
+    """
+    a.jpg and sub/c.jpg with position, b.jpg without position, d.png ignored
+    """
+    tagged(tmp_path, (45.1, 7.6, 300.0), name="a.jpg")
+    (tmp_path / "b.jpg").write_bytes(jpeg("<", [], gps_ifd=False))
+    (tmp_path / "sub").mkdir()
+    tagged(tmp_path / "sub", (-33.5, 151.25, 0.0), name="c.jpg")
+    (tmp_path / "d.png").write_bytes(b"png")
+    return tmp_path
+
+
+def run(capsys, *argv):
+    code = photogeotagger_cli.main(list(argv))
+    out, err = capsys.readouterr()
+    return code, out, err
+
+
+def position(path):
+    return tuple(round(v, 5) for v in scan_file(str(path))['gps'])
+
+
+def test_does_not_import_qt():
+    code = "import sys, photogeotagger_cli; sys.exit(any(m.startswith('PyQt5') for m in sys.modules))"
+    subprocess.check_call([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_scan(capsys, photos):
+    assert run(capsys, "scan", "--threads", str(photos)) == (0, "2 pictures, 1 with position, 1 without position\n", "")
+    # metadata read in worker processes
+    code, out, _ = run(capsys, "scan", "-r", "-w", "2", str(photos))
+    assert out == "3 pictures, 2 with position, 1 without position\n"
+
+
+def test_scan_extensions(capsys, photos):
+    (photos / "e.JPEG").write_bytes(jpeg("<", [], gps_ifd=False))
+    _, out, _ = run(capsys, "scan", "--threads", "--ext", "jpeg", str(photos))
+    assert out.startswith("1 pictures")
+
+
+def test_list(capsys, photos):
+    code, out, _ = run(capsys, "list", "--threads", "-r", str(photos))
+    assert code == 0
+    lines = [line.split("\t") for line in out.splitlines()]
+    assert [os.path.basename(line[0]) for line in lines] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert lines[0][1:4] == ["45.1000000", "7.6000000", "300.0"]
+    assert lines[1][1:4] == ["", "", ""]
+    assert lines[2][1:3] == ["-33.5000000", "151.2500000"]
+
+    _, out, _ = run(capsys, "list", "--threads", "-r", "-u", str(photos))
+    assert [os.path.basename(line.split("\t")[0]) for line in out.splitlines()] == ["b.jpg"]
+
+
+def positions_csv(photos, rows):
+    path = photos / "positions.csv"
+    path.write_text("".join("{},{},{},{}\n".format(*row) for row in rows))
+    return str(path)
+
+
+def test_apply_dry_run(capsys, photos):
+    csv = positions_csv(photos, [("a.jpg", 1.0, 2.0, 0), ("b.jpg", 10.5, 20.25, 5)])
+    before = {name: (photos / name).read_bytes() for name in ("a.jpg", "b.jpg")}
+    code, out, err = run(capsys, "apply", "--threads", "-n", "--positions", csv, str(photos))
+    assert code == 0
+    # a.jpg already has a position
+    assert out == "{}\t10.5000000\t20.2500000\t5.0\n".format(photos / "b.jpg")
+    assert "1 pictures would be modified" in err
+    assert {name: (photos / name).read_bytes() for name in before} == before
+
+
+def test_apply_replace_in_place(capsys, photos):
+    csv = positions_csv(photos, [("a.jpg", 1.0, 2.0, 3.0)])
+    size = os.path.getsize(str(photos / "a.jpg"))
+    code, out, err = run(capsys, "apply", "--threads", "-q", "-v", "--replace", "--positions", csv, str(photos))
+    assert code == 0
+    path, mode, read, written = out.split("\t")
+    assert (path, mode) == (str(photos / "a.jpg"), "patched")
+    assert "1 pictures modified, 0 errors (1 patched in place" in err
+    assert position(photos / "a.jpg") == (1.0, 2.0, 3.0)
+    assert os.path.getsize(str(photos / "a.jpg")) == size
+
+
+def test_apply_no_in_place(capsys, photos):
+    csv = positions_csv(photos, [("a.jpg", 1.0, 2.0, 3.0), ("b.jpg", 10.5, 20.25, 5.0)])
+    code, out, err = run(capsys, "apply", "--threads", "-q", "-v", "--replace", "--no-in-place",
+                         "--positions", csv, str(photos))
+    assert code == 0
+    assert sorted(line.split("\t")[1] for line in out.splitlines()) == ["rewritten", "rewritten"]
+    assert "2 pictures modified, 0 errors (0 patched in place, 0 unchanged, 2 rewritten" in err
+    assert position(photos / "a.jpg") == (1.0, 2.0, 3.0)
+    assert position(photos / "b.jpg") == (10.5, 20.25, 5.0)
+    # no temporary copy left
+    assert sorted(os.listdir(str(photos))) == ["a.jpg", "b.jpg", "d.png", "positions.csv", "sub"]
+
+
+def test_apply_ambiguous_file_name(capsys, photos):
+    (photos / "sub" / "b.jpg").write_bytes(jpeg("<", [], gps_ifd=False))
+    csv = positions_csv(photos, [("b.jpg", 10.5, 20.25, 5.0)])
+    code, out, err = run(capsys, "apply", "--threads", "-r", "-n", "--positions", csv, str(photos))
+    assert out == ""
+    assert err.count("file name found several times") == 2
+
+
+def test_strip(capsys, photos):
+    code, _, err = run(capsys, "strip", "--threads", "-q", "-r", str(photos))
+    assert code == 0
+    assert "2 pictures modified" in err
+    assert position(photos / "a.jpg") == position(photos / "sub" / "c.jpg") == (0, 0, 0)
+
+
+def test_export(capsys, photos):
+    output = str(photos / "out.csv")
+    code, _, err = run(capsys, "export", "--threads", "-r", "-o", output, str(photos))
+    assert code == 0
+    assert err == "2 positions exported\n"
+    positions = read_positions(output)
+    assert positions[str(photos / "a.jpg")] == pytest.approx((45.1, 7.6, 300.0))
+    assert positions[str(photos / "sub" / "c.jpg")] == pytest.approx((-33.5, 151.25, 0.0))
+
+
+def test_export_stdout(capsys, photos):
+    code, out, _ = run(capsys, "export", "--threads", "-q", "-f", "geojson", str(photos))
+    features = json.loads(out)["features"]
+    assert [f["geometry"]["coordinates"][:2] for f in features] == [pytest.approx([7.6, 45.1])]
+
+
+def test_geocode_needs_gazetteer(capsys, photos):
+    code, _, err = run(capsys, "geocode", "--threads", str(photos))
+    assert code == 2
+    assert "--gazetteer" in err
+
+
+def test_command_required(capsys):
+    with pytest.raises(SystemExit):
+        photogeotagger_cli.main([])
@@ -0,0 +1,128 @@
+import math
+import random
+import fractions
+
+import pytest
+
+import coordinates
+from coordinates import (parse_rational, parse_rationals, dms_to_decimal, decimal_to_dms, batch_decimal_to_dms,
+                         dms_fractions, batch_dms_to_decimal, altitude, altitude_rational, SECONDS_DENOMINATOR)
+
+# half of the precision of the seconds, in degrees
+MAX_ERROR = 0.5 / SECONDS_DENOMINATOR / 3600 + 1e-12
+
+
+def legacy_decCoordinate(ref, coord):
+    # previous implementation (eval based), reference of the parser
+    deg, min, sec = coord.split(" ")
+    coordDec = eval(deg) + eval(min)/60 + eval(sec)/3600
+    if ref in ["S", "W"]:
+        coordDec =- coordDec
+    return coordDec
+
+
+def legacy_decimal_to_dms(decimal):
+    # previous implementation (limit_denominator based)
+    remainder, degrees = math.modf(abs(decimal))
+    remainder, minutes = math.modf(remainder * 60)
+    return [fractions.Fraction.from_float(n).limit_denominator(99999) for n in (degrees, minutes, remainder * 60)]
+
+
+def raw(values):
+    return " ".join("{}/{}".format(f.numerator, f.denominator) for f in values)
+
+
+def decimals(n=2000, seed=0):
+    rng = random.Random(seed)
+    return [rng.uniform(-180, 180) for _ in range(n)] + [0.0, 89.99999999, -179.99999999, 1e-9, 45.5]
+
+
+def refs(values, positive="E", negative="W"):
+    return [negative if d < 0 else positive for d in values]
+
+
+def test_parse_rational():
+    assert parse_rational("123/10") == 12.3
+    assert parse_rational("12.5") == 12.5
+    assert parse_rational("7") == 7.0
+    assert parse_rationals("45/1 3/1 1234/100") == [45.0, 3.0, 12.34]
+
+
+def test_zero_denominator():
+    assert parse_rational("5/0") == 0.0
+    assert dms_to_decimal("N", "45/1 0/0 0/0") == 45.0
+    assert batch_dms_to_decimal(["N"], ["45/1 0/0 0/0"]) == [45.0]
+
+
+@pytest.mark.parametrize("text", ["", "a/b", "1/x", "1/2/3"])
+def test_malformed_rational(text):
+    with pytest.raises(ValueError):
+        parse_rational(text)
+
+
+@pytest.mark.parametrize("value", ["45/1 3/1", "45/1 3/1 4/1 5/1", ""])
+def test_malformed_coordinate(value):
+    with pytest.raises(ValueError):
+        dms_to_decimal("N", value)
+    with pytest.raises(ValueError):
+        batch_dms_to_decimal(["N"], [value])
+
+
+def test_hemisphere_refs():
+    assert dms_to_decimal("N", "45/1 30/1 0/1") == 45.5
+    assert dms_to_decimal("S", "45/1 30/1 0/1") == -45.5
+    assert dms_to_decimal("E", "7/1 6/1 0/1") == pytest.approx(7.1)
+    assert dms_to_decimal("W", "7/1 6/1 0/1") == pytest.approx(-7.1)
+    assert batch_dms_to_decimal(["S", "W", "N"], ["1/1 0/1 0/1"] * 3) == [-1.0, -1.0, 1.0]
+
+
+def test_decimal_to_dms_is_absolute():
+    assert decimal_to_dms(-45.5) == decimal_to_dms(45.5) == [45, 30, 0]
+    assert [list(dms) for dms in batch_decimal_to_dms([-45.5, 45.5])] == [[45, 30, 0], [45, 30, 0]]
+
+
+def test_round_trip():
+    values = decimals()
+    for d, ref in zip(values, refs(values)):
+        assert abs(dms_to_decimal(ref, raw(decimal_to_dms(d))) - d) <= MAX_ERROR
+
+
+def test_batch_round_trip():
+    values = decimals()
+    raws = [raw(dms_fractions(dms)) for dms in batch_decimal_to_dms(values)]
+    for d, back in zip(values, batch_dms_to_decimal(refs(values), raws)):
+        assert abs(back - d) <= MAX_ERROR
+
+
+def test_batch_matches_single():
+    values = decimals()
+    assert [tuple(dms) for dms in batch_decimal_to_dms(values)] == [coordinates._split(d) for d in values]
+    raws = [raw(decimal_to_dms(d)) for d in values]
+    for a, b in zip(batch_dms_to_decimal(refs(values), raws), (dms_to_decimal(r, x) for r, x in zip(refs(values), raws))):
+        assert a == pytest.approx(b, abs=1e-12)
+
+
+def test_batch_without_numpy(monkeypatch):
+    monkeypatch.setattr(coordinates, "numpy", None)
+    test_batch_round_trip()
+
+
+def test_minutes_and_seconds_in_range():
+    for dms in batch_decimal_to_dms(decimals()):
+        assert 0 <= dms[1] < 60
+        assert 0 <= dms[2] < 60 * SECONDS_DENOMINATOR
+
+
+def test_parser_agrees_with_legacy():
+    values = decimals(500)
+    for d, ref in zip(values, refs(values, "N", "S")):
+        text = raw(legacy_decimal_to_dms(d))
+        assert dms_to_decimal(ref, text) == pytest.approx(legacy_decCoordinate(ref, text), abs=1e-12)
+
+
+def test_altitude():
+    assert altitude("0", "12345/100") == 123.45
+    assert altitude("1", "12345/100") == -123.45
+    assert altitude(None, "10/1") == 10.0
+    assert altitude_rational(-123.456) == (fractions.Fraction(12346, 100), "1")
+    assert altitude_rational(12.0) == (fractions.Fraction(12), "0")
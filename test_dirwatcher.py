@@ -0,0 +1,153 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyexiv2")
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+
+import dirwatcher
+from dirwatcher import DirectoryWatcher
+from scanner import walk_pictures
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def touch(directory, name, data=b"jpeg"):
+    path = directory / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    touch(tmp_path, "a.jpg")
+    touch(tmp_path, "b.jpg")
+    touch(tmp_path, "sub/c.jpg")
+    touch(tmp_path, "sub/deep/d.nef")
+    touch(tmp_path, "z/e.tif")
+    return tmp_path
+
+
+def watch(tree, recursive=True):
+    watcher = DirectoryWatcher()
+    watcher.recursive = recursive
+    for directory, files in walk_pictures([str(tree)], recursive):
+        watcher.set_directory(directory, files)
+    changes = []
+    watcher.changed.connect(lambda *args: changes.append(args))
+    return watcher, changes
+
+
+def update(watcher, *directories):
+    for directory in directories:
+        watcher._directoryChanged(str(directory))
+    watcher.timer.stop()
+    watcher._update()
+
+
+def test_walk_pictures_depth_first(tree):
+    walk = walk_pictures([str(tree)], recursive=True)
+    directory, files = next(walk)
+    assert directory == str(tree)
+    assert [os.path.basename(path) for path, _, _ in files] == ["a.jpg", "b.jpg"]
+    assert [d for d, _ in walk] == [str(tree / "sub"), str(tree / "sub" / "deep"), str(tree / "z")]
+
+
+def test_walk_pictures_files_and_not_recursive(tree):
+    single = str(tree / "sub" / "c.jpg")
+    walk = list(walk_pictures([str(tree), single]))
+    assert [d for d, _ in walk] == [str(tree), None]
+    assert walk[1][1][0][0] == single
+
+
+def test_snapshot(app, tree):
+    watcher, _ = watch(tree)
+    snapshot = watcher.snapshot()
+    assert sorted(os.path.relpath(path, str(tree)) for path in snapshot) == \
+        ["a.jpg", "b.jpg", os.path.join("sub", "c.jpg"), os.path.join("sub", "deep", "d.nef"), os.path.join("z", "e.tif")]
+    st = os.stat(str(tree / "a.jpg"))
+    assert snapshot[str(tree / "a.jpg")] == (st.st_mtime_ns, st.st_size)
+    assert sorted(watcher.watcher.directories()) == sorted(
+        str(d) for d in (tree, tree / "sub", tree / "sub" / "deep", tree / "z"))
+
+
+def test_added_removed_modified_in_one_signal(app, tree):
+    watcher, changes = watch(tree)
+    added = touch(tree, "f.jpg")
+    touch(tree, "ignored.txt")
+    os.remove(str(tree / "a.jpg"))
+    touch(tree, "b.jpg", b"modified jpeg")
+    update(watcher, tree)
+    assert changes == [([added], [str(tree / "a.jpg")], [str(tree / "b.jpg")])]
+    # the other directories are not read again
+    update(watcher, tree)
+    assert len(changes) == 1
+
+
+def test_no_signal_without_change(app, tree):
+    watcher, changes = watch(tree)
+    update(watcher, tree, tree / "sub")
+    assert changes == []
+
+
+def test_removed_sub_directory(app, tree):
+    watcher, changes = watch(tree)
+    for name in ("sub/deep/d.nef", "sub/c.jpg"):
+        os.remove(str(tree / name))
+    os.rmdir(str(tree / "sub" / "deep"))
+    os.rmdir(str(tree / "sub"))
+    update(watcher, tree)
+    assert changes == [([], [str(tree / "sub" / "c.jpg"), str(tree / "sub" / "deep" / "d.nef")], [])]
+    assert str(tree / "sub") not in watcher.watcher.directories()
+    assert not any(path.startswith(str(tree / "sub")) for path in watcher.snapshot())
+
+
+def test_new_sub_directory(app, tree):
+    watcher, changes = watch(tree)
+    new = [touch(tree, "new/g.jpg"), touch(tree, "new/inner/h.dng")]
+    update(watcher, tree)
+    assert changes == [(new, [], [])]
+    assert str(tree / "new" / "inner") in watcher.watcher.directories()
+
+
+def test_new_sub_directory_not_recursive(app, tree):
+    watcher, changes = watch(tree, recursive=False)
+    touch(tree, "new/g.jpg")
+    update(watcher, tree)
+    assert changes == []
+    assert str(tree / "new") not in watcher.watcher.directories()
+
+
+def test_extensions(app, tree):
+    watcher, changes = watch(tree)
+    watcher.extensions = (".png",)
+    png = touch(tree, "f.png")
+    update(watcher, tree)
+    assert changes == [([png], [str(tree / "a.jpg"), str(tree / "b.jpg")], [])]
+
+
+def test_clear(app, tree):
+    watcher, _ = watch(tree)
+    watcher.clear()
+    assert watcher.snapshot() == {}
+    assert watcher.watcher.directories() == []
+
+
+def test_change_is_signalled_after_delay(app, tree, monkeypatch):
+    monkeypatch.setattr(dirwatcher, "DELAY", 10)
+    watcher, changes = watch(tree)
+    loop = QEventLoop()
+    watcher.changed.connect(loop.quit)
+    QTimer.singleShot(5000, loop.quit)
+    added = [touch(tree, "f.jpg"), touch(tree, "g.jpg")]
+    loop.exec_()
+    # the files copied together give one signal
+    assert changes == [(added, [], [])]
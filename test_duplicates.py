@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+import duplicates
+from duplicates import hamming, dhash, dhash_batch, MultiIndex, group_duplicates
+
+
+def flip(h, rng, bits):
+    for b in rng.sample(range(64), bits):
+        h ^= 1 << b
+    return h
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0, 2**64 - 1) == 64
+    assert hamming(0b1010, 0b0110) == 2
+
+
+def test_dhash():
+    # brightness increasing to the right: all the bits are set
+    assert dhash(bytes(range(9)) * 8) == 2**64 - 1
+    assert dhash(bytes(72)) == 0
+    # first row decreasing, the others flat
+    assert dhash(bytes(range(9, 0, -1)) + bytes(63)) == 0
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_dhash_batch(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(duplicates, "numpy", None)
+    elif duplicates.numpy is None:
+        pytest.skip("numpy is not installed")
+    rng = random.Random(0)
+    pixels = [bytes(rng.randrange(256) for _ in range(72)) for _ in range(20)]
+    assert dhash_batch(pixels) == [dhash(p) for p in pixels]
+    assert dhash_batch([]) == []
+
+
+@pytest.mark.parametrize("distance", [0, 3, 6, 10])
+def test_search_against_brute_force(distance):
+    rng = random.Random(distance)
+    hashes = [rng.getrandbits(64) for _ in range(200)]
+    # near copies of some hashes
+    hashes += [flip(h, rng, rng.randint(0, 12)) for h in hashes[:100]]
+    index = MultiIndex(distance)
+    for id_, h in enumerate(hashes):
+        index.add(h, id_)
+    assert len(index) == len(hashes)
+    for h in hashes[:150] + [rng.getrandbits(64) for _ in range(20)]:
+        expected = sorted((hamming(h, other), id_) for id_, other in enumerate(hashes) if hamming(h, other) <= distance)
+        assert sorted(index.search(h)) == expected
+
+
+def test_group_duplicates():
+    rng = random.Random(1)
+    a, b, c = (rng.getrandbits(64) for _ in range(3))
+    # a chain: a2 is 8 bits from a but 4 bits from a1
+    a1 = a ^ 0x0f
+    a2 = a1 ^ 0xf0
+    hashes = [("a", a), ("b", b), ("a1", a1), ("c", c), ("a2", a2), ("b1", flip(b, rng, 6)), ("c1", flip(c, rng, 7))]
+    assert group_duplicates(hashes) == [["a", "a1", "a2"], ["b", "b1"]]
+    assert group_duplicates(hashes, distance=7) == [["a", "a1", "a2"], ["b", "b1"], ["c", "c1"]]
+    assert group_duplicates([]) == []
+    assert group_duplicates([("x", a), ("y", a)], distance=0) == [["x", "y"]]
@@ -0,0 +1,158 @@
+import os
+import struct
+
+import pytest
+
+import exifpatch
+from exifpatch import (read_index, patch_gps, gps_values, INDEXES, PATCHED, UNCHANGED,
+                       LATITUDE, LONGITUDE, ALTITUDE)
+from coordinates import batch_decimal_to_dms
+
+
+def jpeg(order, gps_entries, gps_ifd=True):
+    """
+    return a JPEG with a JFIF segment and an EXIF segment holding the GPS entries [(tag, type, count, bytes)]
+    """
+    tiff = (b"II" if order == "<" else b"MM") + struct.pack(order + "HI", 42, 8)
+    gps_offset = 8 + 2 + 12 + 4
+    if gps_ifd:
+        ifd0 = struct.pack(order + "H", 1) + struct.pack(order + "HHII", 0x8825, 4, 1, gps_offset) + struct.pack(order + "I", 0)
+    else:
+        ifd0 = struct.pack(order + "H", 1) + struct.pack(order + "HHII", 0x0112, 3, 1, 1) + struct.pack(order + "I", 0)
+    data_offset = gps_offset + 2 + 12 * len(gps_entries) + 4
+    entries, extra = b"", b""
+    for tag, type_, count, value in gps_entries:
+        if len(value) <= 4:
+            entries += struct.pack(order + "HHI", tag, type_, count) + value.ljust(4, b"\0")
+        else:
+            entries += struct.pack(order + "HHII", tag, type_, count, data_offset + len(extra))
+            extra += value
+    gps = struct.pack(order + "H", len(gps_entries)) + entries + struct.pack(order + "I", 0) + extra
+    payload = b"Exif\0\0" + tiff + ifd0 + gps
+    app1 = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0\x01\x01\0\0\x01\0\x01\0\0"
+    return b"\xff\xd8" + app0 + app1 + b"\xff\xda\0\x02" + bytes(range(256)) * 8 + b"\xff\xd9"
+
+
+def tagged(tmp_path, gps, order="<", name="a.jpg"):
+    values = gps_values(gps, order=order)
+    path = tmp_path / name
+    path.write_bytes(jpeg(order, [(tag,) + values[tag] for tag in sorted(values)]))
+    return str(path)
+
+
+def gps_bytes(path, gps):
+    """
+    return True if the GPS values of path are the bytes of gps
+    """
+    index, _ = read_index(path)
+    with open(path, "rb") as f:
+        reader = exifpatch._Reader(f)
+        entries = exifpatch._entries(reader, index)
+        values = gps_values(gps, order=index.order)
+        return set(entries) == set(values) and all(
+            reader.read_at(entries[tag][2], len(data)) == data for tag, (_, _, data) in values.items())
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    INDEXES.clear()
+    yield
+    INDEXES.clear()
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+def test_read_index(tmp_path, order):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0), order)
+    index, n = read_index(path)
+    assert index.order == order
+    assert index.ifd
+    assert 0 < n < 100
+    st = os.stat(path)
+    assert (index.mtime, index.size) == (st.st_mtime_ns, st.st_size)
+
+
+def test_read_index_not_exif(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"\xff\xd8\xff\xda\0\2xx")
+    assert read_index(str(path))[0] is None
+    path.write_bytes(b"not a jpeg")
+    assert read_index(str(path))[0] is None
+    path.write_bytes(b"\xff\xd8\xff\xe1\0\x10Exif\0\0XX")
+    assert read_index(str(path))[0] is None
+
+
+@pytest.mark.parametrize("order", ["<", ">"])
+def test_patch_round_trip(tmp_path, order):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0), order)
+    before = open(path, "rb").read()
+    result, read, written = patch_gps(path, (-45.2, -7.7, 12.5))
+    assert result == PATCHED
+    assert 0 < written <= 60
+    after = open(path, "rb").read()
+    assert len(after) == len(before)
+    assert after[-2048:] == before[-2048:]
+    assert gps_bytes(path, (-45.2, -7.7, 12.5))
+    # the index is kept for the next write
+    assert INDEXES.get(path, os.stat(path)) is not None
+
+
+def test_unchanged(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    mtime = os.stat(path).st_mtime_ns
+    assert patch_gps(path, (45.1, 7.6, 300.0))[0::2] == (UNCHANGED, 0)
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_batch_dms_gives_same_bytes(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    lat, lon = batch_decimal_to_dms([45.1]), batch_decimal_to_dms([7.6])
+    assert patch_gps(path, (45.1, 7.6, 300.0), (lat[0], lon[0]))[0] == UNCHANGED
+
+
+def test_stale_index_is_read_again(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    index, _ = read_index(path)
+    stale = index._replace(mtime=index.mtime - 1)
+    assert patch_gps(path, (1.0, 2.0, 3.0), index=stale)[0] == PATCHED
+    assert gps_bytes(path, (1.0, 2.0, 3.0))
+
+
+@pytest.mark.parametrize("gps", [(45.1, 7.6, 0.0), (0, 0, 0)])
+def test_tags_to_remove_need_rewrite(tmp_path, gps):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    before = open(path, "rb").read()
+    assert patch_gps(path, gps)[0] is None
+    assert open(path, "rb").read() == before
+
+
+def test_tags_to_add_need_rewrite(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 0.0))
+    assert patch_gps(path, (45.1, 7.6, 10.0))[0] is None
+
+
+def test_no_gps_ifd(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(jpeg("<", [], gps_ifd=False))
+    assert patch_gps(str(path), (1.0, 2.0, 0.0))[0] is None
+    # nothing to remove
+    assert patch_gps(str(path), (0, 0, 0))[0] == UNCHANGED
+
+
+def test_different_layout_needs_rewrite(tmp_path):
+    values = gps_values((45.1, 7.6, 0.0))
+    # latitude with 2 rationals instead of 3
+    entries = [(tag,) + values[tag] for tag in sorted(values) if tag != LATITUDE]
+    entries.append((LATITUDE, 5, 2, values[LATITUDE][2][:16]))
+    path = tmp_path / "a.jpg"
+    path.write_bytes(jpeg("<", sorted(entries)))
+    assert patch_gps(str(path), (45.2, 7.6, 0.0))[0] is None
+
+
+def test_gps_values():
+    values = gps_values((-1.5, 2.25, -10.0))
+    assert values[exifpatch.LATITUDE_REF][2] == b"S\0"
+    assert values[exifpatch.LONGITUDE_REF][2] == b"E\0"
+    assert values[exifpatch.ALTITUDE_REF][2] == b"\1"
+    assert struct.unpack("<II", values[ALTITUDE][2]) == (10, 1)
+    assert struct.unpack("<6I", values[LONGITUDE][2]) == (2, 1, 15, 1, 0, 1)
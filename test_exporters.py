@@ -0,0 +1,102 @@
+import io
+import os
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import exporters
+from exporters import (Record, export, export_file, read_csv, read_geojson, read_positions, match_positions,
+                       format_from_name, coord_records)
+
+RECORDS = [Record("/photos/a/IMG_1.jpg", 45.1, 7.6, 300.0, "2018:09:25 10:11:12", None),
+           Record("/photos/b/IMG_2.jpg", -33.5, -70.25, 0.0, None, None)]
+
+
+def test_format_from_name():
+    assert format_from_name("x.GeoJSON") == "geojson"
+    assert format_from_name("x.json") == "geojson"
+    assert format_from_name("x.kml") == "kml"
+    assert format_from_name("x.txt") == "csv"
+
+
+def test_coord_records_skip_untagged():
+    coords = [{'filename': "a.jpg", 'gps': (1.0, 2.0, 3.0), 'datetime': None},
+              {'filename': "b.jpg", 'gps': (0, 0, 0)}]
+    assert [r.path for r in coord_records(coords)] == ["a.jpg"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "geojson"])
+def test_round_trip(tmp_path, fmt):
+    path = str(tmp_path / ("positions." + fmt))
+    assert export_file(RECORDS, path) == 2
+    assert read_positions(path) == {r.path: (r.lat, r.lon, r.alt) for r in RECORDS}
+
+
+def test_gpx_and_kml_are_valid_xml():
+    for fmt in ("gpx", "kml"):
+        f = io.StringIO()
+        export(RECORDS, f, fmt)
+        root = ET.fromstring(f.getvalue())
+        assert len([e for e in root.iter() if e.tag.endswith(("wpt", "Placemark"))]) == 2
+
+
+def test_read_csv_header_and_short_rows(tmp_path):
+    path = tmp_path / "p.csv"
+    path.write_text("path,lat,lon\na.jpg,1.5,2.5\nbad\nb.jpg,3,4,5\n")
+    assert list(read_csv(str(path))) == [("a.jpg", (1.5, 2.5, 0.0)), ("b.jpg", (3.0, 4.0, 5.0))]
+
+
+def test_read_geojson_by_small_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(exporters, "READ_SIZE", 7)
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [7.123456789, 45.5 + i, 12]},
+                 "properties": {"path": "/p/{}.jpg".format(i), "note": "x" * i}} for i in range(50)]
+    features.append({"type": "Feature", "geometry": {"type": "LineString", "coordinates": []},
+                     "properties": {"path": "/p/line.jpg"}})
+    path = tmp_path / "p.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "name": "x", "features": features, "crs": None}, indent=2))
+    positions = dict(read_geojson(str(path)))
+    assert len(positions) == 50
+    assert positions["/p/3.jpg"] == (48.5, 7.123456789, 12.0)
+
+
+def test_read_geojson_single_feature(tmp_path):
+    path = tmp_path / "p.geojson"
+    path.write_text('{"properties": {"filename": "a.jpg"}, "type": "Feature", '
+                    '"geometry": {"type": "Point", "coordinates": [2, 1]}}')
+    assert list(read_geojson(str(path))) == [("a.jpg", (1.0, 2.0, 0.0))]
+
+
+@pytest.mark.parametrize("text", ['{"features": [', '[]', '{"features": [1 2]}'])
+def test_read_geojson_invalid(tmp_path, text):
+    path = tmp_path / "p.geojson"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(read_geojson(str(path)))
+
+
+def test_match_positions_by_path():
+    found, ambiguous = match_positions({"/a/x.jpg": (1, 2, 0), os.path.abspath("rel/y.jpg"): (3, 4, 0)},
+                                       ["/a/x.jpg", "rel/y.jpg"])
+    assert found == {"/a/x.jpg": (1, 2, 0), "rel/y.jpg": (3, 4, 0)}
+    assert ambiguous == []
+
+
+def test_match_positions_unique_file_name():
+    found, ambiguous = match_positions({"IMG_1.jpg": (1, 2, 0)}, ["/a/IMG_1.jpg", "/a/IMG_2.jpg"])
+    assert found == {"/a/IMG_1.jpg": (1, 2, 0)}
+    assert ambiguous == []
+
+
+def test_match_positions_ambiguous_file_names():
+    # same name in two folders of the pictures
+    found, ambiguous = match_positions({"IMG_1.jpg": (1, 2, 0)}, ["/a/IMG_1.jpg", "/b/IMG_1.jpg"])
+    assert found == {}
+    assert ambiguous == ["/a/IMG_1.jpg", "/b/IMG_1.jpg"]
+    # same name in two folders of the positions
+    found, ambiguous = match_positions({"/x/IMG_1.jpg": (1, 2, 0), "/y/IMG_1.jpg": (3, 4, 0)}, ["/a/IMG_1.jpg"])
+    assert found == {}
+    assert ambiguous == ["/a/IMG_1.jpg"]
+    # the full path still matches
+    found, ambiguous = match_positions({"/x/IMG_1.jpg": (1, 2, 0), "/y/IMG_1.jpg": (3, 4, 0)}, ["/x/IMG_1.jpg"])
+    assert found == {"/x/IMG_1.jpg": (1, 2, 0)}
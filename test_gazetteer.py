@@ -0,0 +1,84 @@
+import zipfile
+
+import pytest
+
+import gazetteer
+from gazetteer import Gazetteer, Place, NO_PLACE
+
+
+def geonames(name, lat, lon, country, region, population):
+    fields = [""] * 19
+    fields[1], fields[4], fields[5], fields[8], fields[10], fields[14] = name, lat, lon, country, region, population
+    return "\t".join(fields)
+
+
+CITIES = "\n".join([geonames("Turin", "45.07049", "7.68682", "IT", "12", "870456"),
+                    geonames("Moncalieri", "44.99", "7.68", "IT", "12", "57000"),
+                    geonames("Suva", "-18.14161", "178.44149", "FJ", "01", "77366"),
+                    geonames("Hamlet", "45.3", "7.9", "IT", "12", "10"),
+                    geonames("Broken", "north", "7.9", "IT", "12", "10"),
+                    "short line"]) + "\n"
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "cities1000.txt"
+    path.write_text(CITIES, encoding="utf-8")
+    (tmp_path / "admin1CodesASCII.txt").write_text("IT.12\tPiedmont\tPiedmont\t3170831\n", encoding="utf-8")
+    (tmp_path / "countryInfo.txt").write_text("# comment\nIT\tITA\t380\tIT\tItaly\tRome\n", encoding="utf-8")
+    return path
+
+
+def test_load(dump):
+    gazetteer = Gazetteer.load(str(dump))
+    assert len(gazetteer) == 4
+    assert len(Gazetteer.load(str(dump), min_population=1000)) == 3
+
+
+def test_load_zip(dump, tmp_path):
+    path = tmp_path / "cities1000.zip"
+    with zipfile.ZipFile(str(path), "w") as archive:
+        archive.write(str(dump), "cities1000.txt")
+    assert len(Gazetteer.load(str(path))) == 4
+
+
+def test_load_zip_closes_archive(dump, tmp_path, monkeypatch):
+    path = tmp_path / "cities1000.zip"
+    with zipfile.ZipFile(str(path), "w") as archive:
+        archive.write(str(dump), "cities1000.txt")
+    opened = []
+
+    class ZipFile(zipfile.ZipFile):
+        def __init__(self, *args, **kwargs):
+            super(ZipFile, self).__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(gazetteer.zipfile, "ZipFile", ZipFile)
+    Gazetteer.load(str(path))
+    assert len(opened) == 1 and opened[0].fp is None
+
+
+def test_lookup(dump):
+    gazetteer = Gazetteer.load(str(dump))
+    place = gazetteer.lookup(45.06, 7.68)
+    assert place[:4] == ("Turin", "Piedmont", "Italy", "IT")
+    assert place.distance == pytest.approx(1283, rel=0.01)
+    # the names of the codes are not known
+    assert gazetteer.lookup(-18.1, 178.4)[:4] == ("Suva", "01", "FJ", "FJ")
+    # across the antimeridian
+    assert gazetteer.lookup(-18.1, -179.9, max_distance=200000).city == "Suva"
+    assert gazetteer.lookup(0.0, 0.0) is None
+    assert gazetteer.lookup(45.06, 7.68, max_distance=1000) is None
+
+
+def test_lookup_batch(dump):
+    gazetteer = Gazetteer.load(str(dump))
+    places = gazetteer.lookup_batch([(45.0, 7.68, 0.0), (0, 0, 0), (10.0, 10.0)])
+    assert places[0].city == "Moncalieri"
+    assert places[1:] == [NO_PLACE, NO_PLACE]
+
+
+def test_empty():
+    gazetteer = Gazetteer([], [], [], [], [])
+    assert gazetteer.lookup(45.0, 7.0) is None
+    assert isinstance(Gazetteer(["A"], [1.0], [2.0], ["XX"], ["00"]).lookup(1.0, 2.0), Place)
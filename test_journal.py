@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from journal import EditJournal
+
+A = (45.0, 7.0, 0.0)
+B = (46.0, 8.0, 10.0)
+C = (47.0, 9.0, 20.0)
+NONE = (0.0, 0.0, 0.0)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state" / "journal.jsonl")
+
+
+def reopen(journal):
+    journal.close()
+    return EditJournal(journal.path)
+
+
+def test_undo_redo(path):
+    journal = EditJournal(path)
+    assert not journal.can_undo() and journal.undo() == []
+    journal.record("Move", [("a", NONE, A), ("b", B, B)])
+    journal.record("Move again", [("a", A, C)])
+    assert journal.undo_label() == "Move again"
+    assert journal.undo() == [("a", A)]
+    assert journal.redo_label() == "Move again"
+    assert journal.undo() == [("a", NONE)]
+    assert not journal.can_undo()
+    assert journal.redo() == [("a", A)]
+    # a new edit drops the edits undone
+    journal.record("Other", [("b", B, C)])
+    assert not journal.can_redo() and journal.redo() == []
+    journal.close()
+
+
+def test_no_change_is_not_recorded(path):
+    journal = EditJournal(path)
+    journal.record("Nothing", [("a", A, A)])
+    assert not journal.can_undo()
+    journal.close()
+    assert os.path.getsize(path) == 0
+
+
+def test_recovery(path):
+    journal = EditJournal(path)
+    journal.record("Move", [("a", NONE, A), ("b", B, C)])
+    journal.record("Move", [("a", A, B)])
+    journal.undo()
+    journal.record("Back", [("b", C, B)])
+    journal = reopen(journal)
+    # b is back to its saved position
+    assert journal.recovered == {"a": A}
+    assert journal.undo_label() == "Back"
+    assert not journal.can_redo()
+    assert journal.undo() == [("b", C)]
+    assert journal.undo() == [("a", NONE), ("b", B)]
+    journal.close()
+
+
+def test_recovery_of_undo_and_redo(path):
+    journal = EditJournal(path)
+    journal.record("Move", [("a", NONE, A)])
+    journal.undo()
+    journal = reopen(journal)
+    assert journal.recovered == {}
+    assert journal.redo_label() == "Move"
+    journal.redo()
+    journal = reopen(journal)
+    assert journal.recovered == {"a": A}
+    assert journal.undo_label() == "Move"
+    journal.close()
+
+
+def test_torn_line_is_removed(path):
+    journal = EditJournal(path)
+    journal.record("Move", [("a", NONE, A)])
+    journal.close()
+    size = os.path.getsize(path)
+    with open(path, "a") as f:
+        f.write('{"op": "edit", "label": "Move", "changes": [["b", [0, 0')
+    journal = EditJournal(path)
+    assert journal.recovered == {"a": A}
+    assert os.path.getsize(path) == size
+    # the next records follow the last complete one
+    journal.record("Move", [("b", NONE, B)])
+    journal = reopen(journal)
+    assert journal.recovered == {"a": A, "b": B}
+    journal.close()
+
+
+def test_saved_and_compact(path):
+    journal = EditJournal(path)
+    journal.record("Move", [("a", NONE, A), ("b", NONE, B)])
+    assert journal.is_saved("a", NONE) and not journal.is_saved("a", A)
+    assert not journal.is_saved("c", NONE)
+    journal.saved([("a", A)])
+    assert journal.is_saved("a", A)
+    journal.compact([("b", B)])
+    # the stacks are kept in memory
+    assert journal.can_undo()
+    journal = reopen(journal)
+    assert journal.recovered == {"b": B}
+    assert journal.undo_label() == "Unsaved changes"
+    assert journal.undo() == [("b", NONE)]
+    journal.close()
+
+
+def test_clear(path):
+    journal = EditJournal(path)
+    journal.record("Move", [("a", NONE, A)])
+    journal.clear()
+    assert not journal.can_undo() and journal.base == {}
+    journal = reopen(journal)
+    assert journal.recovered == {}
+    assert not journal.can_undo()
+    journal.close()
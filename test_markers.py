@@ -0,0 +1,44 @@
+import json
+
+from markers import MarkerLayer
+
+
+def test_diff():
+    layer = MarkerLayer()
+    wanted = {1: (45.0, 7.0, False, "a"), 2: (46.0, 8.0, True, "b")}
+    payload = layer.diff(wanted)
+    assert sorted(payload["add"]) == [[1, 45.0, 7.0, False, "a"], [2, 46.0, 8.0, True, "b"]]
+    assert payload["remove"] == []
+    # nothing changed
+    assert layer.diff(dict(wanted)) is None
+
+    wanted[1] = (45.0, 7.0, True, "a")
+    del wanted[2]
+    wanted[3] = (47.0, 9.0, False, "c")
+    payload = layer.diff(wanted)
+    assert sorted(payload["add"]) == [[1, 45.0, 7.0, True, "a"], [3, 47.0, 9.0, False, "c"]]
+    assert payload["remove"] == [2]
+
+
+def test_focus_and_view():
+    layer = MarkerLayer()
+    wanted = {1: (45.0, 7.0, False, "a")}
+    layer.diff(wanted)
+    assert layer.diff(wanted, focus=1) == {"add": [], "remove": [], "focus": 1, "view": None}
+    assert layer.diff(wanted, view=(45.0, 7.0, 12))["view"] == (45.0, 7.0, 12)
+
+
+def test_reset():
+    layer = MarkerLayer()
+    wanted = {1: (45.0, 7.0, False, "a")}
+    layer.diff(wanted)
+    layer.reset()
+    assert layer.diff(wanted)["add"] == [[1, 45.0, 7.0, False, "a"]]
+
+
+def test_script():
+    layer = MarkerLayer()
+    assert layer.script({}) == ""
+    script = layer.script({1: (45.0, 7.0, False, 'a "b"')})
+    assert script.startswith("updateMarkers(") and script.endswith(");")
+    assert json.loads(script[len("updateMarkers("):-2])["add"] == [[1, 45.0, 7.0, False, 'a "b"']]
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+
+import pytest
+
+from metrics import Metrics, Profiler
+
+
+def test_timer():
+    metrics = Metrics()
+    with metrics.timer("a"):
+        time.sleep(0.01)
+    metrics.add("a", 0.5)
+    count, total, peak = metrics.timers["a"]
+    assert count == 2
+    assert total == pytest.approx(0.51, abs=0.01)
+    assert peak == 0.5
+
+
+def test_timer_counts_exceptions():
+    metrics = Metrics()
+    with pytest.raises(KeyError):
+        with metrics.timer("a"):
+            raise KeyError("x")
+    assert metrics.timers["a"][0] == 1
+
+
+def test_counters_and_reset():
+    metrics = Metrics()
+    metrics.count("hits")
+    metrics.count("hits", 4)
+    assert metrics.counters["hits"] == 5
+    metrics.reset()
+    assert metrics.counters["hits"] == 0 and metrics.timers == {}
+
+
+def test_rate():
+    metrics = Metrics()
+    assert metrics.rate("a") == 0.0
+    for _ in range(10):
+        metrics.add("a", 0.001)
+    assert metrics.rate("a", window=2.0) == 5.0
+
+
+def test_snapshot_summary_and_dump(tmp_path):
+    metrics = Metrics()
+    metrics.add("scan.exif", 0.002)
+    metrics.add("scan.exif", 0.004)
+    metrics.count("scan.errors")
+    snapshot = metrics.snapshot()
+    timer = snapshot["timers"]["scan.exif"]
+    assert timer["count"] == 2
+    assert timer["total_ms"] == pytest.approx(6.0)
+    assert timer["mean_ms"] == pytest.approx(3.0)
+    assert timer["max_ms"] == pytest.approx(4.0)
+    assert snapshot["counters"] == {"scan.errors": 1}
+
+    lines = metrics.summary()
+    assert lines[0].split() == ["timer", "calls", "total", "ms", "mean", "ms", "max", "ms", "/s"]
+    assert lines[1].split()[:2] == ["scan.exif", "2"]
+    assert lines[-1].split() == ["scan.errors", "1"]
+
+    path = str(tmp_path / "metrics.json")
+    metrics.dump(path)
+    with open(path) as f:
+        assert json.load(f)["counters"] == {"scan.errors": 1}
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler()
+    assert profiler.stop(str(tmp_path)) == []
+    profiler.start()
+    assert profiler.running
+    sorted(range(10000), key=lambda x: -x)
+    paths = profiler.stop(str(tmp_path / "profile"))
+    assert not profiler.running
+    assert [os.path.basename(p).split("-")[0] for p in paths] == ["profile", "profile", "memory"]
+    assert all(os.path.getsize(p) for p in paths)
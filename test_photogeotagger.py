@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyexiv2")
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+import photogeotagger
+from metrics import METRICS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def window(app, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    # the map is created by the tests that need it
+    monkeypatch.setattr(photogeotagger, "MAP_DELAY", 3600 * 1000)
+    win = photogeotagger.MainWindow()
+    yield win
+    win.close()
+
+
+class Page:
+
+    def __init__(self):
+        self.scripts = []
+
+    def runJavaScript(self, script, callback):
+        self.scripts.append(script)
+        callback(len(self.scripts))
+
+
+class Browser:
+
+    def __init__(self):
+        self._page = Page()
+
+    def page(self):
+        return self._page
+
+
+def test_import_does_not_load_web_engine():
+    code = ("import sys, photogeotagger; "
+            "sys.exit(any(m in sys.modules for m in ('mapview', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebChannel')))")
+    subprocess.check_call([sys.executable, "-c", code], cwd=HERE)
+
+
+def test_window_before_map(window):
+    assert window.browser is None
+    assert not window.mapReady
+    assert window.mapPlaceholder.text() == "Loading map..."
+    assert window.model.rowCount() == 0
+    assert "startup.imports" in METRICS.timers
+
+
+def test_scripts_queued_until_map_ready(window):
+    values = []
+    window.run_js("first()", values.append)
+    window.run_js("second()")
+    assert window.jsQueue == [("first()", values.append), ("second()", None)]
+
+    window.browser = Browser()
+    window.map_ready()
+    scripts = window.browser.page().scripts
+    assert scripts[:2] == ["first()", "second()"]
+    assert values == [1]
+    assert window.jsQueue == []
+    assert "startup.map_ready" in METRICS.timers
+
+    # the page reloads: the scripts wait for the channel again
+    window.map_loading()
+    window.run_js("third()")
+    assert window.jsQueue == [("third()", None)]
+
+
+def test_scan_starts_before_the_map(window, tmp_path, monkeypatch):
+    import scanner
+
+    monkeypatch.setattr(scanner, "_timed_scan_file",
+                        lambda pic: {'gps': (45.0, 7.0, 0.0), 'filename': pic, 'datetime': None})
+    photos = tmp_path / "photos"
+    photos.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (photos / name).write_bytes(b"jpeg")
+    window.load_pictures(str(photos))
+    assert window.longthread.wait(10000)
+    QApplication.processEvents()
+    assert window.browser is None
+    assert window.model.rowCount() == 2
+
+
+def test_map_html():
+    pytest.importorskip("PyQt5.QtWebEngineWidgets")
+    from mapview import map_html
+
+    class Server:
+        url = "http://127.0.0.1:8000"
+
+        def tile_url(self, layer):
+            return self.url + "/tiles/" + layer + "/{z}/{x}/{y}"
+
+    html = map_html(Server(), "OSM", 45.03, 7.66, 12)
+    # Leaflet is loaded from the local server, an error is shown if it is missing
+    assert "http://127.0.0.1:8000/static/leaflet.js" in html
+    assert "http://127.0.0.1:8000/tiles/OSM/{z}/{x}/{y}" in html
+    assert "if (!window.L)" in html
+    assert "45.03" in html and "7.66" in html
+
+
+def read(pic):
+    return {'gps': (45.0, 7.0, 0.0), 'filename': pic, 'datetime': "2018:09:25 10:00:00"}
+
+
+@pytest.fixture
+def scan_thread(app, monkeypatch):
+    import scanner
+
+    monkeypatch.setattr(scanner, "_timed_scan_file", read)
+    thread = photogeotagger.MyLongThread()
+    thread.workers = 2
+    batches = []
+    # called in the scan thread
+    thread.signal.coords.connect(lambda generation, batch: batches.append((generation, batch)), Qt.DirectConnection)
+    thread.batches = batches
+    yield thread
+    thread.cancel()
+    thread.wait()
+
+
+def pictures(n):
+    return ["/photos/{:04d}.jpg".format(k) for k in range(n)]
+
+
+def wait_for(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_scan_sends_batches(scan_thread, monkeypatch):
+    monkeypatch.setattr(photogeotagger, "SCAN_BATCH", 100)
+    monkeypatch.setattr(photogeotagger, "SCAN_BATCH_INTERVAL", 3600)
+    scan_thread.signal.coords.connect(lambda generation, batch: scan_thread.batch_done(), Qt.DirectConnection)
+    scan_thread.files = pictures(1050)
+    scan_thread.start()
+    assert scan_thread.wait(10000)
+    assert [len(batch) for _, batch in scan_thread.batches] == [100] * 10 + [50]
+    # compact records in the order of the pictures
+    records = [record for _, batch in scan_thread.batches for record in batch]
+    assert records[0] == ("/photos/0000.jpg", (45.0, 7.0, 0.0), "2018:09:25 10:00:00")
+    assert [path for path, _, _ in records] == pictures(1050)
+
+
+def test_scan_sends_partial_batches_after_interval(scan_thread, monkeypatch):
+    monkeypatch.setattr(photogeotagger, "SCAN_BATCH_INTERVAL", 0)
+    scan_thread.signal.coords.connect(lambda generation, batch: scan_thread.batch_done(), Qt.DirectConnection)
+    scan_thread.files = pictures(5)
+    scan_thread.start()
+    assert scan_thread.wait(10000)
+    assert [len(batch) for _, batch in scan_thread.batches] == [1] * 5
+
+
+def test_scan_waits_for_the_gui(scan_thread, monkeypatch):
+    monkeypatch.setattr(photogeotagger, "SCAN_BATCH", 10)
+    scan_thread.files = pictures(200)
+    scan_thread.start()
+    # no batch added by the GUI: the scan stops after SCAN_BATCHES_IN_FLIGHT batches
+    assert wait_for(lambda: len(scan_thread.batches) == photogeotagger.SCAN_BATCHES_IN_FLIGHT)
+    time.sleep(0.3)
+    assert len(scan_thread.batches) == photogeotagger.SCAN_BATCHES_IN_FLIGHT
+    assert scan_thread.isRunning()
+
+    scan_thread.batch_done()
+    assert wait_for(lambda: len(scan_thread.batches) == photogeotagger.SCAN_BATCHES_IN_FLIGHT + 1)
+
+    # a cancel stops the wait
+    messages = []
+    scan_thread.signal.sig.connect(messages.append, Qt.DirectConnection)
+    scan_thread.cancel()
+    assert scan_thread.wait(10000)
+    assert messages == ["cancelled"]
+
+
+def test_batch_added_in_one_model_update(window):
+    inserted = []
+    window.model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+    changed = []
+    window.model.dataChanged.connect(lambda first, last, roles: changed.append((first.row(), last.row())))
+    generation = window.longthread.generation
+    window.addCoords(generation, [("/photos/a.jpg", (45.0, 7.0, 0.0), None),
+                                  ("/photos/b.jpg", (0, 0, 0), "2018:09:25 10:00:00"),
+                                  ("/photos/c.jpg", (46.0, 8.0, 0.0), None)])
+    assert inserted == [(0, 2)]
+    assert window.catalog.position(window.catalog.get("/photos/c.jpg")) == (46.0, 8.0, 0.0)
+
+    # pictures scanned again: the rows are updated, not added
+    window.addCoords(generation, [("/photos/a.jpg", (45.5, 7.0, 0.0), None),
+                                  ("/photos/c.jpg", (46.5, 8.0, 0.0), None)])
+    assert inserted == [(0, 2)]
+    assert changed[-1] == (0, 2)
+    assert window.model.rowCount() == 3
+
+
+def test_batch_of_older_scan_is_dropped(window):
+    window.longthread.inFlight = threading.Semaphore(0)
+    window.addCoords(window.longthread.generation - 1, [("/photos/a.jpg", (45.0, 7.0, 0.0), None)])
+    assert window.model.rowCount() == 0
+    # the scan thread is released anyway
+    assert window.longthread.inFlight.acquire(blocking=False)
@@ -0,0 +1,278 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyexiv2")
+
+from PyQt5.QtCore import Qt, QObject, QCoreApplication, pyqtSignal
+from PyQt5.QtGui import QImage, QColor
+from PyQt5.QtWidgets import QApplication
+
+import photomodel
+from photomodel import PhotoListModel, ThumbnailLoader, PREFETCH_ROWS
+from catalog import Catalog
+
+SIZE = 128
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+class Loader(QObject):
+    """
+    ThumbnailLoader recording the requests
+    """
+
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self):
+        super(Loader, self).__init__()
+        self.requests = []
+        self.cancelled = 0
+
+    def request(self, path):
+        self.requests.append(path)
+
+    def cancel(self):
+        self.cancelled += 1
+
+
+def image(color="red"):
+    image = QImage(SIZE, 96, QImage.Format_RGB32)
+    image.fill(QColor(color))
+    return image
+
+
+def catalog(n, tagged=()):
+    catalog = Catalog()
+    for k in range(n):
+        catalog.add("/photos/{:03d}.jpg".format(k), (45.0, 7.0, 0.0) if k in tagged else (0, 0, 0))
+    return catalog
+
+
+@pytest.fixture
+def model(app):
+    model = PhotoListModel(Loader(), catalog(40, tagged={1}), SIZE)
+    model.extend(range(40))
+    return model
+
+
+def record(signal):
+    calls = []
+    signal.connect(lambda *args: calls.append(args))
+    return calls
+
+
+def test_extend_in_one_insertion(app):
+    model = PhotoListModel(Loader(), catalog(10), SIZE)
+    inserted = record(model.rowsInserted)
+    model.extend([3, 1, 3, 2])
+    model.extend([1, 2])
+    model.extend([5, 4])
+    assert model.rowCount() == 5
+    assert [model.catalogIndex(r) for r in range(5)] == [3, 1, 2, 5, 4]
+    assert [args[1:] for args in inserted] == [(0, 2), (3, 4)]
+    assert model.row(5) == 3
+    assert model.row(0) is None
+
+
+def test_data(model):
+    assert model.data(model.index(0)) == "000"
+    assert model.data(model.index(0), Qt.ForegroundRole).color() == QColor(255, 0, 0)
+    assert model.data(model.index(1), Qt.ForegroundRole).color() == QColor(0, 0, 0)
+    assert model.data(model.index(2), Qt.ToolTipRole) == "/photos/002.jpg"
+    assert not model.data(model.index(40)).isValid()
+
+
+def test_tooltip_with_place(model):
+    class Place:
+        city, region, country = "Torino", "Piemonte", "Italy"
+
+    model.catalog.set_place(1, Place())
+    assert model.data(model.index(1), Qt.ToolTipRole) == "/photos/001.jpg\nTorino, Piemonte, Italy"
+
+
+def test_thumbnail_requests_row_and_neighbours(model):
+    pixmap = model.thumbnail(20)
+    assert (pixmap.width(), pixmap.height()) == (SIZE, SIZE * 3 // 4)
+    requests = model.loader.requests
+    # the requested row is queued last to be loaded first
+    assert requests[-1] == "/photos/020.jpg"
+    assert sorted(requests) == ["/photos/{:03d}.jpg".format(r)
+                                for r in range(20 - PREFETCH_ROWS, 20 + PREFETCH_ROWS + 1)]
+
+
+def test_thumbnail_neighbours_stop_at_the_ends(model):
+    model.thumbnail(0)
+    assert len(model.loader.requests) == PREFETCH_ROWS + 1
+    model.loader.requests = []
+    model.thumbnail(39)
+    assert len(model.loader.requests) == PREFETCH_ROWS + 1
+
+
+def test_loaded_thumbnail_is_kept(model):
+    changed = record(model.dataChanged)
+    model.loader.loaded.emit("/photos/005.jpg", image("blue"))
+    assert changed[0][0].row() == changed[0][1].row() == 5
+    assert list(changed[0][2]) == [Qt.DecorationRole]
+
+    model.loader.requests = []
+    pixmap = model.thumbnail(5)
+    assert pixmap.toImage().pixelColor(0, 0) == QColor("blue")
+    assert model.loader.requests == []
+
+
+def test_thumbnail_of_unknown_picture_is_ignored(model):
+    changed = record(model.dataChanged)
+    model.loader.loaded.emit("/elsewhere/a.jpg", image())
+    assert changed == []
+
+
+def test_pixmap_cache_is_bounded(model, monkeypatch):
+    monkeypatch.setattr(photomodel, "PIXMAP_CACHE_SIZE", 3)
+    for r in range(5):
+        model.loader.loaded.emit("/photos/{:03d}.jpg".format(r), image())
+    # the least recently loaded thumbnails are evicted
+    for r, evicted in ((0, True), (1, True), (2, False), (3, False), (4, False)):
+        model.loader.requests = []
+        model.thumbnail(r)
+        assert ("/photos/{:03d}.jpg".format(r) in model.loader.requests) == evicted
+
+
+def test_positions_changed_in_one_signal(model):
+    changed = record(model.dataChanged)
+    model.positionsChanged([7, 3, 12, 99])
+    assert len(changed) == 1
+    assert (changed[0][0].row(), changed[0][1].row()) == (3, 12)
+    assert list(changed[0][2]) == [Qt.ForegroundRole]
+
+
+def test_remove_indices_by_ranges(model):
+    removed = record(model.rowsRemoved)
+    model.removeIndices([2, 3, 4, 10, 39, 99, 3])
+    # one signal per range of rows, from the last range
+    assert [args[1:] for args in removed] == [(39, 39), (10, 10), (2, 4)]
+    assert model.rowCount() == 35
+    assert [model.catalogIndex(r) for r in range(4)] == [0, 1, 5, 6]
+    assert model.row(5) == 2
+    assert model.row(11) == 7
+    assert model.row(3) is None
+    model.removeIndices([3, 4])
+    assert len(removed) == 3
+
+
+def test_removed_thumbnail_is_forgotten(model):
+    model.loader.loaded.emit("/photos/005.jpg", image("blue"))
+    model.removeIndices([5])
+    model.extend([5])
+    model.loader.requests = []
+    model.thumbnail(model.row(5))
+    assert "/photos/005.jpg" in model.loader.requests
+
+
+def test_forget_thumbnail(model):
+    model.loader.loaded.emit("/photos/005.jpg", image("blue"))
+    changed = record(model.dataChanged)
+    model.forgetThumbnail("/photos/005.jpg")
+    assert changed[0][0].row() == 5
+    model.loader.requests = []
+    model.thumbnail(5)
+    assert "/photos/005.jpg" in model.loader.requests
+
+
+def test_clear(model):
+    model.clear()
+    assert model.rowCount() == 0
+    assert model.loader.cancelled == 1
+
+
+class Thumbnailer:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path):
+        self.calls.append(path)
+        return image()
+
+    def encode(self, image):
+        return b"encoded"
+
+    def decode(self, data):
+        return image("green") if data == b"encoded" else None
+
+
+class Cache:
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.thumbnails = {}
+        self.hashes = {}
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def put_thumbnail(self, path, data):
+        self.thumbnails[path] = data
+
+    def put_dhash(self, path, value):
+        self.hashes[path] = value
+
+
+def test_loader_load_from_cache(app):
+    thumbnailer = Thumbnailer()
+    cache = Cache({"a.jpg": ({}, b"encoded"), "b.jpg": ({}, None)})
+    loader = ThumbnailLoader(thumbnailer, cache)
+    assert loader.load("a.jpg").pixelColor(0, 0) == QColor("green")
+    assert thumbnailer.calls == []
+
+    assert loader.load("b.jpg").pixelColor(0, 0) == QColor("red")
+    assert thumbnailer.calls == ["b.jpg"]
+    assert cache.thumbnails == {"b.jpg": b"encoded"}
+    assert isinstance(cache.hashes["b.jpg"], int)
+
+
+def test_loader_emits_loaded(app):
+    thumbnailer = Thumbnailer()
+    loader = ThumbnailLoader(thumbnailer, workers=2)
+    loaded = record(loader.loaded)
+    for path in ("a.jpg", "b.jpg", "a.jpg"):
+        loader.request(path)
+    loader.pool.waitForDone()
+    QCoreApplication.processEvents()
+    assert {path for path, _ in loaded} == {"a.jpg", "b.jpg"}
+    assert not loader.wanted("a.jpg")
+
+
+class Pool:
+    """
+    thread pool keeping the tasks waiting
+    """
+
+    def __init__(self):
+        self.tasks = []
+
+    def start(self, task, priority):
+        self.tasks.append((priority, task.path))
+
+    def clear(self):
+        self.tasks = []
+
+
+def test_loader_drops_old_requests(app, monkeypatch):
+    monkeypatch.setattr(photomodel, "MAX_PENDING", 2)
+    loader = ThumbnailLoader(Thumbnailer())
+    loader.pool = Pool()
+    for path in ("a.jpg", "b.jpg", "c.jpg"):
+        loader.request(path)
+    assert [loader.wanted(p) for p in ("a.jpg", "b.jpg", "c.jpg")] == [False, True, True]
+    # the most recent requests have the highest priority
+    assert [path for _, path in sorted(loader.pool.tasks, reverse=True)] == ["c.jpg", "b.jpg", "a.jpg"]
+    loader.cancel()
+    assert not loader.wanted("c.jpg")
+    assert loader.pool.tasks == []
@@ -0,0 +1,232 @@
+import time
+import random
+import threading
+
+import pytest
+
+pytest.importorskip("pyexiv2")
+
+import scanner
+from scanner import ScanEngine
+
+
+def coord(pic, gps=(45.0, 7.0, 0.0)):
+    return {'gps': gps, 'filename': pic, 'datetime': None}
+
+
+class Reads:
+    """
+    scan_file replacement recording the reads started, sleeping a random time
+    """
+
+    def __init__(self, delay=0.01, fail=()):
+        self.delay = delay
+        self.fail = fail
+        self.started = []
+        self.lock = threading.Lock()
+
+    def __call__(self, pic):
+        with self.lock:
+            self.started.append(pic)
+        time.sleep(random.uniform(0, self.delay))
+        if pic in self.fail:
+            raise IOError("unreadable")
+        return coord(pic)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    reads = Reads()
+    monkeypatch.setattr(scanner, "_timed_scan_file", reads)
+    return reads
+
+
+def pictures(n):
+    return ["{:04d}.jpg".format(i) for i in range(n)]
+
+
+def test_results_in_input_order(reads):
+    random.seed(1)
+    pics = pictures(60)
+    results = list(ScanEngine(workers=8).scan(pics))
+    assert [c['filename'] for c, _ in results] == pics
+    assert all(image is None for _, image in results)
+
+
+def test_results_in_order_when_first_is_slowest(monkeypatch):
+    def read(pic):
+        # the first pictures finish last
+        time.sleep(0.05 if pic < "0004" else 0)
+        return coord(pic)
+
+    monkeypatch.setattr(scanner, "_timed_scan_file", read)
+    pics = pictures(16)
+    assert [c['filename'] for c, _ in ScanEngine(workers=4).scan(pics)] == pics
+
+
+def test_pending_window_is_bounded(reads):
+    engine = ScanEngine(workers=2)
+    window = engine.workers * 4
+    pics = pictures(100)
+    done = 0
+    for _ in engine.scan(pics):
+        done += 1
+        # the reads submitted ahead of the results consumed
+        assert len(reads.started) <= done + window
+    assert done == len(pics)
+
+
+def test_input_is_read_lazily(reads):
+    engine = ScanEngine(workers=1)
+    consumed = []
+
+    def pics():
+        for pic in pictures(1000):
+            consumed.append(pic)
+            yield pic
+
+    results = engine.scan(pics())
+    next(results)
+    results.close()
+    assert len(consumed) <= engine.workers * 4 + 1
+
+
+def test_cancel_stops_yielding(reads):
+    engine = ScanEngine(workers=2)
+    results = []
+    for c, _ in engine.scan(pictures(200)):
+        results.append(c)
+        if len(results) == 5:
+            engine.cancel()
+    assert len(results) == 5
+    assert engine.cancelled
+    # the pictures after the window are never read
+    assert len(reads.started) < 5 + engine.workers * 4 + 2
+
+
+def test_cancel_before_scan_until_reset(reads):
+    engine = ScanEngine(workers=2)
+    engine.cancel()
+    assert list(engine.scan(pictures(10))) == []
+    assert reads.started == []
+    engine.reset()
+    assert not engine.cancelled
+    assert len(list(engine.scan(pictures(10)))) == 10
+
+
+def test_unreadable_pictures_are_skipped(reads):
+    pics = pictures(20)
+    reads.fail = {pics[0], pics[7], pics[19]}
+    results = [c['filename'] for c, _ in ScanEngine(workers=4).scan(pics)]
+    assert results == [pic for pic in pics if pic not in reads.fail]
+
+
+class Thumbnailer:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, pic):
+        self.calls.append(pic)
+        return "image of " + pic
+
+    def encode(self, image):
+        return image.encode()
+
+    def decode(self, data):
+        return data.decode()
+
+
+class Cache:
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.flushed = 0
+
+    def get(self, pic):
+        return self.entries.get(pic)
+
+    def put(self, pic, coord, data):
+        self.entries[pic] = (coord, data)
+
+    def flush(self):
+        self.flushed += 1
+
+
+def test_thumbnails(reads):
+    thumbnailer = Thumbnailer()
+    pics = pictures(10)
+    results = list(ScanEngine(workers=3, thumbnailer=thumbnailer).scan(pics))
+    assert [image for _, image in results] == ["image of " + pic for pic in pics]
+    assert sorted(thumbnailer.calls) == pics
+
+
+def test_cache_hits_are_not_read(reads):
+    pics = pictures(10)
+    cache = Cache({pic: (coord(pic, (1.0, 2.0, 0.0)), b"cached " + pic.encode()) for pic in pics[::2]})
+    thumbnailer = Thumbnailer()
+    results = list(ScanEngine(workers=3, thumbnailer=thumbnailer, cache=cache).scan(pics))
+
+    assert [c['filename'] for c, _ in results] == pics
+    assert sorted(reads.started) == pics[1::2]
+    assert sorted(thumbnailer.calls) == pics[1::2]
+    assert results[0] == (coord(pics[0], (1.0, 2.0, 0.0)), "cached " + pics[0])
+    assert results[1] == (coord(pics[1]), "image of " + pics[1])
+    # the new results are stored
+    assert cache.entries[pics[1]] == (coord(pics[1]), b"image of " + pics[1].encode())
+    assert cache.flushed == 1
+
+
+def test_cache_entry_without_thumbnail_is_read(reads):
+    pics = pictures(2)
+    cache = Cache({pics[0]: (coord(pics[0]), None)})
+    list(ScanEngine(workers=1, thumbnailer=Thumbnailer(), cache=cache).scan(pics))
+    assert sorted(reads.started) == pics
+
+
+def touch(directory, name):
+    path = directory / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"jpeg")
+    return str(path)
+
+
+def test_parse_extensions():
+    assert scanner.parse_extensions("jpg, TIF") == (".jpg", ".tif")
+    assert scanner.parse_extensions(".jpg .nef") == (".jpg", ".nef")
+    with pytest.raises(ValueError):
+        scanner.parse_extensions(" , ")
+
+
+def test_scan_directory_filters_extensions(tmp_path):
+    names = ["a.jpg", "b.JPEG", "c.tiff", "d.NEF", "e.dng", "f.png", "g.txt", "jpg"]
+    for name in names:
+        touch(tmp_path, name)
+    files, dirs = scanner.scan_directory(str(tmp_path))
+    assert [p for p, _, _ in files] == [str(tmp_path / n) for n in names[:5]]
+    assert dirs == []
+    files, _ = scanner.scan_directory(str(tmp_path), scanner.parse_extensions("jpg,png"))
+    assert [p for p, _, _ in files] == [str(tmp_path / "a.jpg"), str(tmp_path / "f.png")]
+
+
+def test_scan_directory_stat_and_sub_directories(tmp_path):
+    path = touch(tmp_path, "a.jpg")
+    touch(tmp_path, "sub/b.jpg")
+    touch(tmp_path, ".hidden/c.jpg")
+    (tmp_path / "folder.jpg").mkdir()
+    (tmp_path / "link").symlink_to(tmp_path / "sub")
+    files, dirs = scanner.scan_directory(str(tmp_path))
+    st = (tmp_path / "a.jpg").stat()
+    assert files == [(path, st.st_mtime_ns, st.st_size)]
+    assert dirs == [str(tmp_path / "folder.jpg"), str(tmp_path / "sub")]
+
+
+def test_find_pictures(tmp_path):
+    a = touch(tmp_path, "a.jpg")
+    b = touch(tmp_path, "sub/b.cr2")
+    touch(tmp_path, "sub/c.png")
+    single = touch(tmp_path / "other", "d.jpg")
+    assert scanner.find_pictures([str(tmp_path)]) == [a]
+    assert scanner.find_pictures([str(tmp_path)], recursive=True) == sorted([a, b, single])
+    assert scanner.find_pictures([str(tmp_path / "sub"), single], extensions=(".CR2",)) == sorted([b, single])
+    assert scanner.find_pictures([str(tmp_path / "missing")]) == []
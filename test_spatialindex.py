@@ -0,0 +1,107 @@
+import math
+import random
+
+import pytest
+
+from spatialindex import GridIndex, KDTree, METERS_PER_DEGREE
+
+
+def positions(n, rng, lat=45.07, lon=7.68, spread=0.05):
+    return [(rng.gauss(lat, spread), rng.gauss(lon, spread)) for _ in range(n)]
+
+
+def brute_nearest(points, lat, lon, k):
+    coslat = max(math.cos(math.radians(lat)), 1e-6)
+    return sorted(((plat - lat) ** 2 + (((plon - lon + 180) % 360 - 180) * coslat) ** 2, i)
+                  for i, (plat, plon) in points.items())[:k]
+
+
+def brute_bbox(points, south, west, north, east):
+    return sorted(i for i, (lat, lon) in points.items()
+                  if south <= lat <= north and (west <= lon <= east if west <= east else lon >= west or lon <= east))
+
+
+def haversine(lat0, lon0, lat1, lon1):
+    lat0, lon0, lat1, lon1 = map(math.radians, (lat0, lon0, lat1, lon1))
+    a = math.sin((lat1 - lat0) / 2) ** 2 + math.cos(lat0) * math.cos(lat1) * math.sin((lon1 - lon0) / 2) ** 2
+    return 2 * math.asin(math.sqrt(a)) * METERS_PER_DEGREE * 180 / math.pi
+
+
+@pytest.fixture
+def grid():
+    rng = random.Random(1)
+    index = GridIndex()
+    points = dict(enumerate(positions(2000, rng)))
+    # sparse positions all over the world and near the antimeridian
+    points.update((2000 + k, (rng.uniform(-89, 89), rng.uniform(-180, 180))) for k in range(200))
+    points.update((3000 + k, (rng.uniform(-10, 10), rng.choice((-1, 1)) * rng.uniform(179.9, 180))) for k in range(50))
+    for i, (lat, lon) in points.items():
+        index.insert(i, lat, lon)
+    return index, points
+
+
+def test_nearest_against_brute_force(grid):
+    index, points = grid
+    rng = random.Random(2)
+    queries = positions(50, rng, spread=0.1) + [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(30)]
+    queries += [(0.0, 179.99), (5.0, -179.99)]
+    for lat, lon in queries:
+        result = index.nearest(lat, lon, k=5)
+        expected = brute_nearest(points, lat, lon, 5)
+        assert [d for d, _ in result] == pytest.approx([math.sqrt(d2) * METERS_PER_DEGREE for d2, _ in expected])
+        assert [i for _, i in result] == [i for _, i in expected]
+
+
+def test_nearest_max_distance(grid):
+    index, points = grid
+    result = index.nearest(45.07, 7.68, k=1000, max_distance=500)
+    expected = [i for d2, i in brute_nearest(points, 45.07, 7.68, len(points))
+                if math.sqrt(d2) * METERS_PER_DEGREE <= 500]
+    assert [i for _, i in result] == expected
+    assert index.nearest(45.07, 7.68, k=0) == []
+    assert GridIndex().nearest(45.07, 7.68) == []
+
+
+@pytest.mark.parametrize("box", [(45.05, 7.65, 45.09, 7.71), (45.0701, 7.6801, 45.0702, 7.6802),
+                                 (-90, -180, 90, 180), (-10, 179.95, 10, -179.95), (50, 10, 60, 20)])
+def test_bbox_against_brute_force(grid, box):
+    index, points = grid
+    assert sorted(index.in_bbox(*box)) == brute_bbox(points, *box)
+
+
+def test_move_and_remove(grid):
+    index, points = grid
+    n = len(index)
+    index.insert(0, -45.0, -7.0)
+    index.insert(1, points[1][0] + 1e-7, points[1][1])
+    points[0] = (-45.0, -7.0)
+    points[1] = (points[1][0] + 1e-7, points[1][1])
+    for i in range(2, 100):
+        index.remove(i)
+        del points[i]
+    index.remove(-1)
+    assert len(index) == n - 98
+    assert 2 not in index and 0 in index
+    assert index.position(0) == (-45.0, -7.0)
+    assert sorted(index.in_bbox(45.05, 7.65, 45.09, 7.71)) == brute_bbox(points, 45.05, 7.65, 45.09, 7.71)
+    assert [i for _, i in index.nearest(45.07, 7.68, k=10)] == [i for _, i in brute_nearest(points, 45.07, 7.68, 10)]
+    assert index.nearest(-45.0, -7.0)[0] == (0.0, 0)
+    index.clear()
+    assert len(index) == 0 and index.in_bbox(-90, -180, 90, 180) == []
+
+
+def test_kdtree_against_brute_force():
+    rng = random.Random(3)
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(500)] + positions(500, rng)
+    tree = KDTree([lat for lat, _ in points], [lon for _, lon in points])
+    assert len(tree) == 1000
+    queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(100)] + [(45.07, 7.68), (0, 180), (90, 0)]
+    for lat, lon in queries:
+        distance, i = tree.nearest(lat, lon)
+        expected = min((haversine(lat, lon, plat, plon), j) for j, (plat, plon) in enumerate(points))
+        assert distance == pytest.approx(expected[0], abs=1e-3)
+        assert i == expected[1]
+
+
+def test_kdtree_empty():
+    assert KDTree([], []).nearest(0, 0) is None
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+from thumbcache import MetadataCache
+
+
+def picture(directory, name, data=b"jpeg"):
+    path = os.path.join(str(directory), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def coord(path, gps=(45.0, 7.0, 100.0)):
+    return {'gps': gps, 'filename': path, 'datetime': "2020:01:02 03:04:05"}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MetadataCache(str(tmp_path / "cache" / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_get_put(tmp_path, cache):
+    path = picture(tmp_path, "a.jpg")
+    assert cache.get(path) is None
+    cache.put(path, coord(path), b"thumb")
+    assert cache.get(path) == (coord(path), b"thumb")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_modified_file_is_a_miss(tmp_path, cache):
+    path = picture(tmp_path, "a.jpg")
+    cache.put(path, coord(path), b"thumb")
+    picture(tmp_path, "a.jpg", b"longer jpeg")
+    assert cache.get(path) is None
+    assert cache.total_bytes() == 0
+
+
+def test_missing_file(tmp_path, cache):
+    path = picture(tmp_path, "a.jpg")
+    cache.put(path, coord(path))
+    os.remove(path)
+    assert cache.get(path) is None
+    assert cache.get_dhash(path) is None
+
+
+def test_persistent(tmp_path):
+    path = picture(tmp_path, "a.jpg")
+    db = str(tmp_path / "cache.sqlite")
+    cache = MetadataCache(db)
+    cache.put(path, coord(path), b"thumb")
+    cache.put_dhash(path, 2**64 - 1)
+    cache.close()
+    cache = MetadataCache(db)
+    try:
+        assert cache.get(path) == (coord(path), b"thumb")
+        assert cache.get_dhash(path) == 2**64 - 1
+        assert cache.total_bytes() == 5
+    finally:
+        cache.close()
+
+
+def test_put_thumbnail(tmp_path, cache):
+    path = picture(tmp_path, "a.jpg")
+    cache.put_thumbnail(path, b"thumb")
+    assert cache.get(path) is None
+    cache.put(path, coord(path))
+    cache.put_thumbnail(path, b"thumbnail")
+    assert cache.get(path)[1] == b"thumbnail"
+    assert cache.total_bytes() == 9
+
+
+@pytest.mark.parametrize("dhash", [0, 1, 2**63 - 1, 2**63, 2**64 - 1])
+def test_dhash(tmp_path, cache, dhash):
+    path = picture(tmp_path, "a.jpg")
+    cache.put(path, coord(path))
+    assert cache.get_dhash(path) is None
+    cache.put_dhash(path, dhash)
+    assert cache.get_dhash(path) == dhash
+    # the hash goes with the entry
+    cache.put(path, coord(path))
+    assert cache.get_dhash(path) is None
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = MetadataCache(":memory:", max_bytes=100)
+    paths = [picture(tmp_path, "{}.jpg".format(k)) for k in range(4)]
+    for path in paths[:3]:
+        cache.put(path, coord(path), b"x" * 30)
+    # 0 becomes more recent than 1
+    assert cache.get(paths[0]) is not None
+    cache.put(paths[3], coord(paths[3]), b"x" * 30)
+    assert cache.total_bytes() <= 90
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[0]) is not None
+    assert cache.get(paths[3]) is not None
+    cache.close()
+
+
+def test_entries_under(tmp_path, cache):
+    paths = [picture(tmp_path, name) for name in ("d/a.jpg", "d/b.jpg", "d/sub/c.jpg", "d2/e.jpg", "d-f.jpg")]
+    for path in paths:
+        cache.put(path, coord(path))
+    directory = os.path.join(str(tmp_path), "d")
+    assert [entry[0] for entry in cache.entries_under(directory)] == paths[:2]
+    assert [entry[0] for entry in cache.entries_under(directory, recursive=True)] == paths[:3]
+    st = os.stat(paths[0])
+    assert next(cache.entries_under(directory)) == (paths[0], st.st_mtime_ns, st.st_size,
+                                                    (45.0, 7.0, 100.0), "2020:01:02 03:04:05")
+
+
+def test_invalidate_and_clear(tmp_path, cache):
+    a, b = picture(tmp_path, "a.jpg"), picture(tmp_path, "b.jpg")
+    cache.put(a, coord(a), b"aa")
+    cache.put(b, coord(b), b"bbb")
+    cache.invalidate(a)
+    assert cache.get(a) is None
+    assert cache.total_bytes() == 3
+    cache.clear()
+    assert cache.get(b) is None
+    assert cache.total_bytes() == 0
@@ -0,0 +1,124 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyexiv2")
+
+from PyQt5.QtGui import QImage, QColor
+
+import thumbnails
+from thumbnails import ThumbnailPipeline, ThumbnailStats, dhash_pixels
+
+WIDTH = 128
+
+
+def picture(tmp_path, name="a.jpg", width=800, height=600, color="red"):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor(color))
+    path = str(tmp_path / name)
+    assert image.save(path, "JPG")
+    return path
+
+
+def jpeg_bytes(tmp_path, width, height):
+    with open(picture(tmp_path, "preview.jpg", width, height, "blue"), "rb") as f:
+        return f.read()
+
+
+class Preview:
+
+    def __init__(self, dimensions, data):
+        self.dimensions = dimensions
+        self.data = data
+
+
+class Thumbnail:
+    data = b""
+
+
+def with_previews(monkeypatch, previews, exif_thumbnail=b""):
+    class ImageMetadata:
+
+        def __init__(self, path):
+            self.path = path
+            self.previews = previews
+            self.exif_thumbnail = Thumbnail()
+            self.exif_thumbnail.data = exif_thumbnail
+
+        def read(self):
+            pass
+
+    monkeypatch.setattr(thumbnails.pyexiv2, "ImageMetadata", ImageMetadata)
+
+
+def test_scaled_decode_without_preview(tmp_path, monkeypatch):
+    with_previews(monkeypatch, [])
+    pipeline = ThumbnailPipeline(WIDTH)
+    image = pipeline(picture(tmp_path))
+    assert (image.width(), image.height()) == (WIDTH, 96)
+    assert pipeline.stats.count == {"cache": 0, "exif": 0, "scaled": 1, "full": 0}
+
+
+def test_smallest_large_enough_preview(tmp_path, monkeypatch):
+    small = Preview((64, 48), jpeg_bytes(tmp_path, 64, 48))
+    medium = Preview((160, 120), jpeg_bytes(tmp_path, 160, 120))
+    large = Preview((1024, 768), b"not a jpeg")
+    with_previews(monkeypatch, [large, small, medium])
+    pipeline = ThumbnailPipeline(WIDTH)
+    image = pipeline(picture(tmp_path))
+    assert image.width() == WIDTH
+    assert image.pixelColor(10, 10).blue() > 200
+    assert pipeline.stats.count["exif"] == 1
+
+
+def test_exif_thumbnail_when_no_preview_is_large_enough(tmp_path, monkeypatch):
+    with_previews(monkeypatch, [Preview((64, 48), b"")], jpeg_bytes(tmp_path, 160, 120))
+    pipeline = ThumbnailPipeline(WIDTH)
+    assert pipeline(picture(tmp_path)).width() == WIDTH
+    assert pipeline.stats.count["exif"] == 1
+
+
+def test_small_exif_thumbnail_falls_back_to_scaled_decode(tmp_path, monkeypatch):
+    with_previews(monkeypatch, [], jpeg_bytes(tmp_path, 64, 48))
+    pipeline = ThumbnailPipeline(WIDTH)
+    image = pipeline(picture(tmp_path))
+    assert image.width() == WIDTH
+    assert image.pixelColor(10, 10).red() > 200
+    assert pipeline.stats.count["scaled"] == 1
+
+
+def test_unreadable_picture_is_counted_full(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"not a jpeg")
+    pipeline = ThumbnailPipeline(WIDTH)
+    assert pipeline(str(path)).isNull()
+    assert pipeline.stats.count["full"] == 1
+
+
+def test_encode_decode(tmp_path, monkeypatch):
+    with_previews(monkeypatch, [])
+    pipeline = ThumbnailPipeline(WIDTH)
+    image = pipeline(picture(tmp_path))
+    data = pipeline.encode(image)
+    assert data.startswith(b"\xff\xd8")
+    decoded = pipeline.decode(data)
+    assert decoded.size() == image.size()
+    assert pipeline.decode(b"garbage") is None
+    assert pipeline.stats.count["cache"] == 1
+
+
+def test_stats_summary():
+    stats = ThumbnailStats()
+    assert stats.summary() == ""
+    stats.add("exif", 0.002)
+    stats.add("exif", 0.004)
+    stats.add("full", 0.1)
+    assert stats.summary() == "exif 2 (3.0 ms), full 1 (100.0 ms)"
+    stats.reset()
+    assert stats.summary() == ""
+
+
+def test_dhash_pixels(tmp_path):
+    image = QImage(picture(tmp_path, color="gray"))
+    pixels = dhash_pixels(image)
+    assert len(pixels) == 72
+    assert len(set(pixels)) == 1
@@ -0,0 +1,157 @@
+import os
+import time
+import urllib.request
+import urllib.error
+
+import pytest
+
+import tilecache
+from tilecache import (MBTiles, TileCache, TileServer, tiles_in_bbox, count_tiles, valid_tile,
+                       MAX_ZOOM, MAX_PREFETCH_TILES, STATIC_FILES, STATIC_DIR)
+
+
+def test_valid_tile():
+    assert valid_tile(0, 0, 0)
+    assert valid_tile(MAX_ZOOM, 2 ** MAX_ZOOM - 1, 0)
+    assert not valid_tile(MAX_ZOOM + 1, 0, 0)
+    assert not valid_tile(99999, 0, 0)
+    assert not valid_tile(2, 4, 0)
+    assert not valid_tile(2, 0, 4)
+
+
+def test_tiles_in_bbox():
+    assert list(tiles_in_bbox(-85, -180, 85, 180, 0)) == [(0, 0)]
+    assert sorted(tiles_in_bbox(-85, -180, 85, 180, 1)) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    # north-east quarter
+    assert list(tiles_in_bbox(10, 10, 20, 20, 1)) == [(1, 0)]
+
+
+def test_tiles_in_bbox_antimeridian():
+    tiles = set(tiles_in_bbox(-10, 170, 10, -170, 4))
+    assert tiles
+    assert {x for x, _ in tiles} == {0, 15}
+    assert tiles == set(tiles_in_bbox(-10, 170, 10, 180, 4)) | set(tiles_in_bbox(-10, -180, 10, -170, 4))
+
+
+@pytest.mark.parametrize("bbox", [(-85, -180, 85, 180), (44.9, 7.5, 45.2, 7.8), (-10, 170, 10, -170)])
+def test_count_tiles(bbox):
+    zooms = range(0, 9)
+    assert count_tiles(bbox, zooms) == sum(1 for z in zooms for _ in tiles_in_bbox(*bbox, z))
+
+
+def test_prefetch_too_many_tiles(tmp_path):
+    cache = TileCache(str(tmp_path), offline=True)
+    t0 = time.perf_counter()
+    # the whole world down to the maximum zoom: the tiles must not be listed
+    with pytest.raises(ValueError):
+        cache.prefetch("OSM", (-85, -180, 85, 180), range(MAX_ZOOM + 1))
+    assert time.perf_counter() - t0 < 1
+    cache.close()
+
+
+def test_prefetch_offline(tmp_path):
+    cache = TileCache(str(tmp_path), offline=True)
+    cache.layer("OSM").put(1, 0, 0, b"png")
+    calls = []
+    assert cache.prefetch("OSM", (-85, -180, 85, 180), range(2), progress=lambda *a: calls.append(a)) == 0
+    assert calls[-1] == (5, 5)
+    assert count_tiles((-85, -180, 85, 180), range(2)) < MAX_PREFETCH_TILES
+    cache.close()
+
+
+def test_mbtiles_lru_eviction(tmp_path):
+    db = MBTiles(str(tmp_path / "t.mbtiles"), max_bytes=1000)
+    for x in range(4):
+        db.put(3, x, 0, b"x" * 300)
+        # tile 0 is used after each put: the least recently used is evicted first
+        db.get(3, 0, 0)
+    assert (3, 0, 0) in db
+    assert (3, 1, 0) not in db
+    assert db.total_bytes() <= 1000
+    assert db.get(3, 3, 0) == b"x" * 300
+    db.close()
+
+
+def test_offline_cache(tmp_path):
+    cache = TileCache(str(tmp_path), offline=True)
+    assert cache.tile("OSM", 3, 1, 1) is None
+    cache.layer("OSM").put(3, 1, 1, b"png")
+    assert cache.tile("OSM", 3, 1, 1) == b"png"
+    assert cache.tile("OSM", 99999, 0, 0) is None
+    with pytest.raises(KeyError):
+        cache.layer("unknown")
+    cache.close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    cache = TileCache(str(tmp_path), offline=True)
+    cache.layer("OSM").put(2, 1, 2, b"png")
+    server = TileServer(cache).start()
+    yield server
+    server.stop()
+    cache.close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def test_server(server):
+    assert get(server.url + "/tiles/OSM/2/1/2.png") == (200, b"png")
+    assert get(server.url + "/tiles/OSM/2/1/3.png")[0] == 404
+    assert get(server.url + "/tiles/unknown/2/1/2.png")[0] == 404
+
+
+@pytest.mark.parametrize("tile", ["99999/0/0", "2/4/0", "2/0/4", "{}/0/0".format(MAX_ZOOM + 1)])
+def test_server_rejects_out_of_range_tiles(server, tile):
+    assert get(server.url + "/tiles/OSM/" + tile + ".png")[0] == 404
+
+
+def test_static_files_are_shipped(tmp_path):
+    for name in STATIC_FILES:
+        assert os.path.getsize(os.path.join(STATIC_DIR, name)) > 0
+    cache = TileCache(str(tmp_path))
+    assert cache.missing_static() == []
+    cache.close()
+
+
+def no_download(url):
+    raise AssertionError("downloaded " + url)
+
+
+def test_static_missing_is_not_downloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(tilecache, "STATIC_DIR", str(tmp_path / "static"))
+    monkeypatch.setattr(tilecache, "download", no_download)
+    cache = TileCache(str(tmp_path / "cache"))
+    assert cache.static("leaflet.js") is None
+    assert cache.missing_static() == sorted(STATIC_FILES)
+    cache.close()
+
+
+def test_refresh_static(tmp_path, monkeypatch):
+    monkeypatch.setattr(tilecache, "STATIC_DIR", str(tmp_path / "static"))
+
+    def download(url):
+        if url.endswith(".png"):
+            raise OSError("no network")
+        return url.encode()
+
+    monkeypatch.setattr(tilecache, "download", download)
+    cache = TileCache(str(tmp_path / "cache"))
+    failed = cache.refresh_static()
+    assert failed == sorted(name for name in STATIC_FILES if name.endswith(".png"))
+    assert cache.missing_static() == failed
+    assert cache.static("leaflet.js") == STATIC_FILES["leaflet.js"].encode()
+    assert cache.static("../tilecache.py") is None
+    cache.close()
+
+
+def test_server_static(server):
+    status, data = get(server.url + "/static/leaflet.js")
+    assert status == 200 and b"Leaflet 1.7.1" in data
+    assert get(server.url + "/static/../tilecache.py")[0] == 404
@@ -0,0 +1,123 @@
+import calendar
+
+import pytest
+
+from tracklog import Track, parse_iso_time, parse_exif_time, parse_offset, read_gpx, read_kml, read_nmea
+
+T0 = calendar.timegm((2018, 9, 25, 10, 11, 12))
+
+GPX = """<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+ <trk><trkseg>
+  <trkpt lat="45.0" lon="7.0"><ele>100</ele><time>2018-09-25T10:11:12Z</time></trkpt>
+  <trkpt lat="45.1" lon="7.2"><time>2018-09-25T12:12:12+02:00</time></trkpt>
+  <trkpt lat="46.0" lon="8.0"></trkpt>
+ </trkseg></trk>
+</gpx>
+"""
+
+KML = """<?xml version="1.0"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+ <Document>
+  <Placemark><gx:Track>
+   <when>2018-09-25T10:11:12Z</when><when>2018-09-25T10:12:12Z</when>
+   <gx:coord>7.0 45.0 100</gx:coord><gx:coord>7.2 45.1</gx:coord>
+  </gx:Track></Placemark>
+  <Placemark><TimeStamp><when>2018-09-25T10:13:12Z</when></TimeStamp>
+   <Point><coordinates>7.3,45.2,50</coordinates></Point></Placemark>
+ </Document>
+</kml>
+"""
+
+NMEA = """$GPGGA,101112,4500.000,N,00700.000,E,1,08,0.9,100.0,M,46.9,M,,*47
+$GPRMC,101112,A,4500.000,N,00700.000,E,022.4,084.4,250918,003.1,W*6A
+$GPRMC,101212,A,4506.000,S,00712.000,W,022.4,084.4,250918,003.1,W*6A
+$GPRMC,101312,V,4506.000,N,00712.000,E,022.4,084.4,250918,003.1,W*6A
+garbage
+"""
+
+
+def track(points):
+    t = Track()
+    t.add_points(points)
+    return t
+
+
+def test_parse_iso_time():
+    assert parse_iso_time("2018-09-25T10:11:12Z") == T0
+    assert parse_iso_time("2018-09-25 10:11:12") == T0
+    assert parse_iso_time("2018-09-25T12:11:12.5+02:00") == T0 + 0.5
+    assert parse_iso_time("2018-09-25T08:11:12-0200") == T0
+    with pytest.raises(ValueError):
+        parse_iso_time("25/09/2018")
+
+
+def test_parse_exif_time():
+    assert parse_exif_time("2018:09:25 10:11:12") == T0
+    assert parse_exif_time("") is None
+    assert parse_exif_time(None) is None
+    assert parse_exif_time("0000:00:00") is None
+
+
+@pytest.mark.parametrize("text, seconds", [("1:00", 3600), ("-0:30", -1800), ("+01:02:03", 3723),
+                                           ("90", 90), ("-2.5", -2.5)])
+def test_parse_offset(text, seconds):
+    assert parse_offset(text) == seconds
+
+
+def test_parse_offset_invalid():
+    with pytest.raises(ValueError):
+        parse_offset("one hour")
+
+
+def test_read_gpx(tmp_path):
+    path = tmp_path / "a.gpx"
+    path.write_text(GPX)
+    assert list(read_gpx(str(path))) == [(T0, 45.0, 7.0, 100.0), (T0 + 60, 45.1, 7.2, 0.0)]
+
+
+def test_read_kml(tmp_path):
+    path = tmp_path / "a.kml"
+    path.write_text(KML)
+    assert list(read_kml(str(path))) == [(T0, 45.0, 7.0, 100.0), (T0 + 60, 45.1, 7.2, 0.0),
+                                         (T0 + 120, 45.2, 7.3, 50.0)]
+
+
+def test_read_nmea(tmp_path):
+    path = tmp_path / "a.nmea"
+    path.write_text(NMEA)
+    assert list(read_nmea(str(path))) == [(T0, 45.0, 7.0, 100.0), (T0 + 60, -45.1, -7.2, 0.0)]
+
+
+def test_load(tmp_path):
+    (tmp_path / "b.gpx").write_text(GPX)
+    (tmp_path / "a.NMEA").write_text(NMEA)
+    t = Track.load([str(tmp_path / "b.gpx"), str(tmp_path / "a.NMEA")])
+    assert list(t.times) == [T0, T0, T0 + 60, T0 + 60]
+    with pytest.raises(ValueError):
+        Track.load([str(tmp_path / "a.csv")])
+
+
+def test_position_at():
+    t = track([(T0 + 100, 46.0, 8.0, 200.0), (T0, 45.0, 7.0, 100.0)])
+    assert t.position_at(T0) == (45.0, 7.0, 100.0)
+    assert t.position_at(T0 + 100) == (46.0, 8.0, 200.0)
+    assert t.position_at(T0 + 25) == pytest.approx((45.25, 7.25, 125.0))
+    # tolerance before the first and after the last point
+    assert t.position_at(T0 - 60) == (45.0, 7.0, 100.0)
+    assert t.position_at(T0 - 61) is None
+    assert t.position_at(T0 + 160) == (46.0, 8.0, 200.0)
+    assert t.position_at(T0 + 161) is None
+    # points too far apart
+    assert t.position_at(T0 + 50, max_gap=99) is None
+    assert Track().position_at(T0) is None
+
+
+def test_match():
+    t = track([(T0, 45.0, 7.0, 0.0), (T0 + 100, 46.0, 8.0, 0.0)])
+    photos = [("a", "2018:09:25 10:11:12"), ("b", "2018:09:25 11:12:02"), ("c", None), ("d", "2018:09:26 10:11:12")]
+    assert t.match(photos) == {"a": (45.0, 7.0, 0.0)}
+    # the camera clock is one hour ahead
+    positions = t.match(photos, offset=3600)
+    assert set(positions) == {"b"}
+    assert positions["b"] == pytest.approx((45.5, 7.5, 0.0))
@@ -0,0 +1,56 @@
+import os
+import json
+
+import pytest
+
+from workspace import Workspace, workspace_path, list_workspaces, default_workspace_dir
+
+
+def test_default_workspace_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path))
+    assert default_workspace_dir() == os.path.join(str(tmp_path), "photogeotagger", "workspaces")
+
+
+def test_workspace_path(tmp_path):
+    assert workspace_path(" trip ", str(tmp_path)) == os.path.join(str(tmp_path), "trip.json")
+
+
+@pytest.mark.parametrize("name", ["", "  ", ".hidden", "a/b", "a\\b", "../up"])
+def test_invalid_name(name):
+    with pytest.raises(ValueError):
+        workspace_path(name)
+
+
+def test_save_load(tmp_path):
+    directory = str(tmp_path / "workspaces")
+    path = workspace_path("trip", directory)
+    workspace = Workspace("trip", ["/photos/a", "/photos/b.jpg"], recursive=True, view=(45.0, 7.0, 12),
+                          current="/photos/a/1.jpg", pending={"/photos/a/1.jpg": (45.1, 7.1, 10.0)})
+    workspace.save(path)
+    assert not os.path.exists(path + ".tmp")
+    loaded = Workspace.load(path)
+    assert vars(loaded) == vars(workspace)
+    assert list_workspaces(directory) == ["trip"]
+
+
+def test_load_defaults(tmp_path):
+    path = tmp_path / "old.json"
+    path.write_text("{}")
+    workspace = Workspace.load(str(path))
+    assert (workspace.name, workspace.folders, workspace.recursive, workspace.view,
+            workspace.current, workspace.pending) == ("old", [], False, None, None, {})
+
+
+@pytest.mark.parametrize("text", ["[]", '{"view": [1]}', '{"pending": [["a"]]}', "not json"])
+def test_load_invalid(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        Workspace.load(str(path))
+
+
+def test_list_workspaces(tmp_path):
+    assert list_workspaces(str(tmp_path / "missing")) == []
+    for name in ("b.json", "a.json", ".a.json", "c.json.tmp", "notes.txt"):
+        (tmp_path / name).write_text(json.dumps({}))
+    assert list_workspaces(str(tmp_path)) == ["a", "b"]
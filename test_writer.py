@@ -0,0 +1,167 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyexiv2")
+
+import pyexiv2
+
+import writer
+from writer import BatchWriter, write_position, rewrite_position, format_bytes, REWRITTEN
+from exifgps import scan_file
+from exifpatch import INDEXES, PATCHED, UNCHANGED
+from gazetteer import Place
+from test_exifpatch import tagged
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    INDEXES.clear()
+    yield
+    INDEXES.clear()
+
+
+def position(path):
+    return tuple(round(v, 5) for v in scan_file(path)['gps'])
+
+
+def test_rewrite_position(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    rewrite_position(path, (-33.5, 151.25, 12.0))
+    assert position(path) == (-33.5, 151.25, 12.0)
+    # the copy was renamed over the picture
+    assert os.listdir(str(tmp_path)) == ["a.jpg"]
+
+
+def test_rewrite_failure_keeps_the_original(tmp_path, monkeypatch):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    with open(path, "rb") as f:
+        before = f.read()
+
+    def fail(metadata, gps, dms=None):
+        raise ValueError("disk full")
+
+    monkeypatch.setattr(writer, "set_gps", fail)
+    with pytest.raises(ValueError):
+        rewrite_position(path, (1.0, 2.0, 0.0))
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert os.listdir(str(tmp_path)) == ["a.jpg"]
+
+
+def test_rewrite_position_removes_tags(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    rewrite_position(path, (0, 0, 0))
+    assert position(path) == (0, 0, 0)
+
+
+def test_write_position_in_place(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    size = os.path.getsize(path)
+    result, read, written = write_position(path, (45.2, 7.7, 310.0))
+    assert result == PATCHED
+    assert 0 < read < size and 0 < written < 100
+    assert position(path) == (45.2, 7.7, 310.0)
+    assert write_position(path, (45.2, 7.7, 310.0))[0::2] == (UNCHANGED, 0)
+
+
+def test_write_position_not_in_place(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    size = os.path.getsize(path)
+    result, read, written = write_position(path, (45.2, 7.7, 310.0), in_place=False)
+    assert result == REWRITTEN
+    assert read == 2 * size
+    assert written == size + os.path.getsize(path)
+    assert position(path) == (45.2, 7.7, 310.0)
+
+
+def test_write_position_with_place_rewrites(tmp_path):
+    path = tagged(tmp_path, (45.1, 7.6, 300.0))
+    place = Place("Torino", "Piemonte", "Italy", "IT", 1200.0)
+    assert write_position(path, (45.07, 7.68, 0.0), place=place)[0] == REWRITTEN
+    metadata = pyexiv2.ImageMetadata(path)
+    metadata.read()
+    assert metadata['Xmp.photoshop.City'].raw_value == "Torino"
+    assert metadata['Xmp.iptc.CountryCode'].raw_value == "IT"
+
+
+def jobs(tmp_path, n):
+    return [(tagged(tmp_path, (45.1, 7.6, 300.0), name="{:02d}.jpg".format(k)), (45.0 + k / 100, 7.5, 0.0))
+            for k in range(n)]
+
+
+def test_batch_report(tmp_path):
+    batch = jobs(tmp_path, 6)
+    missing = str(tmp_path / "missing.jpg")
+    progress = []
+    w = BatchWriter(workers=3, in_place=False)
+    report = w.write(batch + [(missing, (1.0, 2.0, 0.0))], lambda done, total: progress.append((done, total)))
+
+    assert sorted(path for path, error in report if error is None) == [path for path, _ in batch]
+    errors = [(path, error) for path, error in report if error is not None]
+    assert len(errors) == 1 and errors[0][0] == missing
+    assert progress[-1] == (7, 7)
+    assert [done for done, _ in progress] == list(range(1, 8))
+    for path, gps in batch:
+        assert position(path) == tuple(round(v, 5) for v in gps)
+        assert w.io[path][0] == REWRITTEN
+    assert sorted(os.listdir(str(tmp_path))) == sorted(os.path.basename(path) for path, _ in batch)
+
+
+def test_batch_summary(tmp_path):
+    batch = jobs(tmp_path, 3)
+    w = BatchWriter(workers=2)
+    # the first job already holds its position, the altitude of the others is removed
+    batch[0] = (batch[0][0], (45.1, 7.6, 300.0))
+    report = w.write(batch)
+    assert all(error is None for _, error in report)
+    assert sorted(r[0] for r in w.io.values()) == [REWRITTEN, REWRITTEN, UNCHANGED]
+    assert w.summary().startswith("0 patched in place, 1 unchanged, 2 rewritten, ")
+
+    # the counts are of the last write
+    w.write([(batch[0][0], (10.0, 20.0, 30.0))])
+    assert w.summary().startswith("1 patched in place, 0 unchanged, 0 rewritten, ")
+
+
+def test_batch_cancel(tmp_path):
+    batch = jobs(tmp_path, 10)
+    w = BatchWriter(workers=1, in_place=False)
+    report = w.write(batch, lambda done, total: w.cancel())
+    assert w.cancelled
+    assert len(report) < len(batch)
+    assert len(w.io) == len(report)
+    # a new write clears the cancel
+    assert len(w.write(batch[:2])) == 2
+
+
+class Gazetteer:
+
+    def __init__(self):
+        self.calls = []
+
+    def lookup_batch(self, positions):
+        self.calls.append(list(positions))
+        return [Place("City {}".format(k), "", "", "", 10.0) for k in range(len(positions))]
+
+
+def test_batch_with_gazetteer(tmp_path):
+    batch = jobs(tmp_path, 3)
+    gazetteer = Gazetteer()
+    w = BatchWriter(workers=2, gazetteer=gazetteer)
+    w.write(batch)
+    # one lookup of all the positions
+    assert gazetteer.calls == [[gps for _, gps in batch]]
+    assert w.places[batch[2][0]].city == "City 2"
+    assert {r[0] for r in w.io.values()} == {REWRITTEN}
+    metadata = pyexiv2.ImageMetadata(batch[1][0])
+    metadata.read()
+    assert metadata['Xmp.photoshop.City'].raw_value == "City 1"
+    assert 'Xmp.photoshop.State' not in metadata.xmp_keys
+
+
+def test_format_bytes():
+    assert format_bytes(0) == "0 B"
+    assert format_bytes(1023) == "1023 B"
+    assert format_bytes(1536) == "1.5 KB"
+    assert format_bytes(5 * 1024 ** 2) == "5.0 MB"
+    assert format_bytes(3 * 1024 ** 3) == "3.0 GB"
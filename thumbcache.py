@@ -0,0 +1,241 @@
+"""
+Persistent cache of thumbnails and GPS positions for PhotoGeoTagger.
+
+The entries are stored in a SQLite database and keyed by the path of the
+picture; an entry is valid only if the modification time and the size of
+the file did not change. The total size of the thumbnails is capped and
+the least recently used entries are evicted first.
+
+The perceptual hash (dHash, see duplicates) of the picture is stored with
+its entry once computed.
+"""
+
+import os
+import sqlite3
+import threading
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# version of the database layout, the cache is emptied when it changes
+SCHEMA_VERSION = 3
+
+# number of operations between two commits
+COMMIT_EVERY = 200
+
+
+def default_cache_path():
+    """
+    return the path of the cache database (XDG cache directory)
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "photogeotagger", "cache.sqlite")
+
+
+class MetadataCache:
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS entries")
+            self._db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                            path TEXT PRIMARY KEY,
+                            mtime INTEGER, size INTEGER,
+                            lat REAL, lon REAL, alt REAL,
+                            datetime TEXT,
+                            thumbnail BLOB, nbytes INTEGER,
+                            used INTEGER,
+                            dhash INTEGER)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries(used)")
+        self._db.commit()
+
+        self._total, used = self._db.execute("SELECT COALESCE(SUM(nbytes), 0), COALESCE(MAX(used), 0) FROM entries").fetchone()
+        self._clock = used
+
+    @staticmethod
+    def _stat(path, st):
+        if st is None:
+            st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _tick(self):
+        self._clock += 1
+        return self._clock
+
+    def _done(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def get(self, path, st=None):
+        """
+        return (coord, thumbnail) of path or None if the entry is missing or out of date
+        thumbnail are the bytes stored by put (can be None)
+        """
+        try:
+            mtime, size = self._stat(path, st)
+        except OSError:
+            return None
+
+        with self._lock:
+            row = self._db.execute("SELECT mtime, size, lat, lon, alt, datetime, thumbnail FROM entries WHERE path = ?",
+                                   (path,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if (row[0], row[1]) != (mtime, size):
+                # file modified since it was cached
+                self._delete(path)
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE entries SET used = ? WHERE path = ?", (self._tick(), path))
+            self._done()
+            self.hits += 1
+
+        return {'gps': tuple(row[2:5]), 'filename': path, 'datetime': row[5]}, row[6]
+
+    def entries_under(self, directory, recursive=False):
+        """
+        yield (path, mtime_ns, size, gps, datetime) of the cached pictures of directory without opening them
+        the entries must be checked against the files (mtime and size) by the caller
+        """
+        prefix = os.path.join(directory, "")
+        # range of the paths starting with prefix on the primary key
+        end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            rows = self._db.execute("SELECT path, mtime, size, lat, lon, alt, datetime FROM entries "
+                                    "WHERE path >= ? AND path < ? ORDER BY path", (prefix, end)).fetchall()
+        for row in rows:
+            if recursive or os.path.dirname(row[0]) == prefix[:-1]:
+                yield row[0], row[1], row[2], tuple(row[3:6]), row[6]
+
+    def put(self, path, coord, thumbnail=None, st=None):
+        """
+        store the coord dictionary and the thumbnail bytes of path
+        """
+        try:
+            mtime, size = self._stat(path, st)
+        except OSError:
+            return
+        nbytes = len(thumbnail) if thumbnail else 0
+        lat, lon, alt = coord['gps']
+
+        with self._lock:
+            self._delete(path)
+            self._db.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                             (path, mtime, size, lat, lon, alt, coord.get('datetime'), thumbnail, nbytes, self._tick()))
+            self._total += nbytes
+            if self._total > self.max_bytes:
+                self._evict()
+            self._done()
+
+    def put_thumbnail(self, path, thumbnail, st=None):
+        """
+        store the thumbnail bytes of a path already in cache
+        """
+        try:
+            mtime, size = self._stat(path, st)
+        except OSError:
+            return
+        nbytes = len(thumbnail) if thumbnail else 0
+
+        with self._lock:
+            row = self._db.execute("SELECT mtime, size, nbytes FROM entries WHERE path = ?", (path,)).fetchone()
+            if row is None or (row[0], row[1]) != (mtime, size):
+                return
+            self._db.execute("UPDATE entries SET thumbnail = ?, nbytes = ?, used = ? WHERE path = ?",
+                             (thumbnail, nbytes, self._tick(), path))
+            self._total += nbytes - row[2]
+            if self._total > self.max_bytes:
+                self._evict()
+            self._done()
+
+    def get_dhash(self, path, st=None):
+        """
+        return the 64 bits perceptual hash of path or None if not computed or out of date
+        """
+        try:
+            mtime, size = self._stat(path, st)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT mtime, size, dhash FROM entries WHERE path = ?", (path,)).fetchone()
+        if row is None or (row[0], row[1]) != (mtime, size) or row[2] is None:
+            return None
+        # stored as a signed 64 bits integer
+        return row[2] % 2**64
+
+    def put_dhash(self, path, dhash, st=None):
+        """
+        store the perceptual hash of a path already in cache
+        """
+        try:
+            mtime, size = self._stat(path, st)
+        except OSError:
+            return
+        with self._lock:
+            self._db.execute("UPDATE entries SET dhash = ? WHERE path = ? AND mtime = ? AND size = ?",
+                             (dhash - 2**64 if dhash >= 2**63 else dhash, path, mtime, size))
+            self._done()
+
+    def invalidate(self, path):
+        """
+        remove path from cache
+        """
+        with self._lock:
+            self._delete(path)
+            self._done()
+
+    def _delete(self, path):
+        row = self._db.execute("SELECT nbytes FROM entries WHERE path = ?", (path,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM entries WHERE path = ?", (path,))
+            self._total -= row[0]
+
+    def _evict(self):
+        """
+        delete the least recently used entries until the cache is under 90% of its maximum size
+        """
+        target = self.max_bytes * 0.9
+        cursor = self._db.execute("SELECT path, nbytes FROM entries ORDER BY used")
+        victims = []
+        for path, nbytes in cursor:
+            if self._total <= target:
+                break
+            victims.append((path,))
+            self._total -= nbytes
+        self._db.executemany("DELETE FROM entries WHERE path = ?", victims)
+
+    def total_bytes(self):
+        return self._total
+
+    def clear(self):
+        """
+        delete all entries
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+            self._db.execute("VACUUM")
+            self._total = 0
+            self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._db.close()
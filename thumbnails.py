@@ -0,0 +1,157 @@
+"""
+Thumbnail pipeline for PhotoGeoTagger.
+
+The cheapest available strategy is used for each picture:
+
+* exif: preview embedded in the EXIF metadata
+* scaled: JPEG decoded at reduced size with QImageReader.setScaledSize
+* full: full resolution decode then scaling (last resort)
+
+Thumbnails read back from the metadata cache are counted as "cache".
+
+The strategy used is counted and timed in ThumbnailPipeline.stats and in
+metrics.METRICS.
+"""
+
+import threading
+import time
+
+from PyQt5.QtCore import Qt, QSize, QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QImageReader
+
+import pyexiv2
+
+from metrics import METRICS
+from duplicates import HASH_WIDTH, HASH_HEIGHT
+
+STRATEGIES = ("cache", "exif", "scaled", "full")
+
+CACHE_FORMAT = "JPG"
+CACHE_QUALITY = 85
+
+
+def dhash_pixels(image):
+    """
+    return the 9 x 8 gray pixels (72 bytes, row by row) of the perceptual hash of a thumbnail
+    """
+    small = image.scaled(HASH_WIDTH, HASH_HEIGHT, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    small = small.convertToFormat(QImage.Format_Grayscale8)
+    bits = small.constBits()
+    bits.setsize(small.bytesPerLine() * HASH_HEIGHT)
+    data = bytes(bits)
+    # the lines are padded to 32 bits
+    return b"".join(data[y * small.bytesPerLine():y * small.bytesPerLine() + HASH_WIDTH] for y in range(HASH_HEIGHT))
+
+
+class ThumbnailStats:
+    """
+    thread safe counters of number of thumbnails and time spent by strategy
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = {s: 0 for s in STRATEGIES}
+            self.seconds = {s: 0.0 for s in STRATEGIES}
+
+    def add(self, strategy, seconds):
+        with self._lock:
+            self.count[strategy] += 1
+            self.seconds[strategy] += seconds
+
+    def summary(self):
+        """
+        return a one line summary: strategy count (mean time)
+        """
+        with self._lock:
+            return ", ".join("{} {} ({:.1f} ms)".format(s, self.count[s], 1000 * self.seconds[s] / self.count[s])
+                             for s in STRATEGIES if self.count[s])
+
+
+class ThumbnailPipeline:
+
+    def __init__(self, width):
+        self.width = width
+        self.stats = ThumbnailStats()
+
+    def __call__(self, pic):
+        """
+        return the thumbnail of picture
+        """
+        for strategy, method in (("exif", self.from_exif), ("scaled", self.from_scaled_decode)):
+            t0 = time.perf_counter()
+            try:
+                image = method(pic)
+            except Exception:
+                image = None
+            if image is not None and not image.isNull():
+                return self._done(image, strategy, t0)
+
+        t0 = time.perf_counter()
+        return self._done(QImage(pic).scaledToWidth(self.width), "full", t0)
+
+    def encode(self, image):
+        """
+        return the bytes of thumbnail to store in the cache
+        """
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, CACHE_FORMAT, CACHE_QUALITY)
+        buffer.close()
+        return bytes(data)
+
+    def decode(self, data):
+        """
+        return the thumbnail from bytes stored in the cache or None
+        """
+        t0 = time.perf_counter()
+        image = QImage.fromData(data)
+        if image.isNull():
+            return None
+        return self._done(image, "cache", t0)
+
+    def _done(self, image, strategy, t0):
+        seconds = time.perf_counter() - t0
+        self.stats.add(strategy, seconds)
+        METRICS.add("thumbnail." + strategy, seconds)
+        return image
+
+    def from_exif(self, pic):
+        """
+        return the smallest embedded preview at least as wide as the thumbnail or None
+        """
+        metadata = pyexiv2.ImageMetadata(pic)
+        metadata.read()
+
+        candidates = []
+        for preview in metadata.previews:
+            if preview.dimensions[0] >= self.width:
+                candidates.append((preview.dimensions[0], preview))
+        if candidates:
+            data = min(candidates, key=lambda c: c[0])[1].data
+        else:
+            data = metadata.exif_thumbnail.data
+
+        if not data:
+            return None
+
+        image = QImage.fromData(data)
+        if image.isNull() or image.width() < self.width:
+            return None
+        return image.scaledToWidth(self.width)
+
+    def from_scaled_decode(self, pic):
+        """
+        decode the picture directly at the thumbnail size
+        """
+        reader = QImageReader(pic)
+        size = reader.size()
+        if not size.isValid() or not size.width():
+            return None
+        reader.setScaledSize(QSize(self.width, max(1, round(size.height() * self.width / size.width()))))
+        image = reader.read()
+        return None if image.isNull() else image
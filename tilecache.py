@@ -0,0 +1,406 @@
+"""
+Offline tile cache and local tile server for the PhotoGeoTagger map.
+
+Leaflet loads the tiles and its own files from a HTTP server bound to
+127.0.0.1. The tiles are stored in one MBTiles database per tile server
+(size bounded, least recently used tiles are evicted first) and fetched
+from the remote server only when missing.
+
+The javascript and css files of the map page (Leaflet and its
+markercluster plugin, pinned versions) are committed in the static
+directory and served from it. refresh_static downloads them again in the
+cache directory, used only for the files missing from the static directory:
+nothing is downloaded implicitly, the map page reports the missing files.
+
+This module does not depend on Qt.
+"""
+
+import os
+import re
+import math
+import sqlite3
+import threading
+import urllib.request
+import concurrent.futures
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+THUNDERFOREST_API_KEY = os.environ.get("TF_API_KEY", "")
+MAPBOX_TOKEN = os.environ.get("MAPBOX_TOKEN", "")
+
+tiles_server = {"Outdoors": f"https://tile.thunderforest.com/outdoors/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}",
+                "OpenCycleMap": f"https://tile.thunderforest.com/cycle/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}",
+                "Landscape": f"https://tile.thunderforest.com/landscape/{{z}}/{{x}}/{{y}}.png?apikey={THUNDERFOREST_API_KEY}",
+                "OSM": "https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png",
+                "mapbox": f"https://api.tiles.mapbox.com/v4/{{id}}/{{z}}/{{x}}/{{y}}.png?access_token={MAPBOX_TOKEN}",
+}
+
+MAPBOX_ID = "mapbox.streets"
+
+# files needed by the map page: local name -> remote url
+STATIC_FILES = {"leaflet.js": "https://unpkg.com/leaflet@1.7.1/dist/leaflet.js",
+                "leaflet.css": "https://unpkg.com/leaflet@1.7.1/dist/leaflet.css",
+                "images/layers.png": "https://unpkg.com/leaflet@1.7.1/dist/images/layers.png",
+                "images/layers-2x.png": "https://unpkg.com/leaflet@1.7.1/dist/images/layers-2x.png",
+                "images/marker-icon.png": "https://unpkg.com/leaflet@1.7.1/dist/images/marker-icon.png",
+                "images/marker-icon-2x.png": "https://unpkg.com/leaflet@1.7.1/dist/images/marker-icon-2x.png",
+                "images/marker-shadow.png": "https://unpkg.com/leaflet@1.7.1/dist/images/marker-shadow.png",
+                "leaflet.markercluster.js": "https://unpkg.com/leaflet.markercluster@1.4.1/dist/leaflet.markercluster.js",
+                "MarkerCluster.css": "https://unpkg.com/leaflet.markercluster@1.4.1/dist/MarkerCluster.css",
+                "MarkerCluster.Default.css": "https://unpkg.com/leaflet.markercluster@1.4.1/dist/MarkerCluster.Default.css",
+}
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+CONTENT_TYPES = {".js": "application/javascript", ".css": "text/css", ".png": "image/png"}
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# maximum number of tiles of a prefetch
+MAX_PREFETCH_TILES = 20000
+
+# maximum zoom level of the tile servers
+MAX_ZOOM = 19
+
+USER_AGENT = "PhotoGeoTagger tile cache"
+
+TIMEOUT = 10
+
+
+def default_cache_dir():
+    """
+    return the directory of the tile cache (XDG cache directory)
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "photogeotagger", "tiles")
+
+
+def download(url):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        return response.read()
+
+
+def tile_url(layer, z, x, y):
+    """
+    return the remote url of a tile
+    """
+    return tiles_server[layer].format(z=z, x=x, y=y, s="abc"[(x + y) % 3], id=MAPBOX_ID)
+
+
+def valid_tile(z, x, y):
+    """
+    return True if z/x/y is a tile of the tile servers
+    """
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_ranges(south, west, north, east, zoom):
+    """
+    return the list of (x range, y range) of the tiles covering the bounding box at zoom
+    a bounding box crossing the antimeridian (west > east) is split in two
+    """
+    if west > east:
+        return tile_ranges(south, west, north, 180.0, zoom) + tile_ranges(south, -180.0, north, east, zoom)
+
+    def tile(lat, lon):
+        lat = max(min(lat, 85.0511), -85.0511)
+        n = 2 ** zoom
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x0, y0 = tile(north, west)
+    x1, y1 = tile(south, east)
+    return [(range(x0, x1 + 1), range(y0, y1 + 1))]
+
+
+def tiles_in_bbox(south, west, north, east, zoom):
+    """
+    yield the (x, y) tiles covering the bounding box at zoom
+    """
+    for xs, ys in tile_ranges(south, west, north, east, zoom):
+        for x in xs:
+            for y in ys:
+                yield x, y
+
+
+def count_tiles(bbox, zooms):
+    """
+    return the number of tiles covering the bounding box (south, west, north, east) at zoom levels zooms
+    """
+    return sum(len(xs) * len(ys) for z in zooms for xs, ys in tile_ranges(*bbox, z))
+
+
+class MBTiles:
+    """
+    MBTiles database of a tile server with size bounded LRU eviction
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER,
+                            tile_row INTEGER, tile_data BLOB)""")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        # tiles downloaded by the cache (evictable)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS tile_usage (zoom_level INTEGER, tile_column INTEGER,
+                            tile_row INTEGER, nbytes INTEGER, used INTEGER,
+                            PRIMARY KEY (zoom_level, tile_column, tile_row))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tile_usage_used ON tile_usage (used)")
+        if not self._db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]:
+            self._db.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                 [("name", os.path.splitext(os.path.basename(path))[0]), ("format", "png")])
+        self._db.commit()
+        self._total, self._clock = self._db.execute(
+            "SELECT COALESCE(SUM(nbytes), 0), COALESCE(MAX(used), 0) FROM tile_usage").fetchone()
+
+    @staticmethod
+    def _key(z, x, y):
+        # MBTiles rows use the TMS scheme
+        return z, x, 2 ** z - 1 - y
+
+    def get(self, z, x, y):
+        """
+        return the tile data or None
+        """
+        key = self._key(z, x, y)
+        with self._lock:
+            row = self._db.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                                   key).fetchone()
+            if row is None:
+                return None
+            self._clock += 1
+            self._db.execute("UPDATE tile_usage SET used = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                             (self._clock,) + key)
+        return row[0]
+
+    def __contains__(self, zxy):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                                    self._key(*zxy)).fetchone() is not None
+
+    def put(self, z, x, y, data):
+        key = self._key(z, x, y)
+        with self._lock:
+            old = self._db.execute("SELECT nbytes FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                                   key).fetchone()
+            self._clock += 1
+            self._db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", key + (data,))
+            self._db.execute("INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)", key + (len(data), self._clock))
+            self._total += len(data) - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """
+        delete the least recently used downloaded tiles until the cache is under 90% of its maximum size
+        """
+        target = self.max_bytes * 0.9
+        victims = []
+        for z, x, y, nbytes in self._db.execute(
+                "SELECT zoom_level, tile_column, tile_row, nbytes FROM tile_usage ORDER BY used").fetchall():
+            if self._total <= target:
+                break
+            victims.append((z, x, y))
+            self._total -= nbytes
+        self._db.executemany("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims)
+        self._db.executemany("DELETE FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", victims)
+
+    def total_bytes(self):
+        return self._total
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+class TileCache:
+    """
+    tiles of all tile servers, fetched from the network when missing
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._layers = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def layer(self, name):
+        if name not in tiles_server:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._layers:
+                self._layers[name] = MBTiles(os.path.join(self.cache_dir, name + ".mbtiles"), self.max_bytes)
+            return self._layers[name]
+
+    def tile(self, name, z, x, y):
+        """
+        return the tile data from the cache or from the tile server, None if not available
+        """
+        if not valid_tile(z, x, y):
+            return None
+        mbtiles = self.layer(name)
+        data = mbtiles.get(z, x, y)
+        if data is not None or self.offline:
+            return data
+        try:
+            data = download(tile_url(name, z, x, y))
+        except Exception as e:
+            print("tile {}/{}/{}/{} not available: {}".format(name, z, x, y, e))
+            return None
+        mbtiles.put(z, x, y, data)
+        return data
+
+    def _static_path(self, name):
+        """
+        return the path of a static file of the map page or None if it is not available
+        """
+        for directory in (STATIC_DIR, os.path.join(self.cache_dir, "static")):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def static(self, name):
+        """
+        return the content of a static file of the map page or None if it is not available
+        """
+        path = self._static_path(name) if name in STATIC_FILES else None
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def missing_static(self):
+        """
+        return the sorted names of the static files of the map page not available
+        """
+        return sorted(name for name in STATIC_FILES if self._static_path(name) is None)
+
+    def refresh_static(self):
+        """
+        download the static files of the map page in the cache directory
+        return the names of the files that could not be downloaded
+        """
+        failed = []
+        for name, url in sorted(STATIC_FILES.items()):
+            try:
+                data = download(url)
+            except Exception as e:
+                print("{} not available: {}".format(name, e))
+                failed.append(name)
+                continue
+            path = os.path.join(self.cache_dir, "static", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        return failed
+
+    def prefetch(self, name, bbox, zooms, workers=2, progress=None, cancelled=None):
+        """
+        download the missing tiles of the bounding box (south, west, north, east) at zoom levels zooms
+        progress: function called with (number of tiles done, total)
+        cancelled: function returning True to stop
+        return the number of tiles downloaded
+        """
+        # counted before any tile is listed: a large box at high zoom has millions of tiles
+        total = count_tiles(bbox, zooms)
+        if total > MAX_PREFETCH_TILES:
+            raise ValueError("{} tiles to prefetch (maximum {})".format(total, MAX_PREFETCH_TILES))
+        mbtiles = self.layer(name)
+        tiles = ((z, x, y) for z in zooms for x, y in tiles_in_bbox(*bbox, z))
+
+        def fetch(zxy):
+            if (cancelled and cancelled()) or zxy in mbtiles:
+                return False
+            return self.tile(name, *zxy) is not None
+
+        downloaded = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for i, ok in enumerate(pool.map(fetch, tiles)):
+                downloaded += ok
+                if progress:
+                    progress(i + 1, total)
+        return downloaded
+
+    def close(self):
+        with self._lock:
+            for mbtiles in self._layers.values():
+                mbtiles.close()
+            self._layers = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    TILE = re.compile(r"^/tiles/([^/]+)/(\d+)/(\d+)/(\d+)\.png$")
+
+    def do_GET(self):
+        cache = self.server.cache
+        path = self.path.split("?")[0]
+        data, content_type = None, "image/png"
+
+        match = self.TILE.match(path)
+        if match:
+            name, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+            if name in tiles_server and valid_tile(z, x, y):
+                data = cache.tile(name, z, x, y)
+        elif path.startswith("/static/"):
+            name = path[len("/static/"):]
+            data = cache.static(name)
+            content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+
+        if data is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TileServer:
+    """
+    local HTTP server of the tile cache running in a background thread
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._httpd = _Server(("127.0.0.1", 0), _Handler)
+        self._httpd.cache = cache
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self._httpd.server_address[1])
+
+    def tile_url(self, name):
+        """
+        return the Leaflet url template of a tile server through the cache
+        """
+        return self.url + "/tiles/" + name + "/{z}/{x}/{y}.png"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,231 @@
+"""
+GPS track logs for PhotoGeoTagger.
+
+GPX, KML and NMEA track logs are loaded in a time-sorted Track. The
+position of a picture is found from its Exif.Photo.DateTimeOriginal by
+binary search in the track and linear interpolation between the two
+surrounding points.
+
+This module does not depend on Qt.
+"""
+
+import re
+import bisect
+import calendar
+import array
+import xml.etree.ElementTree as ET
+
+# maximum time (seconds) between two track points used for interpolation
+DEFAULT_MAX_GAP = 300
+
+# maximum time (seconds) before the first or after the last point of the track
+DEFAULT_TOLERANCE = 60
+
+_ISO_TIME = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(\.\d+)?(Z|[+-]\d\d:?\d\d)?$")
+_EXIF_TIME = re.compile(r"(\d{4}):(\d\d):(\d\d) (\d\d):(\d\d):(\d\d)")
+_OFFSET = re.compile(r"([+-])?(\d+):(\d\d)(?::(\d\d))?$")
+
+
+def parse_iso_time(text):
+    """
+    return the UTC timestamp of an ISO 8601 time (2018-09-25T10:11:12Z)
+    """
+    match = _ISO_TIME.match(text.strip())
+    if not match:
+        raise ValueError("invalid time: {}".format(text))
+    y, mo, d, h, mi, s, frac, tz = match.groups()
+    t = calendar.timegm((int(y), int(mo), int(d), int(h), int(mi), int(s)))
+    if frac:
+        t += float(frac)
+    if tz and tz != "Z":
+        sign = -1 if tz[0] == "-" else 1
+        tz = tz[1:].replace(":", "")
+        t -= sign * (int(tz[:2]) * 3600 + int(tz[2:]) * 60)
+    return t
+
+
+def parse_exif_time(text):
+    """
+    return the timestamp of an EXIF date time (2018:09:25 10:11:12) read as UTC
+    or None if the date time is not valid
+    """
+    match = _EXIF_TIME.match(text.strip()) if text else None
+    if not match:
+        return None
+    return calendar.timegm(tuple(int(x) for x in match.groups()))
+
+
+def parse_offset(text):
+    """
+    return the number of seconds of a clock offset given as [+-]HH:MM[:SS] or as seconds
+    """
+    text = text.strip()
+    match = _OFFSET.match(text)
+    if match:
+        sign, h, m, s = match.groups()
+        seconds = int(h) * 3600 + int(m) * 60 + int(s or 0)
+        return -seconds if sign == "-" else seconds
+    return float(text)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_gpx(path):
+    """
+    yield (time, lat, lon, alt) of the track points of a GPX file
+    """
+    for _, elem in ET.iterparse(path):
+        if _local(elem.tag) in ("trkpt", "rtept", "wpt"):
+            time, alt = None, 0.0
+            for child in elem:
+                name = _local(child.tag)
+                if name == "time":
+                    time = child.text
+                elif name == "ele" and child.text:
+                    alt = float(child.text)
+            if time:
+                yield parse_iso_time(time), float(elem.get("lat")), float(elem.get("lon")), alt
+            elem.clear()
+
+
+def read_kml(path):
+    """
+    yield (time, lat, lon, alt) of the gx:Track and time stamped placemarks of a KML file
+    """
+    for _, elem in ET.iterparse(path):
+        name = _local(elem.tag)
+        if name == "Track":
+            whens = [child.text for child in elem if _local(child.tag) == "when"]
+            coords = [child.text for child in elem if _local(child.tag) == "coord"]
+            for when, coord in zip(whens, coords):
+                values = coord.split()
+                yield (parse_iso_time(when), float(values[1]), float(values[0]),
+                       float(values[2]) if len(values) > 2 else 0.0)
+            elem.clear()
+        elif name == "Placemark":
+            when, coordinates = None, None
+            for child in elem.iter():
+                if _local(child.tag) == "when":
+                    when = child.text
+                elif _local(child.tag) == "coordinates":
+                    coordinates = child.text
+            if when and coordinates:
+                values = coordinates.strip().split(",")
+                yield (parse_iso_time(when), float(values[1]), float(values[0]),
+                       float(values[2]) if len(values) > 2 else 0.0)
+            elem.clear()
+
+
+def _nmea_degrees(value, hemisphere):
+    """
+    convert a NMEA (d)ddmm.mmmm value in decimal degrees
+    """
+    dot = value.index(".") if "." in value else len(value)
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def read_nmea(path):
+    """
+    yield (time, lat, lon, alt) of the RMC sentences of a NMEA log
+    the altitude is taken from the GGA sentence of the same fix
+    """
+    gga_time, gga_alt = None, 0.0
+    with open(path, encoding="ascii", errors="replace") as f:
+        for line in f:
+            fields = line.strip().split("*")[0].split(",")
+            if len(fields) < 10 or len(fields[0]) < 6:
+                continue
+            sentence = fields[0][-3:]
+            try:
+                if sentence == "GGA" and fields[9]:
+                    gga_time, gga_alt = fields[1], float(fields[9])
+                elif sentence == "RMC" and fields[2] == "A":
+                    hhmmss, date = fields[1], fields[9]
+                    t = calendar.timegm((2000 + int(date[4:6]), int(date[2:4]), int(date[0:2]),
+                                         int(hhmmss[0:2]), int(hhmmss[2:4]), 0)) + float(hhmmss[4:])
+                    yield (t, _nmea_degrees(fields[3], fields[4]), _nmea_degrees(fields[5], fields[6]),
+                           gga_alt if gga_time == hhmmss else 0.0)
+            except (ValueError, IndexError):
+                continue
+
+
+READERS = {".gpx": read_gpx, ".kml": read_kml, ".nmea": read_nmea, ".txt": read_nmea, ".log": read_nmea}
+
+
+class Track:
+
+    def __init__(self):
+        self.times = array.array("d")
+        self.lats = array.array("d")
+        self.lons = array.array("d")
+        self.alts = array.array("d")
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def load(cls, paths):
+        """
+        return the Track of all points of the track log files
+        """
+        points = []
+        for path in paths:
+            ext = "." + path.rsplit(".", 1)[-1].lower() if "." in path else ""
+            if ext not in READERS:
+                raise ValueError("unknown track log format: {}".format(path))
+            points.extend(READERS[ext](path))
+        track = cls()
+        track.add_points(points)
+        return track
+
+    def add_points(self, points):
+        """
+        add (time, lat, lon, alt) points and keep the track sorted by time
+        """
+        points = sorted(list(zip(self.times, self.lats, self.lons, self.alts)) + list(points))
+        self.times = array.array("d", (p[0] for p in points))
+        self.lats = array.array("d", (p[1] for p in points))
+        self.lons = array.array("d", (p[2] for p in points))
+        self.alts = array.array("d", (p[3] for p in points))
+
+    def position_at(self, t, max_gap=DEFAULT_MAX_GAP, tolerance=DEFAULT_TOLERANCE):
+        """
+        return the interpolated (lat, lon, alt) at timestamp t or None
+        """
+        times = self.times
+        if not times:
+            return None
+        i = bisect.bisect_left(times, t)
+
+        if i == 0:
+            return (self.lats[0], self.lons[0], self.alts[0]) if times[0] - t <= tolerance else None
+        if i == len(times):
+            return (self.lats[-1], self.lons[-1], self.alts[-1]) if t - times[-1] <= tolerance else None
+
+        t0, t1 = times[i - 1], times[i]
+        if t1 == t:
+            return self.lats[i], self.lons[i], self.alts[i]
+        if t1 - t0 > max_gap:
+            return None
+        f = (t - t0) / (t1 - t0)
+        return (self.lats[i - 1] + f * (self.lats[i] - self.lats[i - 1]),
+                self.lons[i - 1] + f * (self.lons[i] - self.lons[i - 1]),
+                self.alts[i - 1] + f * (self.alts[i] - self.alts[i - 1]))
+
+    def match(self, photos, offset=0, max_gap=DEFAULT_MAX_GAP, tolerance=DEFAULT_TOLERANCE):
+        """
+        return {key: (lat, lon, alt)} for photos, an iterable of (key, EXIF date time)
+        offset: number of seconds the camera clock is ahead of UTC
+        """
+        positions = {}
+        for key, datetime in photos:
+            t = parse_exif_time(datetime)
+            if t is None:
+                continue
+            position = self.position_at(t - offset, max_gap, tolerance)
+            if position is not None:
+                positions[key] = position
+        return positions
@@ -0,0 +1,107 @@
+"""
+Project workspaces of PhotoGeoTagger.
+
+A workspace is a named set of photo folders with the positions edited and
+not yet saved in the photos, and the state of the view (map center and
+zoom, current photo), so that the work on several shoots can be switched
+without saving or losing the edits.
+
+The workspaces are JSON files in the XDG state directory, written to a
+temporary file renamed over the old one.
+
+This module does not depend on Qt.
+"""
+
+import os
+import json
+
+WORKSPACE_VERSION = 1
+
+EXTENSION = ".json"
+
+
+def default_workspace_dir():
+    """
+    return the directory of the workspaces (XDG state directory)
+    """
+    state_dir = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_dir, "photogeotagger", "workspaces")
+
+
+def workspace_path(name, directory=None):
+    """
+    return the path of the file of workspace name (ValueError if name can not be a file name)
+    """
+    name = name.strip()
+    if not name or name.startswith(".") or "/" in name or "\\" in name:
+        raise ValueError("invalid workspace name: {!r}".format(name))
+    return os.path.join(directory or default_workspace_dir(), name + EXTENSION)
+
+
+def list_workspaces(directory=None):
+    """
+    return the sorted names of the saved workspaces
+    """
+    directory = directory or default_workspace_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(entry[:-len(EXTENSION)] for entry in os.listdir(directory)
+                  if entry.endswith(EXTENSION) and not entry.startswith("."))
+
+
+def _position(value):
+    return tuple(float(x) for x in value)
+
+
+class Workspace:
+
+    def __init__(self, name, folders=None, recursive=False, view=None, current=None, pending=None):
+        """
+        folders: directories (or pictures) loaded
+        view: (lat, lon, zoom) of the map or None
+        current: path of the current photo or None
+        pending: {path: (lat, lon, alt)} of the positions not saved in the photos
+        """
+        self.name = name
+        self.folders = list(folders or [])
+        self.recursive = recursive
+        self.view = view
+        self.current = current
+        self.pending = dict(pending or {})
+
+    @classmethod
+    def load(cls, path):
+        """
+        read a workspace file (OSError or ValueError if it can not be read)
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        try:
+            view = data.get("view")
+            return cls(data.get("name") or os.path.splitext(os.path.basename(path))[0],
+                       folders=[str(folder) for folder in data.get("folders", [])],
+                       recursive=bool(data.get("recursive", False)),
+                       view=(float(view[0]), float(view[1]), int(view[2])) if view else None,
+                       current=data.get("current"),
+                       pending={str(p): _position(gps) for p, gps in data.get("pending", [])})
+        except (AttributeError, IndexError, TypeError) as e:
+            raise ValueError("invalid workspace {}: {}".format(path, e))
+
+    def save(self, path):
+        """
+        write the workspace file
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {"version": WORKSPACE_VERSION,
+                "name": self.name,
+                "folders": self.folders,
+                "recursive": self.recursive,
+                "view": list(self.view) if self.view else None,
+                "current": self.current,
+                "pending": [[p, list(gps)] for p, gps in sorted(self.pending.items())]}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
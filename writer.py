@@ -0,0 +1,177 @@
+"""
+Batched writer of GPS positions for PhotoGeoTagger.
+
+Each picture is written on a pool of worker threads: the picture is copied
+to a temporary file in the same directory, the metadata are written in the
+copy and the copy is atomically renamed over the original so that a crash
+never leaves a half-written picture.
+
+When only the position changes and the picture already has GPS tags of the
+same layout, the values are patched in place instead (exifpatch.patch_gps,
+not atomic: see exifpatch, in_place=False always rewrites a copy) and
+pictures whose GPS tags already hold the position are not written. The
+bytes read and written for each picture are kept in BatchWriter.io.
+
+If a Gazetteer is given, the city, region and country of the positions are
+looked up in one batch and written in the same pass (the picture is opened
+once).
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import concurrent.futures
+
+import pyexiv2
+
+from exifgps import set_gps, set_location, NO_POSITION
+from exifpatch import patch_gps, INDEXES, PATCHED, UNCHANGED
+from coordinates import batch_decimal_to_dms
+from metrics import METRICS
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+# result of write_position when the picture was copied and rewritten by pyexiv2
+REWRITTEN = "rewritten"
+
+
+def write_position(path, gps, dms=None, place=None, in_place=True):
+    """
+    write the gps position (lat, lon, alt) in the exif metadata of path
+    dms: (lat, lon) converted by batch_decimal_to_dms or None
+    place: gazetteer.Place written in the IPTC/XMP location tags or None to keep them
+    in_place: patch the GPS tags in the picture when possible instead of rewriting a copy
+    return (PATCHED, UNCHANGED or REWRITTEN, bytes read, bytes written)
+    """
+    bytesRead = 0
+    if place is None and in_place:
+        result, bytesRead, bytesWritten = patch_gps(path, gps, dms, INDEXES.get(path, os.stat(path)))
+        if result is not None:
+            return result, bytesRead, bytesWritten
+
+    size = os.path.getsize(path)
+    rewrite_position(path, gps, dms, place)
+    # the copy, then pyexiv2 reads and writes the whole copy
+    INDEXES.forget(path)
+    return REWRITTEN, bytesRead + 2 * size, size + os.path.getsize(path)
+
+
+def rewrite_position(path, gps, dms=None, place=None):
+    """
+    write the metadata of a copy of path renamed over path
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        shutil.copy2(path, tmp)
+        metadata = pyexiv2.ImageMetadata(tmp)
+        metadata.read()
+        set_gps(metadata, gps, dms)
+        if place is not None:
+            set_location(metadata, place)
+        metadata.write()
+
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class BatchWriter:
+
+    def __init__(self, workers=DEFAULT_WORKERS, gazetteer=None, in_place=True):
+        """
+        gazetteer: Gazetteer used to write the city, region and country (None to keep the location tags)
+        in_place: patch the GPS tags in the pictures when possible (not atomic) instead of rewriting copies
+        """
+        self.workers = max(1, workers or 1)
+        self.gazetteer = gazetteer
+        self.in_place = in_place
+        # {path: Place} of the last write with a gazetteer
+        self.places = {}
+        # {path: (PATCHED, UNCHANGED or REWRITTEN, bytes read, bytes written)} of the last write
+        self.io = {}
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        stop writing (the files being written are completed)
+        """
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def write(self, jobs, progress=None):
+        """
+        write the positions of jobs, a list of (path, gps)
+        progress: function called with (number of files done, total)
+        return the report: list of (path, error message or None) of the files written or failed
+        """
+        self._cancel.clear()
+        self.io = {}
+        report = []
+        total = len(jobs)
+
+        def job(path, gps, dms, place):
+            if self.cancelled:
+                return False
+            with METRICS.timer("write.file"):
+                result = write_position(path, gps, dms, place, self.in_place)
+            self.io[path] = result
+            METRICS.count("write." + result[0])
+            METRICS.count("write.bytes_read", result[1])
+            METRICS.count("write.bytes_written", result[2])
+            return True
+
+        # all coordinates are converted and looked up in one batch
+        lats = batch_decimal_to_dms([gps[0] for _, gps in jobs])
+        lons = batch_decimal_to_dms([gps[1] for _, gps in jobs])
+        if self.gazetteer is not None:
+            with METRICS.timer("write.lookup"):
+                places = self.gazetteer.lookup_batch([gps for _, gps in jobs])
+            self.places = {path: place for (path, _), place in zip(jobs, places)}
+        else:
+            places = [None] * len(jobs)
+            self.places = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(job, path, gps, (lat, lon) if tuple(gps) != NO_POSITION else None, place): path
+                       for (path, gps), lat, lon, place in zip(jobs, lats, lons, places)}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    if not future.result():
+                        continue
+                    report.append((path, None))
+                except Exception as e:
+                    report.append((path, str(e) or e.__class__.__name__))
+                    METRICS.count("write.errors")
+                if progress:
+                    progress(len(report), total)
+
+        return report
+
+    def summary(self):
+        """
+        return a one line summary of the files patched, unchanged and rewritten and of the bytes read and written
+        """
+        results = list(self.io.values())
+        counts = {mode: sum(1 for r in results if r[0] == mode) for mode in (PATCHED, UNCHANGED, REWRITTEN)}
+        return "{} patched in place, {} unchanged, {} rewritten, {} read, {} written".format(
+               counts[PATCHED], counts[UNCHANGED], counts[REWRITTEN],
+               format_bytes(sum(r[1] for r in results)), format_bytes(sum(r[2] for r in results)))
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return "{:.0f} {}".format(n, unit) if unit == "B" else "{:.1f} {}".format(n, unit)
+        n /= 1024
+    return "{:.1f} GB".format(n)